@@ -0,0 +1,60 @@
+import zipfile
+
+import pytest
+
+from isimip_client.aggregate import ResultStore
+
+pytest.importorskip('pyarrow')
+
+CLIMATE = 'gfdl-esm4_r1i1p1f1_w5e5_ssp370_tas_lat52.39lon13.06_daily_{}_{}.csv'
+IMPACT = 'lpjml_gfdl-esm4_w5e5_ssp370_2015soc_default_yield-mai-firr_lat52.39lon13.06_daily_{}_{}.csv'
+
+
+def write_archive(path, files):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for name, dates in files.items():
+            zip_file.writestr(name, 'time,value\n' + ''.join(f'{date},{index}\n' for index, date in enumerate(dates)))
+    return path
+
+
+def get_dates(year, days):
+    return [f'{year}-{1 + day // 28:02d}-{1 + day % 28:02d}' for day in range(days)]
+
+
+def test_add(benchmark, tmp_path):
+    archive = write_archive(tmp_path / 'job.zip', {
+        CLIMATE.format(year, year): get_dates(year, 300) for year in range(2015, 2065)
+    })
+
+    # every round uses a new store, since the archive is only added once
+    stores = iter(range(1000))
+
+    def setup():
+        return (ResultStore(tmp_path / f'store{next(stores)}'), ), {}
+
+    benchmark.pedantic(lambda store: store.add(archive), setup=setup, rounds=5)
+    table = ResultStore(tmp_path / 'store0').to_arrow()
+    assert len(table) == 50 * 300
+    assert str(table.schema.field('time').type).startswith('timestamp')
+
+
+def test_add_batches(tmp_path):
+    # the specifiers of the files in later batches are not dropped, and the time is stored as string,
+    # if it can not be parsed in one of the files (here a 360 day calendar in the last batch)
+    archive = write_archive(tmp_path / 'job.zip', {
+        CLIMATE.format(2015, 2015): get_dates(2015, 10),
+        IMPACT.format(2016, 2016): get_dates(2016, 10),
+        IMPACT.format(2017, 2017): ['2017-02-29', '2017-02-30']
+    })
+
+    store = ResultStore(tmp_path / 'store')
+    store.batch_rows = 10
+    assert store.add(archive) == 22
+
+    table = store.to_arrow()
+    assert str(table.schema.field('time').type) == 'string'
+    assert table.column('time').to_pylist()[-2:] == ['2017-02-29', '2017-02-30']
+    assert table.column('time').to_pylist()[0] == '2015-01-01'
+    assert table.column('model').to_pylist() == [None] * 10 + ['lpjml'] * 12
+    assert table.column('climate_variable').to_pylist() == ['tas'] * 10 + [None] * 12
+    assert table.column('variable').to_pylist() == ['tas'] * 10 + ['yield-mai-firr'] * 12
@@ -0,0 +1,120 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from isimip_client.async_client import AsyncISIMIPClient
+from isimip_client.ratelimit import RateLimiter
+
+httpx = pytest.importorskip('httpx')
+
+
+def run_async(mock_server, func, **kwargs):
+    # every test runs in its own event loop with its own client
+    async def main():
+        async with AsyncISIMIPClient(data_url=mock_server.data_url, files_api_url=mock_server.files_api_url,
+                                     backoff=0.01, **kwargs) as client:
+            return await func(client)
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize('mock_server', [{'datasets': 20}], indirect=True)
+def test_files(benchmark, mock_server):
+    files = benchmark.pedantic(run_async, args=(mock_server, lambda client: client.files(page_size=50)),
+                               rounds=3)
+    assert len(files) == 200
+    assert len({file['id'] for file in files}) == 200
+
+
+@pytest.mark.parametrize('mock_server', [{'datasets': 20}], indirect=True)
+@pytest.mark.parametrize('prefetch', [False, True])
+def test_iter_files(benchmark, mock_server, prefetch):
+    # the next pages are requested using the urls in the responses
+    async def iter_files(client):
+        return [file async for file in client.iter_files(page_size=50, prefetch=prefetch)]
+
+    files = benchmark.pedantic(run_async, args=(mock_server, iter_files), rounds=3)
+    assert len(files) == 200
+    assert len({file['id'] for file in files}) == 200
+
+
+@pytest.mark.parametrize('mock_server', [{'datasets': 20}], indirect=True)
+def test_files_rate_limit(mock_server, tmp_path):
+    # while another process holds the lock of the rate limit database, the event loop keeps running
+    limiter = RateLimiter(tmp_path / 'ratelimit.sqlite', max_in_flight=2)
+    connection = sqlite3.connect(tmp_path / 'ratelimit.sqlite', isolation_level=None)
+    connection.execute('BEGIN IMMEDIATE')
+
+    async def files(client):
+        asyncio.get_running_loop().call_later(0.5, connection.execute, 'COMMIT')
+        task = asyncio.ensure_future(client.files(page_size=50))
+        ticks = 0
+        while not task.done():
+            await asyncio.sleep(0.01)
+            ticks += 1
+        return ticks, task.result()
+
+    ticks, files = run_async(mock_server, files, rate_limiter=limiter)
+    assert ticks > 10
+    assert len(files) == 200
+    assert limiter.stats()[mock_server.url.split('//')[1]]['in_flight'] == 0
+    limiter.close()
+    connection.close()
+
+
+@pytest.mark.parametrize('mock_server', [{'datasets': 1, 'failure_rate': 1}], indirect=True)
+def test_iter_files_failed(mock_server):
+    async def iter_files(client):
+        return [file async for file in client.iter_files(page_size=5)]
+
+    with pytest.raises(RuntimeError):
+        run_async(mock_server, iter_files, retries=0)
+
+
+@pytest.mark.parametrize('mock_server', [{'datasets': 5, 'job_duration': 0.1}], indirect=True)
+def test_chunked_job(benchmark, mock_server):
+    paths = [file['path'] for file in mock_server.files[:10]]
+    jobs = benchmark.pedantic(run_async, args=(mock_server, lambda client: client.mask_country(
+        paths, 'fra', poll=0.05, chunk_size=3
+    )), rounds=3)
+    assert len(jobs) == 4
+    assert all(job['status'] == 'finished' for job in jobs)
+
+
+@pytest.mark.parametrize('mock_server', [{'datasets': 1, 'file_size': 1024 * 1024},
+                                         {'datasets': 1, 'file_size': 1024 * 1024, 'ranges': False}], indirect=True)
+def test_download_resume(benchmark, mock_server, tmp_path):
+    # a partial file is completed, or replaced if the server ignores the range request
+    url = '{}/files/{}'.format(mock_server.url, mock_server.files[0]['path'])
+    file_path = tmp_path / url.split('/')[-1]
+
+    def setup():
+        file_path.write_bytes(mock_server.content[:1000])
+
+    benchmark.pedantic(lambda: run_async(mock_server, lambda client: client.download(url, path=tmp_path)),
+                       setup=setup, rounds=3)
+    assert file_path.read_bytes() == mock_server.content
+
+
+@pytest.mark.parametrize('mock_server', [{'datasets': 1, 'file_size': 1024 * 1024}], indirect=True)
+def test_download_validate(benchmark, mock_server, tmp_path):
+    url = '{}/files/{}'.format(mock_server.url, mock_server.files[0]['path'])
+    file_path = tmp_path / url.split('/')[-1]
+
+    benchmark.pedantic(lambda: run_async(mock_server, lambda client: client.download(url, path=tmp_path,
+                                                                                     validate=True)),
+                       setup=lambda: file_path.unlink(missing_ok=True), rounds=3)
+    assert file_path.read_bytes() == mock_server.content
+
+
+@pytest.mark.parametrize('mock_server', [{'datasets': 2, 'job_duration': 0.1}], indirect=True)
+@pytest.mark.parametrize('stream', [False, True])
+def test_download_extract(benchmark, mock_server, tmp_path, stream):
+    async def download(client):
+        job = await client.select_point([file['path'] for file in mock_server.files], 0, 0, poll=0.05)
+        await client.download(job['file_url'], path=tmp_path, extract=True, stream=stream, keep_archive=False)
+
+    benchmark.pedantic(run_async, args=(mock_server, download), rounds=3)
+    assert len(list(tmp_path.glob('*.csv'))) == 20
+    assert not list(tmp_path.glob('*.zip'))
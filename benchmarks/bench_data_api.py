@@ -0,0 +1,34 @@
+import pytest
+
+SERVERS = [
+    {'datasets': 1000},
+    {'datasets': 1000, 'latency': 0.02},
+    {'datasets': 1000, 'latency': 0.02, 'failure_rate': 0.05}
+]
+
+
+@pytest.mark.parametrize('mock_server', SERVERS, indirect=True)
+@pytest.mark.parametrize('max_workers', [1, 8])
+def test_files(run, client, max_workers):
+    client.max_workers = max_workers
+    files = run(client.files, page_size=500, max_results=None)
+    assert len(files) == 10000
+
+
+@pytest.mark.parametrize('mock_server', SERVERS, indirect=True)
+@pytest.mark.parametrize('prefetch', [False, True])
+def test_iter_files(run, client, prefetch):
+    files = run(lambda: list(client.iter_files(page_size=500, prefetch=prefetch)))
+    assert len(files) == 10000
+
+
+@pytest.mark.parametrize('mock_server', SERVERS, indirect=True)
+def test_time_to_first_result(run, client):
+    file = run(lambda: next(client.iter_files(page_size=500)), rounds=10)
+    assert file['path']
+
+
+@pytest.mark.parametrize('mock_server', SERVERS[:2], indirect=True)
+def test_file(run, client, mock_server):
+    file = run(client.file, mock_server.files[0]['id'], rounds=20)
+    assert file['id'] == mock_server.files[0]['id']
@@ -0,0 +1,121 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from isimip_client.checksums import ChecksumIndex
+from isimip_client.client import ISIMIPClient
+from isimip_client.download import DownloadTask
+
+SERVERS = [
+    {'datasets': 1, 'files_per_dataset': 8, 'file_size': 64 * 1024 * 1024},
+    {'datasets': 1, 'files_per_dataset': 8, 'file_size': 64 * 1024 * 1024, 'bandwidth': 50 * 1024 * 1024}
+]
+
+SMALL_SERVERS = [{'datasets': 1, 'files_per_dataset': 2, 'file_size': 1024 * 1024}]
+
+
+@pytest.fixture
+def urls(mock_server):
+    return [f'{mock_server.url}/files/{file["path"]}' for file in mock_server.files]
+
+
+@pytest.fixture
+def clean(tmp_path):
+    def clean():
+        shutil.rmtree(tmp_path)
+        tmp_path.mkdir()
+    return clean
+
+
+@pytest.mark.parametrize('mock_server', SERVERS, indirect=True)
+def test_download(run, client, urls, tmp_path, clean):
+    run(client.download, urls[0], path=tmp_path, setup=clean)
+    assert (tmp_path / urls[0].split('/')[-1]).stat().st_size == 64 * 1024 * 1024
+
+
+@pytest.mark.parametrize('mock_server', SERVERS[:1], indirect=True)
+def test_download_validate(run, client, urls, tmp_path, clean):
+    # the checksum is fetched from the .json file next to the file
+    run(client.download, urls[0], path=tmp_path, validate=True, setup=clean)
+    assert (tmp_path / urls[0].split('/')[-1]).stat().st_size == 64 * 1024 * 1024
+
+
+@pytest.mark.parametrize('mock_server', SERVERS, indirect=True)
+@pytest.mark.parametrize('segment_size', [None, 16 * 1024 * 1024])
+def test_download_many(run, client, urls, tmp_path, clean, segment_size):
+    results = run(client.download_many, urls, path=tmp_path, workers=4, segment_size=segment_size, setup=clean)
+    assert all(result['status'] == 'finished' for result in results)
+
+
+@pytest.mark.parametrize('mock_server', [{'datasets': 10}], indirect=True)
+@pytest.mark.parametrize('stream', [False, True])
+def test_download_extract(run, client, mock_server, tmp_path, clean, stream):
+    job = client.select_point([file['path'] for file in mock_server.files], 0, 0, poll=0.05)
+    run(client.download, job['file_url'], path=tmp_path, extract=True, stream=stream, setup=clean)
+    assert len(list(tmp_path.glob('*.csv'))) == 100
+
+
+@pytest.mark.parametrize('mock_server', SMALL_SERVERS, indirect=True)
+def test_download_many_resume(client, mock_server, urls, tmp_path):
+    # the download was interrupted in the second of four segments, only the missing parts are fetched
+    segment_size = 256 * 1024
+    task = DownloadTask(urls[0], tmp_path / urls[0].split('/')[-1])
+    task.size, task.ranges = len(mock_server.content), True
+    task.allocate(segment_size)
+    with open(task.part_path, 'r+b') as fp:
+        fp.write(mock_server.content[:segment_size + 1000])
+    task.segments[0]['done'], task.segments[1]['done'] = segment_size, 1000
+    task.save_manifest()
+
+    stats = dict(mock_server.stats)
+    results = client.download_many(urls[:1], path=tmp_path, segment_size=segment_size)
+    assert [result['status'] for result in results] == ['finished']
+    assert task.file_path.read_bytes() == mock_server.content
+    assert not task.part_path.exists()
+    assert not task.manifest_path.exists()
+    assert mock_server.stats['bytes'] - stats.get('bytes', 0) == len(mock_server.content) - segment_size - 1000
+
+
+@pytest.mark.parametrize('mock_server', SMALL_SERVERS, indirect=True)
+def test_download_many_stale_manifest(client, mock_server, urls, tmp_path):
+    # a manifest for a file with another size is not used
+    task = DownloadTask(urls[0], tmp_path / urls[0].split('/')[-1])
+    task.size, task.ranges = 1000, True
+    task.allocate(100)
+    for segment in task.segments:
+        segment['done'] = 100
+    task.save_manifest()
+
+    results = client.download_many(urls[:1], path=tmp_path, segment_size=256 * 1024)
+    assert [result['status'] for result in results] == ['finished']
+    assert task.file_path.read_bytes() == mock_server.content
+
+
+@pytest.mark.parametrize('mock_server', SMALL_SERVERS, indirect=True)
+def test_download_many_checksums(mock_server, urls, tmp_path):
+    # verified files are skipped without a request, changed files are downloaded again
+    checksums = dict.fromkeys(urls, mock_server.checksum)
+    index = ChecksumIndex(tmp_path / 'checksums.sqlite')
+    with ISIMIPClient(data_url=mock_server.data_url, files_api_url=mock_server.files_api_url, backoff=0.01,
+                      checksums=index) as client:
+        results = client.download_many(urls, path=tmp_path / 'files', checksums=checksums)
+        assert [result['status'] for result in results] == ['finished', 'finished']
+        file_paths = [Path(result['path']) for result in results]
+        assert [index.get(file_path) for file_path in file_paths] == [mock_server.checksum] * 2
+
+        stats = dict(mock_server.stats)
+        results = client.download_many(urls, path=tmp_path / 'files', checksums=checksums)
+        assert [result['status'] for result in results] == ['skipped', 'skipped']
+        assert mock_server.stats == stats
+
+        # a file of the same size, but with other content
+        file_paths[0].write_bytes(bytes(len(mock_server.content)))
+        assert index.get(file_paths[0]) is None
+        results = client.download_many(urls, path=tmp_path / 'files', checksums=checksums)
+        assert [result['status'] for result in results] == ['finished', 'skipped']
+        assert file_paths[0].read_bytes() == mock_server.content
+
+        results = client.download_many(urls[:1], path=tmp_path / 'other', checksums={urls[0]: 'wrong'})
+        assert [result['status'] for result in results] == ['failed']
+    index.close()
@@ -0,0 +1,81 @@
+import pytest
+
+from isimip_client.client import HTTPClient, ISIMIPClient
+
+SERVERS = [
+    {'datasets': 10, 'job_duration': 0.2},
+    {'datasets': 10, 'job_duration': 0.2, 'latency': 0.02, 'failure_rate': 0.05}
+]
+
+
+@pytest.fixture
+def client(mock_server):
+    # the Files API returns the existing job for the same payload, so submitting a job can be retried
+    with ISIMIPClient(data_url=mock_server.data_url, files_api_url=mock_server.files_api_url, backoff=0.01,
+                      retry_methods=[*HTTPClient.retry_methods, 'POST']) as client:
+        yield client
+
+
+@pytest.fixture
+def paths(mock_server):
+    return [file['path'] for file in mock_server.files]
+
+
+@pytest.mark.parametrize('mock_server', SERVERS, indirect=True)
+def test_post_job(run, client, paths):
+    # the jobs need to differ, since the server would return the finished job otherwise
+    jobs = iter(range(1000))
+    job = run(lambda: client.select_point(paths[:5], next(jobs), 0, poll=0.05))
+    assert job['status'] == 'finished'
+
+
+@pytest.mark.parametrize('mock_server', SERVERS, indirect=True)
+def test_run_jobs(run, client, paths):
+    jobs = iter(range(1000))
+
+    def run_jobs():
+        offset = next(jobs) * 100
+        specs = [
+            {'paths': paths[:5], 'operations': [{'operation': 'select_point', 'lat': offset + i, 'lon': 0}]}
+            for i in range(50)
+        ]
+        return client.run_jobs(specs, max_jobs=16, poll=0.05)
+
+    jobs = run(run_jobs, rounds=3)
+    assert all(job['status'] == 'finished' for job in jobs)
+
+
+@pytest.mark.parametrize('mock_server', SERVERS[:1], indirect=True)
+def test_upload(run, client, paths, tmp_path):
+    mask_path = tmp_path / 'mask.nc'
+    mask_path.write_bytes(b'x' * 64 * 1024 * 1024)
+
+    jobs = iter(range(1000))
+    job = run(lambda: client.mask_mask(paths[:1], mask_path, var=str(next(jobs))))
+    assert job['status'] == 'queued'
+
+
+def test_upload_stream(benchmark, tmp_path):
+    # http.client sends file-like bodies in blocks of 8 KiB
+    from isimip_client.upload import MultipartStream
+
+    mask_path = tmp_path / 'mask.nc'
+    mask_path.write_bytes(b'x' * 64 * 1024 * 1024)
+    body = MultipartStream({'data': '{}'}, {'mask.nc': mask_path})
+
+    def read():
+        body.seek(0)
+        return sum(len(block) for block in iter(lambda: body.read(8192), b''))
+
+    assert benchmark(read) == len(body)
+
+
+@pytest.mark.parametrize('mock_server', [{'datasets': 1, 'failure_rate': 1}], indirect=True)
+@pytest.mark.parametrize('retry_methods,requests', [(None, 1), (['POST'], 3)])
+def test_post_retries(mock_server, retry_methods, requests):
+    # by default, a failed POST is not sent again, since the server could have processed it
+    with ISIMIPClient(data_url=mock_server.data_url, files_api_url=mock_server.files_api_url, backoff=0.01,
+                      retries=2, retry_methods=retry_methods) as client:
+        stats = dict(mock_server.stats)
+        assert client.post_job({'paths': [], 'operations': []}) is None
+        assert mock_server.stats['requests'] - stats.get('requests', 0) == requests
@@ -0,0 +1,72 @@
+import pytest
+
+from isimip_client.client import ISIMIPClient
+from isimip_client.local import LocalBackend
+
+netCDF4 = pytest.importorskip('netCDF4')
+np = pytest.importorskip('numpy')
+
+FILES = 100
+
+
+@pytest.fixture(scope='module')
+def mirror(tmp_path_factory):
+    # 100 files with one year of daily data on a 5 degree grid
+    root = tmp_path_factory.mktemp('mirror')
+    lat, lon = np.arange(87.5, -90, -5.0), np.arange(-177.5, 180, 5.0)
+    values = 280 + 20 * np.cos(np.deg2rad(lat))[None, :, None] + np.sin(np.arange(365) / 58)[:, None, None] \
+        + np.zeros(len(lon))[None, None, :]
+    (root / 'ISIMIP3b' / 'InputData').mkdir(parents=True)
+    paths = []
+    for index in range(FILES):
+        path = f'ISIMIP3b/InputData/model_r1i1p1f1_w5e5_ssp370_tas{index}_global_daily_2015_2015.nc'
+        with netCDF4.Dataset(root / path, 'w') as dataset:
+            dataset.createDimension('time', None)
+            dataset.createDimension('lat', len(lat))
+            dataset.createDimension('lon', len(lon))
+            time = dataset.createVariable('time', 'f8', ('time', ))
+            time.units, time.calendar = 'days since 2015-01-01', 'proleptic_gregorian'
+            time[:] = np.arange(365)
+            dataset.createVariable('lat', 'f8', ('lat', ))[:] = lat
+            dataset.createVariable('lon', 'f8', ('lon', ))[:] = lon
+            variable = dataset.createVariable(f'tas{index}', 'f4', ('time', 'lat', 'lon'), zlib=True,
+                                              chunksizes=(73, len(lat), len(lon)))
+            variable[:] = values + index
+        paths.append(path)
+
+    return root, paths
+
+
+@pytest.fixture
+def local_client(mirror, tmp_path):
+    root, paths = mirror
+    with ISIMIPClient(mirror=LocalBackend(root, output_path=tmp_path), backend='local') as client:
+        yield client, paths
+
+
+def test_select_point(benchmark, local_client):
+    client, paths = local_client
+    job = benchmark.pedantic(client.select_point, args=(paths, 52.4, 13.1), kwargs={'csv': True}, rounds=3)
+    assert job['status'] == 'finished'
+    assert len(job['files']) == FILES
+
+
+def test_select_bbox_mean(benchmark, local_client):
+    client, paths = local_client
+    job = benchmark.pedantic(client.select_bbox, args=(paths, -10, 30, 35, 60), kwargs={'mean': True}, rounds=3)
+    assert job['status'] == 'finished'
+
+
+def test_cutout_bbox(benchmark, local_client):
+    client, paths = local_client
+    job = benchmark.pedantic(client.cutout_bbox, args=(paths, -10, 30, 35, 60), rounds=3)
+    assert job['status'] == 'finished'
+
+
+def test_run_batch(benchmark, local_client):
+    # the jobs of the batch run on the local backend as well, without chunks and downloads
+    client, paths = local_client
+    specs = [{'operation': 'select_point', 'paths': paths[:10], 'lat': 52.4, 'lon': 13.1, 'csv': True,
+              'chunk_size': 3, 'backend': 'local'}]
+    statuses = benchmark.pedantic(client.run_batch, args=(specs, ), kwargs={'download': True}, rounds=3)
+    assert [status['status'] for status in statuses] == ['finished']
@@ -0,0 +1,72 @@
+import pytest
+
+from isimip_client.pipeline import Pipeline
+
+PATHS = ['ISIMIP3b/InputData/climate/atmosphere/bias-adjusted/global/daily/ssp585/GFDL-ESM4/'
+         'gfdl-esm4_r1i1p1f1_w5e5_ssp585_tas_global_daily_2015_2020.nc']
+
+
+@pytest.fixture
+def shape(tmp_path):
+    shape_path = tmp_path / 'shapes.zip'
+    shape_path.write_bytes(b'shape')
+    return shape_path
+
+
+@pytest.fixture
+def mask(tmp_path):
+    mask_path = tmp_path / 'global.nc'
+    mask_path.write_bytes(b'mask')
+    return mask_path
+
+
+def test_mask_shape(benchmark, shape):
+    pipeline = Pipeline(PATHS).mask_shape(shape, 3).cutout_bbox(-20, 20, -10, 10).mean().csv()
+
+    assert pipeline.get_spec(optimize=False) == {
+        'paths': PATHS,
+        'operations': [
+            {'operation': 'create_mask', 'shape': 'shapes.zip', 'mask': 'shapes.nc'},
+            {'operation': 'mask_mask', 'mask': 'shapes.nc', 'var': 'm_3'},
+            {'operation': 'cutout_bbox', 'bbox': [-20, 20, -10, 10], 'compute_mean': True, 'output_csv': True}
+        ],
+        'uploads': [shape]
+    }
+
+    # the cutout is moved before the mask created from the shape, the mean and the csv
+    # output move to the last operation
+    assert benchmark(pipeline.get_spec) == {
+        'paths': PATHS,
+        'operations': [
+            {'operation': 'cutout_bbox', 'bbox': [-20, 20, -10, 10]},
+            {'operation': 'create_mask', 'shape': 'shapes.zip', 'mask': 'shapes.nc'},
+            {'operation': 'mask_mask', 'mask': 'shapes.nc', 'var': 'm_3', 'compute_mean': True, 'output_csv': True}
+        ],
+        'uploads': [shape]
+    }
+
+
+@pytest.mark.parametrize('add_mask', [
+    lambda pipeline, mask: pipeline.mask_country('fra'),
+    lambda pipeline, mask: pipeline.mask_landonly(),
+    lambda pipeline, mask: pipeline.mask_mask(mask, 'm_0')
+], ids=['mask_country', 'mask_landonly', 'mask_mask'])
+def test_global_mask(add_mask, mask):
+    # the masks on a global grid are not moved after the cutout
+    pipeline = add_mask(Pipeline(PATHS), mask).cutout_bbox(-20, 20, -10, 10)
+    assert pipeline.get_spec() == pipeline.get_spec(optimize=False)
+
+
+def test_global_mask_and_shape(shape, mask):
+    # the cutout is only moved before the masks, which are created from shapes
+    pipeline = Pipeline(PATHS).mask_mask(mask, 'm_0').mask_shape(shape, 0).cutout_bbox(-20, 20, -10, 10)
+    assert [operation['operation'] for operation in pipeline.get_operations()] == \
+        ['mask_mask', 'cutout_bbox', 'create_mask', 'mask_mask']
+
+
+def test_merge_bboxes():
+    pipeline = Pipeline(PATHS).cutout_bbox(-20, 20, -10, 10).cutout_bbox(0, 40, -20, 0).mask_country('fra')
+    assert pipeline.get_operations() == [
+        {'operation': 'cutout_bbox', 'bbox': [0, 20, -10, 0]},
+        {'operation': 'mask_country', 'country': 'fra'}
+    ]
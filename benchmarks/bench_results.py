@@ -0,0 +1,64 @@
+import json
+import os
+
+import pytest
+
+from isimip_client.client import ISIMIPClient
+from isimip_client.results import ResultCache
+
+
+def add_entry(cache, key, size, mtime):
+    meta_path = cache.path / key / cache.meta_name
+    meta_path.parent.mkdir()
+    meta_path.write_text(json.dumps({'id': key, 'size': size}))
+    os.utime(meta_path, (mtime, mtime))
+    return meta_path.parent
+
+
+def test_evict(tmp_path):
+    cache = ResultCache(tmp_path, max_size=250)
+    for index, key in enumerate('abcd'):
+        add_entry(cache, key, 100, 1000 + index)
+
+    # the least recently used entries are evicted first, a is used again
+    cache.get('a')
+    cache.evict()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['a', 'd']
+
+
+def test_evict_keep(tmp_path):
+    # the entry, which was just stored, is kept even if it is the oldest one
+    cache = ResultCache(tmp_path, max_size=250)
+    keep = add_entry(cache, 'a', 200, 1000)
+    add_entry(cache, 'b', 100, 2000)
+    cache.evict(keep=keep)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['a']
+
+
+@pytest.mark.parametrize('mock_server', [{'datasets': 1}], indirect=True)
+def test_result_cache(mock_server, tmp_path):
+    paths = [file['path'] for file in mock_server.files]
+    cache = ResultCache(tmp_path, max_size=None)
+    with ISIMIPClient(data_url=mock_server.data_url, files_api_url=mock_server.files_api_url, backoff=0.01,
+                      results=cache) as client:
+        job = client.select_point(paths, 0, 0, poll=0.05)
+        assert not job['cached']
+        size = job['size']
+
+        # the same job is returned from the cache, without a request
+        stats = dict(mock_server.stats)
+        assert client.select_point(paths, 0, 0, poll=0.05) == dict(job, cached=True)
+        assert mock_server.stats == stats
+
+        # only one result fits into the cache
+        cache.max_size = size * 3 // 2
+        other = client.select_point(paths, 1, 0, poll=0.05)
+        assert os.path.exists(other['path'])
+        assert not os.path.exists(job['path'])
+
+        # a result, which is larger than the cache, is not stored
+        cache.max_size = size // 2
+        job = client.select_point(paths, 2, 0, poll=0.05)
+        assert job['cached'] is False
+        assert 'path' not in job
+        assert os.path.exists(other['path'])
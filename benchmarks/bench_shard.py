@@ -0,0 +1,132 @@
+import os
+import random
+import threading
+import time
+
+import pytest
+
+from isimip_client.shard import ShardQueue, assign_shards, get_report, parse_shard, reset_failed
+
+ITEMS = [{'id': f'file{index}', 'size': (index * 7919) % 1000 + 1} for index in range(10000)]
+
+
+def work(items):
+    return [{'status': 'finished'} for _ in items]
+
+
+def test_assign_shards(benchmark):
+    shards = benchmark(assign_shards, ITEMS, 64)
+
+    # every node computes the same, balanced assignment, regardless of the order of the listing
+    assert shards == assign_shards(random.Random(0).sample(ITEMS, len(ITEMS)), 64)
+    assert sorted(item['id'] for shard in shards for item in shard) == sorted(item['id'] for item in ITEMS)
+    totals = [sum(item['size'] for item in shard) for shard in shards]
+    assert max(totals) - min(totals) <= 1000
+
+
+@pytest.mark.parametrize('shard', ['0', '2/2', '-1/2', 'a/b', (1, 1)])
+def test_parse_shard_invalid(shard):
+    with pytest.raises(ValueError):
+        parse_shard(shard)
+
+
+def test_claim(tmp_path):
+    first, second = ShardQueue(tmp_path, '0/2', lease=60), ShardQueue(tmp_path, '1/2', lease=60)
+    assert first.claim('item') == 'claimed'
+    assert second.claim('item') == 'busy'
+
+    # the lease of the first worker expired, e.g. since it was killed
+    claim_path = first.claims_path / f'{first.get_name("item")}.0'
+    os.utime(claim_path, (time.time() - 120, time.time() - 120))
+    assert second.claim('item') == 'claimed'
+    assert first.claim('item') == 'busy'
+
+    first.write_json(first.done_path / first.get_name('item'), {'key': 'item'})
+    assert second.claim('item') == 'done'
+
+
+def test_run_steal(tmp_path):
+    # without other workers, the items of the other shard are stolen after the own items
+    items = ITEMS[:20]
+    own, other = assign_shards(items, 2)
+
+    queue = ShardQueue(tmp_path, '0/2', wait=False)
+    entries = queue.run(items, work, batch_size=4)
+    assert [entry['key'] for entry in entries] == [item['id'] for item in own + other[::-1]]
+    assert [entry['stolen'] for entry in entries] == [False] * len(own) + [True] * len(other)
+
+    report = get_report(tmp_path)
+    assert (report['items'], report['done'], report['pending']) == (20, 20, [])
+    assert report['workers'][queue.worker]['stolen'] == len(other)
+
+    # a second run of the same shard does not process the items again
+    assert ShardQueue(tmp_path, '0/2', wait=False).run(items, work) == []
+
+
+def test_run_claimed(tmp_path):
+    # the item claimed by another worker is skipped, until its lease has expired
+    items = ITEMS[:10]
+    other = ShardQueue(tmp_path, '1/2', lease=60)
+    assert other.claim('file0') == 'claimed'
+
+    entries = ShardQueue(tmp_path, '0/2', lease=60, wait=False).run(items, work)
+    assert len(entries) == 9
+    assert get_report(tmp_path)['pending'] == ['file0']
+
+    claim_path = other.claims_path / f'{other.get_name("file0")}.0'
+    os.utime(claim_path, (time.time() - 120, time.time() - 120))
+    entries = ShardQueue(tmp_path, '0/2', lease=60, wait=False).run(items, work)
+    assert [entry['key'] for entry in entries] == ['file0']
+
+
+def test_run_items_differ(tmp_path):
+    ShardQueue(tmp_path, '0/2', wait=False).run(ITEMS[:10], work)
+    with pytest.raises(RuntimeError):
+        ShardQueue(tmp_path, '1/2', wait=False).run(ITEMS[:11], work)
+
+
+def test_reset_failed(tmp_path):
+    def fail_odd(items):
+        return [{'status': 'failed' if int(item['id'][4:]) % 2 else 'finished'} for item in items]
+
+    ShardQueue(tmp_path, '0/1', wait=False).run(ITEMS[:10], fail_odd, batch_size=3)
+    report = get_report(tmp_path)
+    assert report['status'] == {'finished': 5, 'failed': 5}
+
+    assert reset_failed(tmp_path) == 5
+    assert get_report(tmp_path)['pending'] == [f'file{index}' for index in range(1, 10, 2)]
+
+    entries = ShardQueue(tmp_path, '0/1', wait=False).run(ITEMS[:10], work)
+    assert len(entries) == 5
+    assert get_report(tmp_path)['status'] == {'finished': 10}
+
+
+def test_run_missing_results(tmp_path):
+    # the items without a result are recorded as failed
+    entries = ShardQueue(tmp_path, '0/1', wait=False).run(ITEMS[:10], lambda items: work(items)[:-1], batch_size=5)
+    assert [entry['result']['status'] for entry in entries] == (['finished'] * 4 + ['failed']) * 2
+    assert get_report(tmp_path)['done'] == 10
+
+
+def test_renew_claims(tmp_path):
+    # only the claims, which still belong to the worker, are renewed
+    first, second = ShardQueue(tmp_path, '0/2', lease=0.04), ShardQueue(tmp_path, '1/2', lease=0.04)
+    assert first.claim('own') == 'claimed'
+    assert first.claim('lost') == 'claimed'
+    paths = {key: first.claims_path / f'{first.get_name(key)}.0' for key in ['own', 'lost']}
+    for path in paths.values():
+        os.utime(path, (time.time() - 120, time.time() - 120))
+    assert second.claim('lost') == 'claimed'
+    paths['taken'] = second.claims_path / f'{second.get_name("lost")}.1'
+    os.utime(paths['taken'], (time.time() - 120, time.time() - 120))
+
+    first.held.update(['own', 'lost'])
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=first.renew_claims, args=(stop, ))
+    heartbeat.start()
+    time.sleep(0.1)
+    stop.set()
+    heartbeat.join()
+
+    assert paths['own'].stat().st_mtime > time.time() - 60
+    assert paths['taken'].stat().st_mtime < time.time() - 60
@@ -0,0 +1,34 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+# these modules are only needed when a command is run and must not be imported at startup
+LAZY_MODULES = ['requests', 'rich', 'isimip_client.client', 'isimip_client.cache', 'isimip_client.catalog',
+                'isimip_client.resultset', 'importlib.metadata']
+
+
+def run_python(code):
+    return subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+
+
+# the times are only reported, since they depend on the machine, the startup of the interpreter
+# ("pass") and the import of the full client are the baselines for the command line client,
+# while test_lazy_modules makes sure that the slow imports are not added at startup again
+@pytest.mark.parametrize('code', [
+    'pass',
+    'import isimip_client.cli',
+    'from isimip_client.cli import main; main(["--help"])',
+    'import isimip_client.client'
+])
+def test_startup(benchmark, code):
+    benchmark.pedantic(run_python, args=(code, ), rounds=10, iterations=1)
+
+
+def test_lazy_modules():
+    imported = json.loads(run_python(
+        'import json, sys; import isimip_client.cli; '
+        f'print(json.dumps([name for name in {LAZY_MODULES!r} if name in sys.modules]))'
+    ))
+    assert imported == []
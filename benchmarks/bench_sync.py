@@ -0,0 +1,63 @@
+import pytest
+
+from isimip_client.sync import SyncManager, SyncState
+
+SERVERS = [{'datasets': 2, 'files_per_dataset': 3, 'file_size': 64 * 1024}]
+
+
+@pytest.mark.parametrize('mock_server', SERVERS, indirect=True)
+def test_sync_unchanged(run, client, mock_server, tmp_path):
+    client.sync('ISIMIP3b', tmp_path)
+
+    # the unchanged files are detected using the state, without reading them
+    summary = run(client.sync, 'ISIMIP3b', tmp_path)
+    assert summary['unchanged'] == 6
+    assert summary['downloaded'] == 0
+
+
+@pytest.mark.parametrize('mock_server', SERVERS, indirect=True)
+def test_sync(client, mock_server, tmp_path):
+    file_paths = [tmp_path / file['path'] for file in mock_server.files]
+
+    summary = client.sync('ISIMIP3b', tmp_path)
+    assert (summary['remote'], summary['downloaded']) == (6, 6)
+    assert all(file_path.read_bytes() == mock_server.content for file_path in file_paths)
+
+    # a changed and a removed file are downloaded again
+    file_paths[0].write_bytes(b'changed')
+    file_paths[1].unlink()
+    summary = client.sync('ISIMIP3b', tmp_path)
+    assert (summary['unchanged'], summary['downloaded']) == (4, 2)
+    assert all(file_path.read_bytes() == mock_server.content for file_path in file_paths)
+
+    # a dry run only reports the changes
+    file_paths[2].unlink()
+    summary = client.sync('ISIMIP3b', tmp_path, dry_run=True)
+    assert (summary['unchanged'], summary['downloaded'], summary['size']) == (5, 0, 64 * 1024)
+    assert not file_paths[2].exists()
+
+
+@pytest.mark.parametrize('mock_server', SERVERS, indirect=True)
+def test_sync_prune(client, mock_server, tmp_path):
+    client.sync('ISIMIP3b', tmp_path)
+
+    # a file, which was synced before, but is not in the repository anymore
+    removed = dict(mock_server.files[0], path='ISIMIP3b/removed.nc')
+    removed_path = tmp_path / removed['path']
+    removed_path.write_bytes(b'removed')
+    state = SyncState(tmp_path / SyncManager.state_name)
+    state.set(dict(removed, checksum=mock_server.checksum), removed_path)
+    state.commit()
+    state.close()
+
+    summary = client.sync('ISIMIP3b', tmp_path)
+    assert (summary['unchanged'], summary['pruned']) == (6, 0)
+    assert removed_path.exists()
+
+    summary = client.sync('ISIMIP3b', tmp_path, prune=True)
+    assert (summary['unchanged'], summary['pruned']) == (6, 1)
+    assert not removed_path.exists()
+
+    state = SyncState(tmp_path / SyncManager.state_name)
+    assert removed['path'] not in state.get_all('ISIMIP3b')
+    state.close()
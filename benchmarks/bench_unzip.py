@@ -0,0 +1,98 @@
+import io
+import zipfile
+
+import pytest
+
+from isimip_client.unzip import StreamingUnzipper
+
+
+def get_archive(files, stream=False, compression=zipfile.ZIP_DEFLATED):
+    # zipfile writes data descriptors (and no sizes in the local headers) to streams, which can not be seeked
+    buffer = io.BytesIO()
+    fp = Unseekable(buffer) if stream else buffer
+    with zipfile.ZipFile(fp, 'w', compression) as zip_file:
+        for name, data in files.items():
+            zip_file.writestr(name, data)
+    return buffer.getvalue()
+
+
+class Unseekable(io.RawIOBase):
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+def unzip(path, data, chunk_size, members=None):
+    unzipper = StreamingUnzipper(path, members)
+    for offset in range(0, len(data), chunk_size):
+        unzipper.feed(data[offset:offset + chunk_size])
+    unzipper.close()
+    return unzipper
+
+
+FILES = {f'output/file{index}.csv': 'time,value\n' + '2015-01-01,1.0\n' * 1000 * index for index in range(5)}
+
+
+@pytest.mark.parametrize('stream', [False, True])
+@pytest.mark.parametrize('compression', [zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED])
+def test_unzip(benchmark, tmp_path, stream, compression):
+    if stream and compression == zipfile.ZIP_STORED:
+        pytest.skip('stored members without sizes can not be streamed')
+
+    data = get_archive(FILES, stream=stream, compression=compression)
+    benchmark(unzip, tmp_path, data, 65 * 1024)
+    for name, content in FILES.items():
+        assert (tmp_path / name).read_text() == content
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1000])
+def test_unzip_chunks(tmp_path, chunk_size):
+    # the headers, the data and the descriptors can be split at every byte
+    unzip(tmp_path, get_archive(FILES, stream=True), chunk_size)
+    for name, content in FILES.items():
+        assert (tmp_path / name).read_text() == content
+
+
+def test_unzip_members(tmp_path):
+    unzipper = unzip(tmp_path, get_archive(FILES), 1024, members=['*/file1.csv'])
+    assert [path for path in tmp_path.rglob('*') if path.is_file()] == [tmp_path / 'output' / 'file1.csv']
+    assert unzipper.extracted == [str(tmp_path / 'output' / 'file1.csv')]
+
+
+def test_unzip_unsafe_names(tmp_path):
+    unzip(tmp_path / 'output', get_archive({'../evil.csv': 'x', '/abs/file.csv': 'y'}), 1024)
+    assert (tmp_path / 'output' / 'evil.csv').read_text() == 'x'
+    assert (tmp_path / 'output' / 'abs' / 'file.csv').read_text() == 'y'
+    assert not (tmp_path / 'evil.csv').exists()
+
+
+def test_unzip_empty(tmp_path):
+    # an empty archive only consists of the end of the central directory
+    assert unzip(tmp_path, get_archive({}), 1024).extracted == []
+
+
+def test_unzip_encrypted(tmp_path):
+    # zipfile can not write encrypted members, so the flag is set in the local header
+    data = bytearray(get_archive({'file.csv': 'x'}))
+    data[6] |= 0x01
+    with pytest.raises(RuntimeError, match='encrypted'):
+        unzip(tmp_path, bytes(data), 1024)
+
+
+def test_unzip_incomplete(tmp_path):
+    data = get_archive(FILES)
+    with pytest.raises(RuntimeError, match='incomplete'):
+        unzip(tmp_path, data[:len(data) // 2], 1024)
+
+
+def test_unzip_bad_crc(tmp_path):
+    data = bytearray(get_archive({'file.csv': 'x' * 100}, compression=zipfile.ZIP_STORED))
+    data[data.index(b'x' * 100)] = ord('y')
+    with pytest.raises(RuntimeError, match='CRC'):
+        unzip(tmp_path, bytes(data), 1024)
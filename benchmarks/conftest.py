@@ -0,0 +1,57 @@
+import tracemalloc
+
+import pytest
+
+from isimip_client.client import ISIMIPClient
+from isimip_client.mock import MockServer
+
+
+def get_peak_memory(func, args, kwargs, setup=None):
+    # the peak of the memory allocated by Python during one more (untimed) call, ru_maxrss would
+    # only give the peak of the whole pytest process, which includes all previous benchmarks
+    if setup is not None:
+        setup()
+
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.fixture(scope='module')
+def mock_server(request):
+    # the options of the server can be set using indirect parametrization
+    with MockServer(**getattr(request, 'param', {})) as server:
+        yield server
+
+
+@pytest.fixture
+def client(mock_server):
+    with ISIMIPClient(data_url=mock_server.data_url, files_api_url=mock_server.files_api_url,
+                      backoff=0.01) as client:
+        yield client
+
+
+@pytest.fixture
+def run(benchmark, mock_server):
+    # runs the benchmark and adds requests/s, MB/s and the peak memory to the report
+    def run(func, *args, rounds=5, setup=None, **kwargs):
+        stats = dict(mock_server.stats)
+        if setup is None:
+            result = benchmark.pedantic(func, args=args, kwargs=kwargs, rounds=rounds, iterations=1)
+        else:
+            result = benchmark.pedantic(lambda: func(*args, **kwargs), setup=setup, rounds=rounds)
+
+        requests = mock_server.stats.get('requests', 0) - stats.get('requests', 0)
+        size = mock_server.stats.get('bytes', 0) - stats.get('bytes', 0)
+        benchmark.extra_info['requests'] = requests // rounds
+        if benchmark.stats:
+            total = benchmark.stats.stats.total
+            benchmark.extra_info['requests_per_second'] = round(requests / total, 1)
+            benchmark.extra_info['mb_per_second'] = round(size / total / 1024 / 1024, 1)
+            benchmark.extra_info['peak_memory_mb'] = round(get_peak_memory(func, args, kwargs, setup), 1)
+        return result
+
+    return run
@@ -1,7 +1,11 @@
-from importlib.metadata import PackageNotFoundError
-from importlib.metadata import version as _version
+def __getattr__(name):
+    # the version is looked up on first access, since importlib.metadata is slow to import
+    if name in ('VERSION', '__version__'):
+        from importlib.metadata import PackageNotFoundError, version
 
-try:
-    VERSION = __version__ = _version(__package__)
-except PackageNotFoundError:
-    VERSION = __version__ = "0.0.0+unknown"
+        try:
+            return version(__package__)
+        except PackageNotFoundError:
+            return '0.0.0+unknown'
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,230 @@
+import json
+import logging
+import re
+import zipfile
+from pathlib import Path, PurePosixPath
+
+logger = logging.getLogger(__name__)
+
+# the names of ISIMIP3 files, the number of parts (separated by "_") identifies the pattern,
+# e.g. gfdl-esm4_r1i1p1f1_w5e5_ssp370_tas_lat52.39lon13.06_daily_2015_2020.csv
+patterns = {
+    9: ['climate_forcing', 'ensemble_member', 'bias_adjustment', 'climate_scenario', 'climate_variable',
+        'region', 'time_step', 'start_year', 'end_year'],
+    11: ['model', 'climate_forcing', 'bias_adjustment', 'climate_scenario', 'soc_scenario', 'sens_scenario',
+         'variable', 'region', 'time_step', 'start_year', 'end_year']
+}
+
+
+def parse_specifiers(name):
+    parts = PurePosixPath(name).stem.split('_')
+    if len(parts) in patterns:
+        return dict(zip(patterns[len(parts)], parts))
+    elif len(parts) > 4 and re.fullmatch(r'\d{4}', parts[-1]) and re.fullmatch(r'\d{4}', parts[-2]):
+        # unknown patterns only get the specifiers at the end of the name
+        return dict(zip(['name', 'region', 'time_step', 'start_year', 'end_year'],
+                        ['_'.join(parts[:-4]), *parts[-4:]]))
+    else:
+        return {'name': PurePosixPath(name).stem}
+
+
+def unify_schemas(schemas):
+    # if the time of one file could not be parsed (e.g. for calendars with 30 days in February), it is
+    # stored as string for all files, other conflicting types raise an error instead of dropping columns
+    import pyarrow as pa
+
+    if any(pa.types.is_string(schema.field('time').type) for schema in schemas if 'time' in schema.names):
+        schemas = [schema.set(schema.get_field_index('time'), pa.field('time', pa.string()))
+                   if 'time' in schema.names else schema for schema in schemas]
+    return pa.unify_schemas(schemas)
+
+
+class ResultStore:
+    # collects the CSV files in the result archives of the Files API into a directory of Parquet
+    # files (one per archive), the archives are read without extracting them and every archive
+    # is only added once, so that new jobs can be appended later
+
+    manifest_name = '_archives.json'
+
+    # the number of rows which are kept in memory before they are written to the Parquet file
+    batch_rows = 1000000
+
+    def __init__(self, path, specifiers=None):
+        self.path = Path(path).expanduser()
+        self.path.mkdir(exist_ok=True, parents=True)
+
+        # a function, which returns the specifiers for the name of a CSV file
+        self.specifiers = specifiers or parse_specifiers
+
+        manifest_path = self.path / self.manifest_name
+        self.archives = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+
+    def add(self, archive):
+        archive = Path(archive).expanduser()
+        stat = archive.stat()
+        entry = self.archives.get(archive.name)
+        if entry and entry['size'] == stat.st_size:
+            logger.info('archive %s already in store', archive.name)
+            return 0
+
+        part_path = self.path / f'{archive.stem}.parquet'
+        tmp_path = part_path.with_suffix('.parquet.tmp')
+        writer, rows, files = None, 0, 0
+        try:
+            with zipfile.ZipFile(archive) as zip_file:
+                infos = [info for info in zip_file.infolist() if info.filename.endswith('.csv')]
+
+                # the schemas of all files are unified before the first batch is written, so that the
+                # specifiers of later files are not dropped, the tables of the first batch are kept
+                schemas, tables, kept_rows = [], {}, 0
+                for index, info in enumerate(infos):
+                    table = self.read_csv(zip_file.read(info), info.filename, archive.stem)
+                    schemas.append(table.schema)
+                    if kept_rows + len(table) <= self.batch_rows:
+                        tables[index] = table
+                        kept_rows += len(table)
+                schema = unify_schemas(schemas) if schemas else None
+
+                batch = []
+                for index, info in enumerate(infos):
+                    table = tables.pop(index, None)
+                    if table is None or table.schema.field('time').type != schema.field('time').type:
+                        table = self.read_csv(zip_file.read(info), info.filename, archive.stem,
+                                              time_type=schema.field('time').type)
+                    batch.append(table)
+                    files += 1
+
+                    if sum(len(table) for table in batch) >= self.batch_rows:
+                        writer = self.write_batch(writer, batch, tmp_path, schema)
+                        rows += sum(len(table) for table in batch)
+                        batch = []
+
+            if batch:
+                writer = self.write_batch(writer, batch, tmp_path, schema)
+                rows += sum(len(table) for table in batch)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        if writer is None:
+            # the archive does not contain any CSV files
+            part_path.unlink(missing_ok=True)
+            part_path = None
+        else:
+            tmp_path.replace(part_path)
+
+        self.archives[archive.name] = {
+            'part': part_path.name if part_path else None,
+            'size': stat.st_size,
+            'files': files,
+            'rows': rows
+        }
+        self.write_manifest()
+
+        logger.info('archive %s added to store files=%s rows=%s', archive.name, files, rows)
+        return rows
+
+    def add_many(self, archives):
+        return sum(self.add(archive) for archive in archives)
+
+    def read_csv(self, data, name, job, time_type=None):
+        # the CSV files are parsed by pyarrow, the first column is the time and the last column
+        # contains the values, the specifiers are added as columns with a single value,
+        # the time is parsed unless time_type is string
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.csv as csv
+
+        first_line = data.split(b'\n', 1)[0].decode()
+        header = not first_line[:1].isdigit()
+        column_names = None if header else ['time', *(['lat', 'lon'] if first_line.count(',') > 1 else []), 'value']
+
+        read_options = csv.ReadOptions(column_names=column_names)
+        convert_options = csv.ConvertOptions(column_types={(first_line.split(',')[0] if header else 'time'):
+                                                           pa.string()})
+        table = csv.read_csv(pa.BufferReader(data), read_options=read_options, convert_options=convert_options)
+
+        # the variable is taken from the header, or from the specifiers if the column is only called "value"
+        specifiers = self.specifiers(name)
+        variable = table.column_names[-1]
+        if variable == 'value':
+            variable = specifiers.get('variable', specifiers.get('climate_variable'))
+
+        if time_type is not None and pa.types.is_string(time_type):
+            time = table.column(0)
+        else:
+            try:
+                time = pc.cast(table.column(0), pa.timestamp('s'))
+            except pa.ArrowInvalid:
+                # e.g. for calendars with 30 days in February
+                time = table.column(0)
+
+        length = len(table)
+        columns = {
+            'time': time,
+            'lat': table.column('lat').cast(pa.float64()) if 'lat' in table.column_names[1:-1]
+            else pa.nulls(length, pa.float64()),
+            'lon': table.column('lon').cast(pa.float64()) if 'lon' in table.column_names[1:-1]
+            else pa.nulls(length, pa.float64()),
+            'value': table.column(table.num_columns - 1).cast(pa.float64()),
+            'variable': pa.array([variable] * length, pa.string()),
+            'job': pa.array([job] * length, pa.string()),
+            'file': pa.array([name] * length, pa.string())
+        }
+        for key, value in specifiers.items():
+            columns.setdefault(key, pa.array([value] * length, pa.string()))
+
+        return pa.table(columns)
+
+    def write_batch(self, writer, batch, path, schema):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # the columns of every table are aligned with the unified schema of the archive
+        table = pa.concat_tables([
+            pa.table({
+                field.name: table.column(field.name).cast(field.type) if field.name in table.column_names
+                else pa.nulls(len(table), field.type)
+                for field in schema
+            }, schema=schema) for table in batch
+        ])
+
+        if writer is None:
+            writer = pq.ParquetWriter(path, schema)
+        writer.write_table(table)
+        return writer
+
+    def write_manifest(self):
+        manifest_path = self.path / self.manifest_name
+        tmp_path = manifest_path.with_suffix('.json.tmp')
+        tmp_path.write_text(json.dumps(self.archives, indent=2))
+        tmp_path.replace(manifest_path)
+
+    def get_parts(self):
+        return [self.path / entry['part'] for entry in self.archives.values() if entry['part']]
+
+    def to_dataset(self):
+        # the parts can have different specifiers, their schemas are unified
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+
+        parts = [str(part) for part in self.get_parts()]
+        schema = unify_schemas([pq.read_schema(part) for part in parts]) if parts else pa.schema([])
+        return ds.dataset(parts, schema=schema, format='parquet')
+
+    def to_arrow(self, columns=None, filter=None):
+        return self.to_dataset().to_table(columns=columns, filter=filter)
+
+    def to_pandas(self, columns=None, filter=None):
+        # the repeated strings (e.g. the specifiers) are returned as categorical columns
+        return self.to_arrow(columns=columns, filter=filter).to_pandas(strings_to_categorical=True)
+
+    def stats(self):
+        return {
+            'path': str(self.path),
+            'archives': len(self.archives),
+            'files': sum(entry['files'] for entry in self.archives.values()),
+            'rows': sum(entry['rows'] for entry in self.archives.values()),
+            'size': sum(part.stat().st_size for part in self.get_parts() if part.exists())
+        }
@@ -0,0 +1,497 @@
+import asyncio
+import json
+import logging
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from urllib.parse import urlparse
+
+from .checksums import ChecksumIndex
+from .client import (
+    DataApiMixin,
+    DownloadMixin,
+    FilesApiMixin,
+    FilesApiV1Mixin,
+    FilesApiV2Mixin,
+    HTTPClient,
+    RESTClient,
+)
+from .resultset import ResultSet
+from .upload import MultipartStream
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncHTTPClient:
+
+    retry_status = HTTPClient.retry_status
+    retry_methods = HTTPClient.retry_methods
+    can_retry = HTTPClient.can_retry
+    get_backoff = HTTPClient.get_backoff
+    is_throttled = HTTPClient.is_throttled
+    add_hook = HTTPClient.add_hook
+    emit = HTTPClient.emit
+
+    def __init__(self, auth, headers, timeout=(10, 60), retries=5, backoff=0.5, backoff_max=60,
+                 pool_size=10, max_connections_per_host=10, hooks=None, rate_limiter=None, retry_methods=None):
+        if httpx is None:
+            raise RuntimeError('The async client needs httpx. Please install "isimip-client[async]".')
+
+        self.auth, self.headers = auth, headers or {}
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_methods = tuple(retry_methods or self.retry_methods)
+        self.backoff, self.backoff_max = backoff, backoff_max
+        self.max_connections_per_host = max_connections_per_host
+        self.hooks = list(hooks or [])
+
+        if rate_limiter is True:
+            from .ratelimit import RateLimiter
+            rate_limiter = RateLimiter()
+        self.rate_limiter = rate_limiter or None
+
+        connect_timeout, read_timeout = timeout
+        self.session = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=pool_size)
+        )
+
+        # one semaphore per host bounds the number of concurrent requests to each server,
+        # they are created lazily since they need to be bound to the running event loop
+        self.semaphores = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.session.aclose()
+
+    def get_semaphore(self, url):
+        host = urlparse(url).netloc
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.max_connections_per_host)
+        return self.semaphores[host]
+
+    async def request(self, method, url, **kwargs):
+        kwargs.setdefault('auth', self.auth)
+        kwargs.setdefault('headers', self.headers)
+
+        # file-like bodies are rewound and streamed again for every attempt
+        body = kwargs.pop('content') if hasattr(kwargs.get('content'), 'read') else None
+
+        start_time = time.perf_counter()
+        attempt = 0
+        while True:
+            if body is not None:
+                body.seek(0)
+                kwargs['content'] = self.iter_body(body)
+
+            slot = await self.acquire_slot(url)
+            try:
+                async with self.get_semaphore(url):
+                    response = await self.session.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                await self.release_slot(slot)
+                if attempt >= self.retries or not self.can_retry(method, sent=self.is_sent(e)):
+                    if self.hooks:
+                        self.emit('request', method=method, url=url, status=None, time=time.perf_counter() - start_time,
+                                  bytes=0, retries=attempt, error=repr(e))
+                    raise
+                logger.warning('%s url=%s failed (%r), retrying', method, url, e)
+                delay = self.get_backoff(attempt)
+            else:
+                if response.status_code not in self.retry_status or attempt >= self.retries or \
+                        not self.can_retry(method, response=response):
+                    if self.hooks:
+                        self.emit('request', method=method, url=url, status=response.status_code,
+                                  time=time.perf_counter() - start_time, retries=attempt, error=None,
+                                  bytes=len(response.content))
+                    await self.release_slot(slot)
+                    return response
+                logger.warning('%s url=%s status=%s, retrying', method, url, response.status_code)
+                delay = self.get_backoff(attempt, response)
+                await self.release_slot(slot)
+                if self.rate_limiter and self.is_throttled(response):
+                    await asyncio.get_running_loop().run_in_executor(None, self.rate_limiter.throttle, url, delay)
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def is_sent(self, exception):
+        return not isinstance(exception, (httpx.ConnectError, httpx.ConnectTimeout))
+
+    async def acquire_slot(self, url):
+        # like RateLimiter.acquire, the database is used in a thread, since it can wait for the locks of
+        # other processes, and the event loop keeps running while waiting for the next token
+        if self.rate_limiter is None:
+            return None
+
+        loop = asyncio.get_running_loop()
+        while True:
+            slot, wait = await loop.run_in_executor(None, self.rate_limiter.try_acquire, url)
+            if slot is not None:
+                return slot
+            await asyncio.sleep(wait)
+
+    async def release_slot(self, slot):
+        if slot is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.rate_limiter.release, slot)
+
+    async def iter_body(self, body):
+        for chunk in iter(lambda: body.read(1024 * 1024), b''):
+            yield chunk
+
+    def parse_response(self, response):
+        try:
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            try:
+                logger.error('%s response=%s', e, response.json())
+            except json.decoder.JSONDecodeError as e:
+                logger.error('%s content=%s', e, response.content)
+        except json.decoder.JSONDecodeError as e:
+            logger.error('%s content=%s', e, response.content)
+
+    async def get(self, url, params=None):
+        # httpx replaces the query string of the url (e.g. of the next page) with params, even if they are empty
+        logger.info('GET url=%s params=%s', url, params or {})
+        response = await self.request('GET', url, params=params or None)
+        return self.parse_response(response)
+
+    async def post(self, url, data):
+        logger.info('POST url=%s data=%s', url, data)
+        response = await self.request('POST', url, json=data)
+        return self.parse_response(response)
+
+    async def put(self, url, data):
+        logger.info('PUT url=%s data=%s', url, data)
+        response = await self.request('PUT', url, data=data)
+        return self.parse_response(response)
+
+    async def patch(self, url, data):
+        logger.info('PATCH url=%s data=%s', url, data)
+        response = await self.request('PATCH', url, json=data)
+        return self.parse_response(response)
+
+    async def delete(self, url):
+        logger.info('DELETE url=%s', url)
+        response = await self.request('DELETE', url)
+        return self.parse_response(response)
+
+
+class AsyncRESTClient(AsyncHTTPClient):
+
+    max_results = RESTClient.max_results
+    page_size = RESTClient.page_size
+    build_url = RESTClient.build_url
+    get_pages = RESTClient.get_pages
+    get_id_error = RESTClient.get_id_error
+
+    def __init__(self, base_url, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.base_url = base_url
+
+    async def list(self, resource_url, **kwargs):
+        paginate = kwargs.pop('paginate', False)
+        columnar = kwargs.pop('columnar', False)
+        max_results = kwargs.pop('max_results', self.max_results)
+        url = self.build_url(resource_url, kwargs)
+
+        if paginate:
+            return await self.get(url, params=kwargs)
+        else:
+            kwargs.setdefault('page_size', self.page_size)
+            response = await self.get_page(url, kwargs)
+
+            results = ResultSet(response['results']) if columnar else response['results']
+            if response.get('next'):
+                pages = self.get_pages(response, kwargs, max_results)
+                responses = await asyncio.gather(*[self.get_page(url, dict(kwargs, page=page)) for page in pages])
+                for response in responses:
+                    results.extend(response['results'])
+            return results
+
+    async def iter_list(self, resource_url, prefetch=True, **kwargs):
+        max_results = kwargs.pop('max_results', None)
+        url = self.build_url(resource_url, kwargs)
+        kwargs.setdefault('page_size', self.page_size)
+
+        response = await self.get_page(url, kwargs)
+        count = 0
+        while True:
+            if response is None:
+                # stop instead of silently truncating the results
+                raise RuntimeError(f'Could not fetch all results for url={url}')
+
+            next_url = response.get('next')
+            task = asyncio.ensure_future(self.get_page(next_url)) if (prefetch and next_url) else None
+
+            page_done = False
+            try:
+                for result in response['results']:
+                    if max_results is not None and count >= max_results:
+                        return
+                    yield result
+                    count += 1
+                page_done = True
+            finally:
+                if task and not page_done:
+                    task.cancel()
+
+            if next_url:
+                response = await task if task else await self.get_page(next_url)
+            else:
+                break
+
+    async def get_page(self, url, params=None):
+        start_time = time.perf_counter()
+        response = await self.get(url, params=params)
+        if self.hooks and response is not None:
+            self.emit('page', url=url, params=params, results=len(response['results']), count=response.get('count'),
+                      time=time.perf_counter() - start_time)
+        return response
+
+    async def retrieve(self, resource_url, pk, **kwargs):
+        url = self.build_url(resource_url, kwargs, pk)
+        return await self.get(url)
+
+    async def retrieve_many(self, resource_url, pks, **kwargs):
+        # the number of concurrent requests is bounded by max_connections_per_host
+        pks = [str(pk) for pk in pks]
+        unique_pks = [pk for pk in dict.fromkeys(pks) if not self.get_id_error(pk)]
+
+        async def retrieve(pk):
+            try:
+                return await self.retrieve(resource_url, pk, **dict(kwargs))
+            except httpx.HTTPError as e:
+                logger.error('GET pk=%s failed (%s)', pk, e)
+                return None
+
+        results = dict(zip(unique_pks, await asyncio.gather(*[retrieve(pk) for pk in unique_pks])))
+
+        return [results.get(pk) or {'id': pk, 'error': self.get_id_error(pk) or 'could not be retrieved'}
+                for pk in pks]
+
+    async def create(self, resource_url, data, **kwargs):
+        url = self.build_url(resource_url, kwargs)
+        return await self.post(url, data)
+
+    async def update(self, resource_url, pk, data, **kwargs):
+        url = self.build_url(resource_url, kwargs, pk)
+        return await self.put(url, data)
+
+    async def destroy(self, resource_url, pk, **kwargs):
+        url = self.build_url(resource_url, kwargs, pk)
+        return await self.delete(url)
+
+
+class AsyncFilesApiMixin(FilesApiMixin):
+
+    async def post_job(self, data, uploads=None, poll=None):
+        logger.info('job submitted data=%s uploads=%s', data, uploads)
+
+        if uploads is None:
+            response = await self.request('POST', self.files_api_url, json=data)
+        else:
+            files = {}
+            for upload in uploads:
+                upload_path = Path(upload).expanduser()
+                if not upload_path.is_file():
+                    logger.error('No such file: %s', upload_path)
+                    return None
+                files[upload_path.name] = upload_path
+
+            body = MultipartStream({'data': json.dumps(data)}, files)
+            response = await self.request('POST', self.files_api_url, content=body, headers=dict(
+                self.headers, **{'Content-Type': body.content_type, 'Content-Length': str(len(body))}
+            ))
+
+        job = self.parse_response(response)
+        if job:
+            self.log_job(job)
+
+            if poll and job['status'] in ['queued', 'started']:
+                await asyncio.sleep(poll)
+                return await self.get_job(job['job_url'], poll=poll)
+            else:
+                return job
+
+    async def get_job(self, job_url, poll=None):
+        while True:
+            response = await self.request('GET', job_url)
+
+            job = self.parse_response(response)
+            if job:
+                self.log_job(job)
+
+                if poll and job['status'] in ['queued', 'started']:
+                    await asyncio.sleep(poll)
+                    job_url = job['job_url']
+                    continue
+
+            return job
+
+    # run_jobs needs to be defined here, since FilesApiMixin comes before AsyncFilesApiV2Mixin
+    async def run_jobs(self, specs, max_jobs=8, poll=2, path=None, download=False, callback=None):
+        semaphore = asyncio.Semaphore(max_jobs)
+
+        async def run_job(spec):
+            data = dict(spec)
+            uploads = data.pop('uploads', None)
+            async with semaphore:
+                job = await self.post_job(data, uploads=uploads, poll=poll)
+            if job and callback:
+                callback(job)
+            if job and download and job['status'] == 'finished':
+                await self.download(job['file_url'], path=path)
+            return job
+
+        return await asyncio.gather(*[run_job(spec) for spec in specs])
+
+
+class AsyncFilesApiV2Mixin(FilesApiV2Mixin):
+
+    async def post_chunked_job(self, data, uploads=None, poll=None, chunk_size=None, chunk_bytes=None,
+                               backend=None):
+        if self.use_local_backend(data, uploads, backend):
+            # the local backend blocks, so it runs in a thread
+            return await asyncio.get_running_loop().run_in_executor(None, self.mirror.run, data, uploads)
+
+        sizes = await self.get_file_sizes(data['paths']) if chunk_bytes else None
+        chunks = self.chunk_paths(data['paths'], chunk_size, chunk_bytes, sizes=sizes)
+        if len(chunks) <= 1:
+            return await self.post_job(data, uploads=uploads, poll=poll)
+
+        specs = [dict(data, paths=chunk, uploads=uploads) for chunk in chunks]
+        return await self.run_jobs(specs, poll=poll)
+
+    async def get_file_sizes(self, paths):
+        responses = await asyncio.gather(*[self.files(path=path, paginate=True) for path in paths])
+        return {
+            path: next((file['size'] for file in response['results'] if file['path'] == path), 0)
+            for path, response in zip(paths, responses) if response
+        }
+
+
+class AsyncDownloadMixin(DownloadMixin):
+
+    async def download(self, url, path=None, validate=False, extract=False, checksum=None, stream=False,
+                       members=None, keep_archive=True):
+        # like DownloadMixin.download, hashing the files, unzipping and extracting runs in threads,
+        # so that the event loop is not blocked
+        loop = asyncio.get_running_loop()
+        headers = self.headers.copy()
+
+        file_path = self.get_file_path(url, path)
+        extract = extract and file_path.suffix == '.zip'
+
+        if extract and stream:
+            from .unzip import StreamingUnzipper
+            unzipper = StreamingUnzipper(path or Path.cwd(), members)
+        else:
+            unzipper = None
+        write_archive = unzipper is None or keep_archive
+        streamed = False
+
+        if validate and checksum is None:
+            checksum = await self.get_remote_checksum(url, file_path)
+
+        if validate and self.is_verified(file_path, checksum):
+            logger.info('download url=%s to path=%s skipped, checksum matches', url, path)
+        else:
+            if validate:
+                import hashlib
+                m = hashlib.sha512()
+            else:
+                m = None
+
+            if write_archive and file_path.exists():
+                # resume download
+                headers.update({'Range': f'bytes={file_path.stat().st_size}-'})
+
+            logger.info('download url=%s to path=%s', url, path)
+
+            slot = await self.acquire_slot(url)
+            try:
+                async with self.get_semaphore(url):
+                    async with self.session.stream('GET', url, headers=headers) as response:
+                        if response.status_code == 416:
+                            # download is complete
+                            m = None
+                        else:
+                            response.raise_for_status()
+
+                            # if the server ignored the range request, it sends the whole file
+                            mode = 'ab' if response.status_code == 206 else 'wb'
+                            if mode == 'ab' and (m is not None or unzipper is not None):
+                                await loop.run_in_executor(None, self.read_partial, file_path, m, unzipper)
+
+                            with open(file_path, mode) if write_archive else nullcontext() as fd:
+                                async for chunk in response.aiter_bytes(chunk_size=65*1024):
+                                    if self.hooks:
+                                        self.emit('download', url=url, bytes=len(chunk))
+                                    if fd is not None:
+                                        fd.write(chunk)
+                                    if m is not None:
+                                        m.update(chunk)
+                                    if unzipper is not None:
+                                        await loop.run_in_executor(None, unzipper.feed, chunk)
+                                        streamed = True
+            finally:
+                await self.release_slot(slot)
+
+            if validate:
+                await loop.run_in_executor(None, self.validate_file, file_path, checksum,
+                                           m.hexdigest() if m else None)
+
+        if extract:
+            if streamed:
+                unzipper.close()
+            else:
+                await loop.run_in_executor(None, self.extract_file, file_path, path, members)
+
+            if not keep_archive and file_path.exists():
+                file_path.unlink()
+
+    async def get_remote_checksum(self, url, file_path):
+        response = await self.request('GET', self.get_json_url(url), auth=None)
+        response.raise_for_status()
+        json_data = response.json()
+        assert json_data['path'].endswith(file_path.name)
+        return json_data['checksum']
+
+
+class AsyncISIMIPClient(DataApiMixin, AsyncFilesApiMixin, FilesApiV1Mixin, AsyncFilesApiV2Mixin, AsyncDownloadMixin,
+                        AsyncRESTClient):
+
+    def __init__(
+        self,
+        data_url='https://data.isimip.org/api/v1',
+        files_api_url='https://files.isimip.org/api/v2',
+        files_api_version='v2',
+        auth=None,
+        headers=None,
+        checksums=None,
+        mirror=None,
+        backend='remote',
+        **kwargs
+    ):
+        super().__init__(data_url, auth, headers, **kwargs)
+        self.files_api_url = files_api_url
+        self.files_api_version = files_api_version
+        self.checksums = ChecksumIndex() if checksums is True else (checksums or None)
+        if isinstance(mirror, (str, Path)):
+            from .local import LocalBackend
+            mirror = LocalBackend(mirror)
+        self.mirror = mirror
+        self.backend = backend
+        self.job_states = {}
@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from urllib.parse import urlencode
+
+logger = logging.getLogger(__name__)
+
+
+def get_cache_dir():
+    return Path(os.getenv('XDG_CACHE_HOME', '~/.cache')).expanduser() / 'isimip-client'
+
+
+class MetadataCache:
+    # responses of the Data API are stored as compressed JSON in an SQLite database,
+    # a different backend needs to implement get, set, touch, stats and clear
+
+    default_ttl = 24 * 60 * 60
+    default_max_size = 512 * 1024 * 1024
+
+    def __init__(self, path=None, ttl=None, max_size=None):
+        self.path = Path(path).expanduser() if path else get_cache_dir() / 'metadata.sqlite'
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+
+        # the ttl can be a number of seconds or a dict mapping resources (e.g. '/files') to seconds
+        self.ttl = self.default_ttl if ttl is None else ttl
+        self.max_size = self.default_max_size if max_size is None else max_size
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                data BLOB,
+                size INTEGER,
+                etag TEXT,
+                last_modified TEXT,
+                expires REAL,
+                accessed REAL
+            )
+        ''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def get_key(self, url, params=None):
+        params = sorted((key, str(value)) for key, value in (params or {}).items())
+        return url + ('?' + urlencode(params) if params else '')
+
+    def get_ttl(self, resource_url=None):
+        if isinstance(self.ttl, dict):
+            return self.ttl.get(resource_url, self.default_ttl)
+        else:
+            return self.ttl
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT data, etag, last_modified, expires FROM entries WHERE key = ?', (key, )
+            ).fetchone()
+            if row is None:
+                return None
+
+            self.connection.execute('UPDATE entries SET accessed = ? WHERE key = ?', (time.time(), key))
+            self.connection.commit()
+
+        data, etag, last_modified, expires = row
+        return {
+            'data': json.loads(zlib.decompress(data)),
+            'etag': etag,
+            'last_modified': last_modified,
+            'expired': expires < time.time()
+        }
+
+    def set(self, key, data, ttl, etag=None, last_modified=None):
+        blob = zlib.compress(json.dumps(data).encode())
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, blob, len(blob), etag, last_modified, now + ttl, now)
+            )
+            self.evict()
+            self.connection.commit()
+
+    def touch(self, key, ttl):
+        now = time.time()
+        with self.lock:
+            self.connection.execute('UPDATE entries SET expires = ?, accessed = ? WHERE key = ?',
+                                    (now + ttl, now, key))
+            self.connection.commit()
+
+    def evict(self):
+        # remove the least recently used entries until the cache fits into max_size
+        size, = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()
+        if size > self.max_size:
+            for key, entry_size in self.connection.execute(
+                'SELECT key, size FROM entries ORDER BY accessed'
+            ).fetchall():
+                self.connection.execute('DELETE FROM entries WHERE key = ?', (key, ))
+                size -= entry_size
+                if size <= self.max_size:
+                    break
+            logger.info('cache evicted to size=%s', size)
+
+    def stats(self):
+        with self.lock:
+            count, size, expired = self.connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(expires < ?), 0) FROM entries',
+                (time.time(), )
+            ).fetchone()
+        return {
+            'path': str(self.path),
+            'entries': count,
+            'expired': expired,
+            'size': size,
+            'max_size': self.max_size
+        }
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute('DELETE FROM entries')
+            self.connection.commit()
+            self.connection.execute('VACUUM')
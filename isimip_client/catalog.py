@@ -0,0 +1,238 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .cache import get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+
+class Catalog:
+    # a local snapshot of datasets and files of the Data API in an SQLite database, with an index
+    # on the specifiers, so that searches, counts and facets can be answered without requests
+
+    resources = ('datasets', 'files')
+
+    # if more than this fraction of the datasets changed, the files are listed for the whole
+    # snapshot path at once, instead of one listing per changed dataset
+    bulk_fraction = 0.25
+
+    def __init__(self, path=None):
+        self.path = Path(path).expanduser() if path else get_cache_dir() / 'catalog.sqlite'
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        for resource in self.resources:
+            self.connection.execute(f'''
+                CREATE TABLE IF NOT EXISTS {resource} (
+                    id TEXT PRIMARY KEY,
+                    path TEXT,
+                    version TEXT,
+                    size INTEGER,
+                    dataset TEXT,
+                    data TEXT
+                )
+            ''')
+            self.connection.execute(f'CREATE INDEX IF NOT EXISTS {resource}_path ON {resource} (path)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS files_dataset ON files (dataset)')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS specifiers (
+                resource TEXT,
+                id TEXT,
+                key TEXT,
+                value TEXT
+            )
+        ''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS specifiers_value ON specifiers (resource, key, value)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS specifiers_id ON specifiers (id)')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS snapshots (
+                path TEXT PRIMARY KEY,
+                updated REAL,
+                datasets INTEGER,
+                files INTEGER
+            )
+        ''')
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def refresh(self, client, path='', workers=8):
+        # the datasets below the path are always listed, but only datasets with a new version
+        # (and their files) are written, datasets which are gone are removed
+        start_time = time.time()
+        remote = {dataset['id']: dataset for dataset in client.iter_datasets(path=path)}
+
+        with self.lock:
+            where, params = self.get_path_filter(path)
+            local = dict(self.connection.execute(f'SELECT id, version FROM datasets WHERE {where}', params))
+
+        changed = [dataset for dataset in remote.values() if local.get(dataset['id']) != dataset['version']]
+        removed = set(local) - set(remote)
+        logger.info('catalog path=%s datasets=%s changed=%s removed=%s', path, len(remote), len(changed),
+                    len(removed))
+
+        files = self.get_files(client, path, changed, len(remote), workers)
+
+        with self.lock, self.connection:
+            for dataset_id in removed | {dataset['id'] for dataset in changed}:
+                self.remove_dataset(dataset_id)
+            for dataset in changed:
+                self.insert('datasets', dataset)
+            for dataset_id, file in files:
+                self.insert('files', file, dataset_id)
+
+            self.connection.execute('INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)', (
+                path, time.time(), len(remote),
+                self.connection.execute(f'SELECT COUNT(*) FROM files WHERE {where}', params).fetchone()[0]
+            ))
+
+        return {
+            'path': path,
+            'datasets': len(remote),
+            'changed': len(changed),
+            'removed': len(removed),
+            'files': len(files),
+            'time': round(time.time() - start_time, 3)
+        }
+
+    def get_files(self, client, path, changed, total, workers):
+        # returns a list of (dataset_id, file) tuples for the changed datasets
+        if not changed:
+            return []
+
+        if all(dataset.get('files') and all('specifiers' in file for file in dataset['files'])
+               for dataset in changed):
+            # the dataset listing already contains the complete files
+            return [(dataset['id'], file) for dataset in changed for file in dataset['files']]
+
+        if len(changed) > total * self.bulk_fraction:
+            files = list(client.iter_files(path=path))
+            if all('dataset' in file for file in files):
+                changed_ids = {dataset['id'] for dataset in changed}
+                return [(self.get_dataset_id(file), file) for file in files
+                        if self.get_dataset_id(file) in changed_ids]
+
+        # the path of a dataset is a prefix of the paths of its files, but maybe also of other files
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            listings = executor.map(lambda dataset: [
+                (dataset['id'], file) for file in client.iter_files(path=dataset['path'])
+                if self.get_dataset_id(file, dataset['id']) == dataset['id']
+            ], changed)
+            return [file for listing in listings for file in listing]
+
+    def get_dataset_id(self, file, default=None):
+        dataset = file.get('dataset', default)
+        return dataset.get('id') if isinstance(dataset, dict) else dataset
+
+    def insert(self, resource, instance, dataset_id=None):
+        self.connection.execute(f'INSERT OR REPLACE INTO {resource} VALUES (?, ?, ?, ?, ?, ?)', (
+            instance['id'], instance['path'], instance.get('version'), instance.get('size'),
+            dataset_id, json.dumps(instance)
+        ))
+        self.connection.execute('DELETE FROM specifiers WHERE id = ?', (instance['id'], ))
+        self.connection.executemany('INSERT INTO specifiers VALUES (?, ?, ?, ?)', [
+            (resource, instance['id'], key, str(value))
+            for key, value in (instance.get('specifiers') or {}).items()
+        ])
+
+    def remove_dataset(self, dataset_id):
+        self.connection.execute('DELETE FROM specifiers WHERE id IN (SELECT id FROM files WHERE dataset = ?)',
+                                (dataset_id, ))
+        self.connection.execute('DELETE FROM files WHERE dataset = ?', (dataset_id, ))
+        self.connection.execute('DELETE FROM specifiers WHERE id = ?', (dataset_id, ))
+        self.connection.execute('DELETE FROM datasets WHERE id = ?', (dataset_id, ))
+
+    def get_path_filter(self, path):
+        # a range instead of LIKE, so that the index on the path is used
+        if path:
+            return 'path >= ? AND path < ?', (path, path + '\uffff')
+        else:
+            return '1', ()
+
+    def get_filter(self, resource, filters):
+        where, params = self.get_path_filter(filters.pop('path', ''))
+        where, params = [where], list(params)
+
+        if filters.get('query'):
+            where.append('path LIKE ?')
+            params.append('%{}%'.format(filters.pop('query')))
+        filters.pop('query', None)
+
+        if filters.get('version'):
+            where.append('version = ?')
+            params.append(filters.pop('version'))
+
+        # all other filters are specifiers, a list of values matches any of them
+        for key, values in filters.items():
+            values = [str(value) for value in (values if isinstance(values, (list, tuple, set)) else [values])]
+            where.append('id IN (SELECT id FROM specifiers WHERE resource = ? AND key = ? AND value IN ({}))'
+                         .format(', '.join('?' * len(values))))
+            params += [resource, key, *values]
+
+        return ' AND '.join(where), params
+
+    def list(self, resource, max_results=None, **filters):
+        where, params = self.get_filter(resource, filters)
+        sql = f'SELECT data FROM {resource} WHERE {where} ORDER BY path'
+        if max_results is not None:
+            sql += f' LIMIT {int(max_results)}'
+
+        with self.lock:
+            return [json.loads(row[0]) for row in self.connection.execute(sql, params)]
+
+    def retrieve(self, resource, pk):
+        with self.lock:
+            row = self.connection.execute(f'SELECT data FROM {resource} WHERE id = ?', (str(pk), )).fetchone()
+        if row:
+            return json.loads(row[0])
+
+    def count(self, resource, **filters):
+        where, params = self.get_filter(resource, filters)
+        with self.lock:
+            return self.connection.execute(f'SELECT COUNT(*) FROM {resource} WHERE {where}', params).fetchone()[0]
+
+    def facets(self, resource, keys=None, **filters):
+        # the number of datasets or files for every value of every specifier, e.g.
+        # {'climate_variable': {'pr': 10, 'tas': 10}, ...}
+        where, params = self.get_filter(resource, filters)
+        sql = f'''
+            SELECT key, value, COUNT(*) FROM specifiers
+            WHERE resource = ? AND id IN (SELECT id FROM {resource} WHERE {where})
+        '''
+        params = [resource, *params]
+        if keys:
+            sql += ' AND key IN ({})'.format(', '.join('?' * len(keys)))
+            params += list(keys)
+        sql += ' GROUP BY key, value ORDER BY key, value'
+
+        facets = {}
+        with self.lock:
+            for key, value, count in self.connection.execute(sql, params):
+                facets.setdefault(key, {})[value] = count
+        return facets
+
+    def stats(self):
+        with self.lock:
+            return {
+                'path': str(self.path),
+                'datasets': self.connection.execute('SELECT COUNT(*) FROM datasets').fetchone()[0],
+                'files': self.connection.execute('SELECT COUNT(*) FROM files').fetchone()[0],
+                'snapshots': [
+                    dict(zip(['path', 'updated', 'datasets', 'files'], row))
+                    for row in self.connection.execute('SELECT * FROM snapshots ORDER BY path')
+                ]
+            }
+
+    def clear(self):
+        with self.lock:
+            for table in [*self.resources, 'specifiers', 'snapshots']:
+                self.connection.execute(f'DELETE FROM {table}')
+            self.connection.commit()
+            self.connection.execute('VACUUM')
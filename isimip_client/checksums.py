@@ -0,0 +1,70 @@
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+
+from .cache import get_cache_dir
+
+
+def compute_checksum(file_path, m=None):
+    m = m or hashlib.sha512()
+    with open(file_path, 'rb') as fp:
+        # read and update in blocks of 64K
+        for block in iter(lambda: fp.read(65536), b''):
+            m.update(block)
+    return m
+
+
+class ChecksumIndex:
+    # the index stores the checksums of verified files together with their size and mtime,
+    # so that unchanged files do not need to be hashed again
+
+    def __init__(self, path=None):
+        self.path = Path(path).expanduser() if path else get_cache_dir() / 'checksums.sqlite'
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS checksums (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime INTEGER,
+                checksum TEXT
+            )
+        ''')
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def get(self, file_path):
+        file_path = Path(file_path).resolve()
+        try:
+            stat = file_path.stat()
+        except FileNotFoundError:
+            return None
+
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT size, mtime, checksum FROM checksums WHERE path = ?', (str(file_path), )
+            ).fetchone()
+
+        if row is not None:
+            size, mtime, checksum = row
+            if size == stat.st_size and mtime == stat.st_mtime_ns:
+                return checksum
+
+    def set(self, file_path, checksum):
+        file_path = Path(file_path).resolve()
+        stat = file_path.stat()
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?)',
+                                    (str(file_path), stat.st_size, stat.st_mtime_ns, checksum))
+            self.connection.commit()
+
+    def remove(self, file_path):
+        file_path = Path(file_path).resolve()
+        with self.lock:
+            self.connection.execute('DELETE FROM checksums WHERE path = ?', (str(file_path), ))
+            self.connection.commit()
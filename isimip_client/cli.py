@@ -1,39 +1,131 @@
+import json
 import logging
 import os
+import shlex
+import sys
 
 import click
-from rich import print_json
-from rich.logging import RichHandler
 
-from .client import ISIMIPClient
-from .utils import SearchArgumentType, print_details_table, print_results_table
+from .utils import SearchArgumentType, print_details_table, print_results_table, read_ids
+
+# the client, rich and the helper modules are only imported when a command needs them,
+# so that the startup (e.g. for --help) stays fast
+
+
+def get_client(ctx, catalog=False):
+    # the client is created on first use and shared by all commands of the (shell) session
+    if ctx.obj.get('client') is None:
+        from rich.logging import RichHandler
+
+        from .client import ISIMIPClient
+
+        logging.basicConfig(level=ctx.obj['log_level'].upper(), format='%(message)s', handlers=[RichHandler()])
+
+        if ctx.obj['cache']:
+            from .cache import MetadataCache
+            cache = MetadataCache(os.getenv('ISIMIP_CACHE_PATH'))
+        else:
+            cache = None
+
+        if ctx.obj['rate_limit'] or ctx.obj['max_in_flight']:
+            # the database can be put on a shared file system to coordinate several nodes
+            from .ratelimit import RateLimiter
+            # only the given limits are applied
+            rate_limiter = RateLimiter(os.getenv('ISIMIP_RATE_LIMIT_PATH'), rate=ctx.obj['rate_limit'] or 0,
+                                       max_in_flight=ctx.obj['max_in_flight'] or 0)
+        else:
+            rate_limiter = None
+
+        ctx.obj['client'] = ISIMIPClient(
+            data_url=os.getenv('ISIMIP_DATA_URL', 'https://data.isimip.org/api/v1'),
+            files_api_url=os.getenv('ISIMIP_FILES_API_URL', 'https://files.isimip.org/api/v2'),
+            files_api_version=os.getenv('ISIMIP_FILES_API_VERSION', 'v2'),
+            cache=cache,
+            rate_limiter=rate_limiter,
+            mirror=ctx.obj['mirror'],
+            backend=ctx.obj['backend']
+        )
+
+    client = ctx.obj['client']
+    for hook in ctx.obj.pop('hooks', []):
+        client.add_hook(hook)
+
+    if catalog and client.catalog is None:
+        from .catalog import Catalog
+        client.catalog = Catalog(os.getenv('ISIMIP_CATALOG_PATH'))
+
+    return client
 
 
 @click.group()
 @click.option('--log-level', default='WARNING')
+@click.option('--cache/--no-cache', default=False, envvar='ISIMIP_CACHE')
+@click.option('--stats', is_flag=True)
+@click.option('--backend', type=click.Choice(['remote', 'local', 'auto']), default='remote',
+              envvar='ISIMIP_BACKEND')
+@click.option('--rate-limit', type=float, envvar='ISIMIP_RATE_LIMIT')
+@click.option('--max-in-flight', type=int, envvar='ISIMIP_MAX_IN_FLIGHT')
 @click.pass_context
-def main(ctx, log_level):
-    logging.basicConfig(level=log_level.upper(), format='%(message)s', handlers=[RichHandler()])
-
+def main(ctx, log_level, cache, stats, backend, rate_limit, max_in_flight):
     ctx.ensure_object(dict)
-    ctx.obj['client'] = ISIMIPClient(
-        data_url=os.getenv('ISIMIP_DATA_URL', 'https://data.isimip.org/api/v1'),
-        files_api_url=os.getenv('ISIMIP_FILES_API_URL', 'https://files.isimip.org/api/v2'),
-        files_api_version=os.getenv('ISIMIP_FILES_API_VERSION', 'v2'),
-    )
+    ctx.obj.update(log_level=log_level, cache=cache, backend=backend, rate_limit=rate_limit,
+                   max_in_flight=max_in_flight)
+
+    if backend != 'remote' and os.getenv('ISIMIP_MIRROR_PATH'):
+        from .local import LocalBackend
+        ctx.obj['mirror'] = LocalBackend(os.getenv('ISIMIP_MIRROR_PATH'),
+                                         output_path=os.getenv('ISIMIP_MIRROR_OUTPUT_PATH'),
+                                         landseamask=os.getenv('ISIMIP_LANDSEAMASK_PATH'))
+    else:
+        ctx.obj['mirror'] = None
+
+    if stats:
+        from .stats import Stats
+
+        # the summary is printed to stderr, so that it does not mix with the output
+        collector = Stats()
+        ctx.obj.setdefault('hooks', []).append(collector)
+        ctx.call_on_close(lambda: click.echo(json.dumps(collector.summary(), indent=2), err=True))
 
 
 @main.result_callback()
 @click.pass_context
 def print_response(ctx, response, **kwargs):
     if response:
-        if ctx.obj.get('download'):
-            if 'file_url' in response:
-                ctx.obj['client'].download(response['file_url'], validate=False, extract=False)
+        from .resultset import ResultSet
+
+        if ctx.obj.get('stream'):
+            for result in response:
+                click.echo(json.dumps(result))
+        elif ctx.obj.get('download'):
+            if isinstance(response, list):
+                # the paths were split into several jobs, the chunks which could not be submitted are None
+                results = get_client(ctx).download_many([job['file_url'] for job in response
+                                                         if job and 'file_url' in job])
+                failed = {result['url']: result['error'] for result in results if result['status'] == 'failed'}
+
+                missing = []
+                for index, job in enumerate(response):
+                    if not job:
+                        missing.append(f'{index} (not submitted)')
+                    elif 'file_url' not in job:
+                        missing.append(f'{index} (job {job["status"]})')
+                    elif job['file_url'] in failed:
+                        missing.append(f'{index} (download failed: {failed[job["file_url"]]})')
+                if missing:
+                    raise click.ClickException(f'{len(missing)} of {len(response)} chunks were not downloaded: '
+                                               + ', '.join(missing))
+            elif 'file_url' in response:
+                get_client(ctx).download(response['file_url'], validate=False, extract=False)
+            else:
+                # the job was run by the local backend
+                from rich import print_json
+                print_json(data=response)
         elif ctx.obj.get('json'):
-            print_json(data=response)
+            from rich import print_json
+            print_json(data=response.to_list() if isinstance(response, ResultSet) else response)
         else:
-            if isinstance(response, list):
+            if isinstance(response, (list, ResultSet)):
                 print_results_table(response)
             elif 'results' in response:
                 print_results_table(response['results'])
@@ -45,36 +137,303 @@ def print_response(ctx, response, **kwargs):
 @click.pass_context
 @click.argument('search', nargs=-1, type=SearchArgumentType())
 @click.option('--json', is_flag=True)
-def datasets(ctx, search, json, **kwargs):
+@click.option('--stream', is_flag=True)
+@click.option('--columnar', is_flag=True)
+@click.option('--local', is_flag=True)
+def datasets(ctx, search, json, stream, columnar, local, **kwargs):
     ctx.obj['json'] = json
-    return ctx.obj['client'].datasets(**dict(search, **kwargs))
+    ctx.obj['stream'] = stream
+    client = get_client(ctx, catalog=local)
+    if local:
+        return client.datasets(local=True, **dict(search, columnar=columnar, **kwargs))
+    elif stream:
+        return client.iter_datasets(**dict(search, **kwargs))
+    else:
+        return client.datasets(**dict(search, columnar=columnar, **kwargs))
 
 
 @main.command()
 @click.pass_context
-@click.argument('id', type=click.UUID)
+@click.argument('ids', nargs=-1, type=click.STRING, required=True)
 @click.option('--json', is_flag=True)
-def dataset(ctx, id, json):
+@click.option('--local', is_flag=True)
+def dataset(ctx, ids, json, local):
     ctx.obj['json'] = json
-    return ctx.obj['client'].dataset(id)
+    client = get_client(ctx, catalog=local)
+
+    ids = read_ids(ids)
+    if len(ids) == 1:
+        return client.dataset(click.UUID.convert(ids[0], None, ctx), local=local)
+    else:
+        return client.datasets_by_id(ids, local=local)
 
 
 @main.command()
 @click.pass_context
 @click.argument('search', nargs=-1, type=SearchArgumentType())
 @click.option('--json', is_flag=True)
-def files(ctx, search, json, **kwargs):
+@click.option('--stream', is_flag=True)
+@click.option('--columnar', is_flag=True)
+@click.option('--local', is_flag=True)
+def files(ctx, search, json, stream, columnar, local, **kwargs):
     ctx.obj['json'] = json
-    return ctx.obj['client'].files(**dict(search, **kwargs))
+    ctx.obj['stream'] = stream
+    client = get_client(ctx, catalog=local)
+    if local:
+        return client.files(local=True, **dict(search, columnar=columnar, **kwargs))
+    elif stream:
+        return client.iter_files(**dict(search, **kwargs))
+    else:
+        return client.files(**dict(search, columnar=columnar, **kwargs))
 
 
 @main.command()
 @click.pass_context
-@click.argument('id', type=click.UUID)
+@click.argument('ids', nargs=-1, type=click.STRING, required=True)
 @click.option('--json', is_flag=True)
-def file(ctx, id, json):
+@click.option('--local', is_flag=True)
+def file(ctx, ids, json, local):
     ctx.obj['json'] = json
-    return ctx.obj['client'].file(id)
+    client = get_client(ctx, catalog=local)
+
+    ids = read_ids(ids)
+    if len(ids) == 1:
+        return client.file(click.UUID.convert(ids[0], None, ctx), local=local)
+    else:
+        return client.files_by_id(ids, local=local)
+
+
+@main.command()
+@click.pass_context
+@click.argument('urls', nargs=-1, type=click.STRING)
+@click.option('--path', type=click.Path(), default=None)
+@click.option('--workers', type=click.INT, default=4)
+@click.option('--segment-size', type=click.INT, default=64)
+def download(ctx, urls, path, workers, segment_size):
+    from rich.progress import DownloadColumn, Progress, TransferSpeedColumn
+
+    ctx.obj['json'] = True
+    client = get_client(ctx)
+    with Progress(*Progress.get_default_columns(), DownloadColumn(), TransferSpeedColumn()) as progress:
+        task = progress.add_task('download', total=None)
+        return client.download_many(
+            urls, path=path, workers=workers, segment_size=segment_size * 1024 * 1024,
+            callback=lambda done, total: progress.update(task, completed=done, total=total)
+        )
+
+
+@main.command()
+@click.pass_context
+@click.argument('path', type=click.STRING)
+@click.argument('dest', type=click.Path())
+@click.option('--workers', type=click.INT, default=4)
+@click.option('--prune', is_flag=True)
+@click.option('--dry-run', is_flag=True)
+def sync(ctx, path, dest, workers, prune, dry_run):
+    from rich.progress import DownloadColumn, Progress, TransferSpeedColumn
+
+    ctx.obj['json'] = True
+    client = get_client(ctx)
+    with Progress(*Progress.get_default_columns(), DownloadColumn(), TransferSpeedColumn()) as progress:
+        task = progress.add_task('sync', total=None)
+        return client.sync(
+            path, dest, workers=workers, prune=prune, dry_run=dry_run,
+            callback=lambda done, total: progress.update(task, completed=done, total=total)
+        )
+
+
+@main.group()
+def cache():
+    pass
+
+
+@cache.command(name='stats')
+@click.pass_context
+def cache_stats(ctx):
+    from .cache import MetadataCache
+
+    ctx.obj['json'] = True
+    return MetadataCache(os.getenv('ISIMIP_CACHE_PATH')).stats()
+
+
+@cache.command(name='clear')
+def cache_clear():
+    from .cache import MetadataCache
+
+    MetadataCache(os.getenv('ISIMIP_CACHE_PATH')).clear()
+
+
+@main.group()
+@click.pass_context
+def catalog(ctx):
+    pass
+
+
+@catalog.command(name='refresh')
+@click.pass_context
+@click.argument('path', type=click.STRING, default='')
+@click.option('--workers', type=click.INT, default=8)
+def catalog_refresh(ctx, path, workers):
+    ctx.obj['json'] = True
+    return get_client(ctx, catalog=True).refresh_catalog(path, workers=workers)
+
+
+@catalog.command(name='facets')
+@click.pass_context
+@click.argument('search', nargs=-1, type=SearchArgumentType())
+@click.option('--resource', type=click.Choice(['datasets', 'files']), default='files')
+@click.option('--key', 'keys', multiple=True)
+def catalog_facets(ctx, search, resource, keys):
+    ctx.obj['json'] = True
+    return get_client(ctx, catalog=True).facets(resource, keys=keys, **dict(search))
+
+
+@catalog.command(name='stats')
+@click.pass_context
+def catalog_stats(ctx):
+    ctx.obj['json'] = True
+    return get_client(ctx, catalog=True).catalog.stats()
+
+
+@catalog.command(name='clear')
+@click.pass_context
+def catalog_clear(ctx):
+    get_client(ctx, catalog=True).catalog.clear()
+
+
+@main.command()
+@click.pass_context
+@click.argument('specs', type=click.File('r'), default='-')
+@click.option('--path', type=click.Path(), default=None)
+@click.option('--max-jobs', type=click.INT, default=8)
+@click.option('--poll', type=click.INT, default=2)
+@click.option('--poll-max', type=click.INT, default=60)
+@click.option('--download/--no-download', default=True)
+def batch(ctx, specs, path, max_jobs, poll, poll_max, download):
+    # reads one spec per line (see JobBatch) and prints the status of the jobs as newline delimited JSON
+    specs_list = read_specs(specs)
+
+    def echo(status):
+        click.echo(json.dumps(status))
+        sys.stdout.flush()
+
+    jobs = get_client(ctx).run_batch(specs_list, max_jobs=max_jobs, poll=poll, poll_max=poll_max, path=path,
+                                     download=download, callback=echo)
+
+    if any(job['status'] != 'finished' for job in jobs):
+        ctx.exit(1)
+
+
+def read_specs(specs):
+    specs_list = []
+    for line_number, line in enumerate(specs, 1):
+        if line.strip():
+            try:
+                specs_list.append(json.loads(line))
+            except ValueError as e:
+                raise click.ClickException(f'line {line_number} is not valid JSON ({e})') from e
+    return specs_list
+
+
+@main.group()
+def shard():
+    pass
+
+
+@shard.command(name='files')
+@click.pass_context
+@click.argument('search', nargs=-1, type=SearchArgumentType())
+@click.option('--shard', 'shard_id', required=True, envvar='ISIMIP_SHARD')
+@click.option('--state', type=click.Path(file_okay=False), required=True, envvar='ISIMIP_SHARD_STATE')
+@click.option('--path', type=click.Path(), default=None)
+@click.option('--workers', type=click.INT, default=4)
+@click.option('--segment-size', type=click.INT, default=64)
+@click.option('--lease', type=click.INT, default=600)
+def shard_files(ctx, search, shard_id, state, path, workers, segment_size, lease):
+    # downloads the files of one shard of the listing and prints the completed files as newline delimited JSON
+    from .shard import parse_shard
+
+    try:
+        parse_shard(shard_id)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--shard') from e
+
+    client = get_client(ctx)
+    try:
+        entries = client.download_shard(list(client.iter_files(**dict(search))), state, shard_id, path=path,
+                                        workers=workers, segment_size=segment_size * 1024 * 1024, lease=lease,
+                                        callback=lambda entry: click.echo(json.dumps(entry)))
+    except RuntimeError as e:
+        # the listing differs from the listing of the other workers
+        raise click.ClickException(str(e)) from e
+
+    if any(entry['result']['status'] not in ['finished', 'skipped'] for entry in entries):
+        ctx.exit(1)
+
+
+@shard.command(name='batch')
+@click.pass_context
+@click.argument('specs', type=click.File('r'), default='-')
+@click.option('--shard', 'shard_id', required=True, envvar='ISIMIP_SHARD')
+@click.option('--state', type=click.Path(file_okay=False), required=True, envvar='ISIMIP_SHARD_STATE')
+@click.option('--path', type=click.Path(), default=None)
+@click.option('--max-jobs', type=click.INT, default=8)
+@click.option('--poll', type=click.INT, default=2)
+@click.option('--poll-max', type=click.INT, default=60)
+@click.option('--download/--no-download', default=True)
+@click.option('--lease', type=click.INT, default=600)
+def shard_batch(ctx, specs, shard_id, state, path, max_jobs, poll, poll_max, download, lease):
+    # like batch, but only for one shard of the specs, the completed specs are printed as newline delimited JSON
+    from .shard import parse_shard
+
+    try:
+        parse_shard(shard_id)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--shard') from e
+
+    specs_list = read_specs(specs)
+    try:
+        entries = get_client(ctx).run_batch_shard(specs_list, state, shard_id, max_jobs=max_jobs, poll=poll,
+                                                  poll_max=poll_max, path=path, download=download, lease=lease,
+                                                  callback=lambda entry: click.echo(json.dumps(entry)))
+    except RuntimeError as e:
+        raise click.ClickException(str(e)) from e
+
+    if any(entry['result']['status'] != 'finished' for entry in entries):
+        ctx.exit(1)
+
+
+@shard.command(name='report')
+@click.pass_context
+@click.option('--state', type=click.Path(file_okay=False, exists=True), required=True, envvar='ISIMIP_SHARD_STATE')
+def shard_report(ctx, state):
+    from .shard import get_report
+
+    ctx.obj['json'] = True
+    return get_report(state)
+
+
+@shard.command(name='reset')
+@click.pass_context
+@click.option('--state', type=click.Path(file_okay=False, exists=True), required=True, envvar='ISIMIP_SHARD_STATE')
+def shard_reset(ctx, state):
+    from .shard import reset_failed
+
+    ctx.obj['json'] = True
+    return {'reset': reset_failed(state)}
+
+
+@main.command()
+@click.pass_context
+@click.argument('archives', nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option('--output', type=click.Path(file_okay=False), required=True)
+def aggregate(ctx, archives, output):
+    from .aggregate import ResultStore
+
+    ctx.obj['json'] = True
+    store = ResultStore(output)
+    store.add_many(archives)
+    return store.stats()
 
 
 @main.command(name='select_bbox')
@@ -87,9 +446,10 @@ def file(ctx, id, json):
 @click.option('--mean', is_flag=True)
 @click.option('--csv', is_flag=True)
 @click.option('--poll', type=click.INT, default=4)
+@click.option('--chunk-size', type=click.INT)
 def select_bbox(ctx, **kwargs):
     ctx.obj['download'] = True
-    return ctx.obj['client'].select_bbox(**kwargs)
+    return get_client(ctx).select_bbox(**kwargs)
 
 
 @main.command(name='select_point')
@@ -99,9 +459,10 @@ def select_bbox(ctx, **kwargs):
 @click.option('--lon', type=click.FLOAT, required=True)
 @click.option('--csv', is_flag=True)
 @click.option('--poll', type=click.INT, default=4)
+@click.option('--chunk-size', type=click.INT)
 def select_point(ctx, **kwargs):
     ctx.obj['download'] = True
-    return ctx.obj['client'].select_point(**kwargs)
+    return get_client(ctx).select_point(**kwargs)
 
 
 @main.command(name='mask_bbox')
@@ -114,9 +475,10 @@ def select_point(ctx, **kwargs):
 @click.option('--mean', is_flag=True)
 @click.option('--csv', is_flag=True)
 @click.option('--poll', type=click.INT, default=4)
+@click.option('--chunk-size', type=click.INT)
 def mask_bbox(ctx, **kwargs):
     ctx.obj['download'] = True
-    return ctx.obj['client'].mask_bbox(**kwargs)
+    return get_client(ctx).mask_bbox(**kwargs)
 
 
 @main.command(name='mask_country')
@@ -126,17 +488,19 @@ def mask_bbox(ctx, **kwargs):
 @click.option('--mean', is_flag=True)
 @click.option('--csv', is_flag=True)
 @click.option('--poll', type=click.INT, default=4)
+@click.option('--chunk-size', type=click.INT)
 def mask_country(ctx, **kwargs):
     ctx.obj['download'] = True
-    return ctx.obj['client'].mask_country(**kwargs)
+    return get_client(ctx).mask_country(**kwargs)
 
 
 @main.command(name='mask_landonly')
 @click.pass_context
 @click.argument('paths', nargs=-1, type=click.STRING)
+@click.option('--chunk-size', type=click.INT)
 def mask_landonly(ctx, **kwargs):
     ctx.obj['download'] = True
-    return ctx.obj['client'].mask_landonly(**kwargs)
+    return get_client(ctx).mask_landonly(**kwargs)
 
 
 @main.command(name='mask_mask')
@@ -147,9 +511,10 @@ def mask_landonly(ctx, **kwargs):
 @click.option('--mean', is_flag=True)
 @click.option('--csv', is_flag=True)
 @click.option('--poll', type=click.INT, default=4)
+@click.option('--chunk-size', type=click.INT)
 def mask_mask(ctx, **kwargs):
     ctx.obj['download'] = True
-    return ctx.obj['client'].mask_mask(**kwargs)
+    return get_client(ctx).mask_mask(**kwargs)
 
 
 @main.command(name='mask_shape')
@@ -160,9 +525,10 @@ def mask_mask(ctx, **kwargs):
 @click.option('--mean', is_flag=True)
 @click.option('--csv', is_flag=True)
 @click.option('--poll', type=click.INT, default=4)
+@click.option('--chunk-size', type=click.INT)
 def mask_shape(ctx, **kwargs):
     ctx.obj['download'] = True
-    return ctx.obj['client'].mask_shape(**kwargs)
+    return get_client(ctx).mask_shape(**kwargs)
 
 
 @main.command(name='cutout_bbox')
@@ -175,9 +541,10 @@ def mask_shape(ctx, **kwargs):
 @click.option('--mean', is_flag=True)
 @click.option('--csv', is_flag=True)
 @click.option('--poll', type=click.INT, default=4)
+@click.option('--chunk-size', type=click.INT)
 def cutout_bbox(ctx, **kwargs):
     ctx.obj['download'] = True
-    return ctx.obj['client'].cutout_bbox(**kwargs)
+    return get_client(ctx).cutout_bbox(**kwargs)
 
 
 @main.command(name='cutout_point')
@@ -187,6 +554,32 @@ def cutout_bbox(ctx, **kwargs):
 @click.option('--lon', type=click.FLOAT, required=True)
 @click.option('--csv', is_flag=True)
 @click.option('--poll', type=click.INT, default=4)
+@click.option('--chunk-size', type=click.INT)
 def cutout_point(ctx, **kwargs):
     ctx.obj['download'] = True
-    return ctx.obj['client'].cutout_point(**kwargs)
+    return get_client(ctx).cutout_point(**kwargs)
+
+
+@main.command()
+@click.pass_context
+@click.argument('commands', type=click.File('r'), default='-')
+def shell(ctx, commands):
+    # runs one command per line (e.g. "files climate_variable=tas --json") in this process, so that
+    # the startup, the connections and the caches of the client are shared by all commands
+    for line in commands:
+        args = shlex.split(line, comments=True)
+        if not args:
+            continue
+
+        # every command gets its own options, but the same client
+        obj = {'client': get_client(ctx)}
+        try:
+            main.main(args, prog_name=ctx.find_root().info_name, obj=obj, standalone_mode=False)
+        except click.ClickException as e:
+            e.show()
+        except click.Abort:
+            break
+        except Exception as e:
+            click.echo(f'Error: {e}', err=True)
+
+        sys.stdout.flush()
@@ -1,19 +1,173 @@
-import hashlib
 import json
 import logging
+import math
+import random
 import time
-import zipfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
 from urllib.parse import urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 
+# the helper modules are imported when they are used, so that importing the client (and
+# starting the command line client) stays fast
 logger = logging.getLogger(__name__)
 
 class HTTPClient:
 
-    def __init__(self, auth, headers):
+    retry_status = (429, 500, 502, 503, 504)
+    retry_exceptions = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+    # only idempotent requests are retried after every failure, other requests (e.g. the POST, which
+    # submits a job) only if the server did not get them (see can_retry), unless they are added here
+    retry_methods = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+
+    def __init__(self, auth, headers, timeout=(10, 60), retries=5, backoff=0.5, backoff_max=60, pool_size=10,
+                 hooks=None, rate_limiter=None, retry_methods=None):
         self.auth, self.headers = auth, headers or {}
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_methods = tuple(retry_methods or self.retry_methods)
+        self.backoff, self.backoff_max = backoff, backoff_max
+        self.hooks = list(hooks or [])
+
+        # the rate limiter is shared with other processes (see ratelimit.py)
+        if rate_limiter is True:
+            from .ratelimit import RateLimiter
+            rate_limiter = RateLimiter()
+        self.rate_limiter = rate_limiter or None
+
+        # a single session keeps the connections to the Data API, the Files API and the
+        # file server alive, so that consecutive requests do not need new TCP/TLS handshakes
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def emit(self, event, **data):
+        # hooks are called with the name of the event and a dict, e.g. hook('request', {'url': ...})
+        for hook in self.hooks:
+            hook(event, data)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('auth', self.auth)
+        kwargs.setdefault('headers', self.headers)
+        kwargs.setdefault('timeout', self.timeout)
+
+        start_time = time.perf_counter()
+        attempt = 0
+        while True:
+            if attempt and hasattr(kwargs.get('data'), 'seek'):
+                # rewind streamed request bodies before they are sent again
+                kwargs['data'].seek(0)
+
+            slot = self.rate_limiter.acquire(url) if self.rate_limiter else None
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except self.retry_exceptions as e:
+                self.release_slot(slot)
+                if attempt >= self.retries or not self.can_retry(method, sent=self.is_sent(e)):
+                    if self.hooks:
+                        self.emit('request', method=method, url=url, status=None, time=time.perf_counter() - start_time,
+                                  bytes=0, retries=attempt, error=repr(e))
+                    raise
+                logger.warning('%s url=%s failed (%s), retrying', method, url, e)
+                delay = self.get_backoff(attempt)
+            else:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug('%s url=%s status=%s pool=%s', method, url, response.status_code,
+                                 self.connection_stats())
+                if response.status_code not in self.retry_status or attempt >= self.retries or \
+                        not self.can_retry(method, response=response):
+                    if self.hooks:
+                        # the body of streamed responses is counted by the download events
+                        self.emit('request', method=method, url=url, status=response.status_code,
+                                  time=time.perf_counter() - start_time, retries=attempt, error=None,
+                                  bytes=0 if kwargs.get('stream') else len(response.content))
+                    if kwargs.get('stream'):
+                        self.hold_slot(response, slot)
+                    else:
+                        self.release_slot(slot)
+                    return response
+                logger.warning('%s url=%s status=%s, retrying', method, url, response.status_code)
+                delay = self.get_backoff(attempt, response)
+                response.close()
+                self.release_slot(slot)
+                if self.rate_limiter and self.is_throttled(response):
+                    self.rate_limiter.throttle(url, delay)
+
+            time.sleep(delay)
+            attempt += 1
+
+    def release_slot(self, slot):
+        if slot is not None:
+            self.rate_limiter.release(slot)
+
+    def hold_slot(self, response, slot):
+        # streamed responses keep their slot until the body was read and the response is closed
+        if slot is not None:
+            close = response.close
+
+            def release():
+                close()
+                self.rate_limiter.release(slot)
+
+            response.close = release
+
+    def can_retry(self, method, response=None, sent=True):
+        # the server did not get the request, if the connection could not be established,
+        # and did not process it, if it answered with 429
+        return method.upper() in self.retry_methods or not sent or \
+            (response is not None and response.status_code == 429)
+
+    def is_sent(self, exception):
+        # a refused connection, a failed name resolution or a connect timeout happen before the request is sent
+        if isinstance(exception, requests.exceptions.ConnectTimeout):
+            return False
+        reason = getattr(exception.args[0], 'reason', None) if exception.args else None
+        return not isinstance(reason, NewConnectionError)
+
+    def is_throttled(self, response):
+        return response.status_code == 429 or \
+            (response.status_code == 503 and 'Retry-After' in response.headers)
+
+    def get_backoff(self, attempt, response=None):
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                return min(int(retry_after), self.backoff_max)
+
+        # exponential backoff with jitter
+        return min(self.backoff * 2 ** attempt, self.backoff_max) * random.uniform(0.5, 1.5)
+
+    def connection_stats(self):
+        # number of connections opened and requests sent per host, if the number of
+        # requests exceeds the number of connections, connections have been reused
+        stats = {}
+        for adapter in self.session.adapters.values():
+            for key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools[key]
+                stats[pool.host] = {
+                    'connections': pool.num_connections,
+                    'requests': pool.num_requests
+                }
+        return stats
 
     def parse_response(self, response):
         try:
@@ -21,47 +175,52 @@ class HTTPClient:
             return response.json()
         except requests.exceptions.HTTPError as e:
             try:
-                logger.error(f'{e} response={response.json()}')
+                logger.error('%s response=%s', e, response.json())
             except json.decoder.JSONDecodeError as e:
-                logger.error(f'{e} content={response.content}')
+                logger.error('%s content=%s', e, response.content)
         except json.decoder.JSONDecodeError as e:
-            logger.error(f'{e} content={response.content}')
+            logger.error('%s content=%s', e, response.content)
 
     def get(self, url, params=None):
         params = params or {}
-        logger.info(f'GET url={url} params={params}')
-        response = requests.get(url, params=params, auth=self.auth, headers=self.headers)
+        logger.info('GET url=%s params=%s', url, params)
+        response = self.request('GET', url, params=params)
         return self.parse_response(response)
 
     def post(self, url, data):
-        logger.info(f'POST url={url} data={data}')
-        response = requests.post(url, json=data, auth=self.auth, headers=self.headers)
+        logger.info('POST url=%s data=%s', url, data)
+        response = self.request('POST', url, json=data)
         return self.parse_response(response)
 
     def put(self, url, data):
-        logger.info(f'PUT url={url} data={data}')
-        response = requests.put(url, data, auth=self.auth, headers=self.headers)
+        logger.info('PUT url=%s data=%s', url, data)
+        response = self.request('PUT', url, data=data)
         return self.parse_response(response)
 
     def patch(self, url, data):
-        logger.info(f'PATCH url={url} data={data}')
-        response = requests.patch(url, json=data, auth=self.auth, headers=self.headers)
+        logger.info('PATCH url=%s data=%s', url, data)
+        response = self.request('PATCH', url, json=data)
         return self.parse_response(response)
 
     def delete(self, url):
-        logger.info(f'DELETE url={url}')
-        response = requests.delete(url, auth=self.auth, headers=self.headers)
+        logger.info('DELETE url=%s', url)
+        response = self.request('DELETE', url)
         return self.parse_response(response)
 
 
 class RESTClient(HTTPClient):
 
     max_results = 1000
-    page_size = 100
+    page_size = 1000
+    max_workers = 8
 
-    def __init__(self, base_url, *args, **kwargs):
+    def __init__(self, base_url, *args, cache=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.base_url = base_url
+        if cache is True:
+            from .cache import MetadataCache
+            cache = MetadataCache()
+        self.cache = cache or None
 
     def build_url(self, resource_url, kwargs, pk=None):
         url = self.base_url.rstrip('/') + resource_url.rstrip('/') + '/'
@@ -82,25 +241,144 @@ class RESTClient(HTTPClient):
 
     def list(self, resource_url, **kwargs):
         paginate = kwargs.pop('paginate', False)
+        columnar = kwargs.pop('columnar', False)
+        max_results = kwargs.pop('max_results', self.max_results)
         url = self.build_url(resource_url, kwargs)
-        response = self.get(url, params=kwargs)
 
         if paginate:
-            return response
+            return self.get_cached(url, kwargs, resource_url)
         else:
-            results = response['results']
-            while len(results) < self.max_results:
+            kwargs.setdefault('page_size', self.page_size)
+            response = self.get_page(url, kwargs, resource_url)
+
+            # with columnar=True, the pages are added to a ResultSet as soon as they arrive
+            if columnar:
+                from .resultset import ResultSet
+                results = ResultSet(response['results'])
+            else:
+                results = response['results']
+            if response.get('next'):
+                # the first response contains the total count, so that the remaining pages
+                # can be fetched concurrently, the server might reduce the page_size though
+                pages = self.get_pages(response, kwargs, max_results)
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    for response in executor.map(
+                        lambda page: self.get_page(url, dict(kwargs, page=page), resource_url), pages
+                    ):
+                        results.extend(response['results'])
+            return results
+
+    def iter_list(self, resource_url, prefetch=True, **kwargs):
+        max_results = kwargs.pop('max_results', None)
+        url = self.build_url(resource_url, kwargs)
+        kwargs.setdefault('page_size', self.page_size)
+
+        # only the current page is kept in memory, while the next page is optionally
+        # fetched in the background
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            response = self.get_page(url, kwargs, resource_url)
+            count = 0
+            while True:
+                if response is None:
+                    # stop instead of silently truncating the results
+                    raise RuntimeError(f'Could not fetch all results for url={url}')
+
                 next_url = response.get('next')
+                future = executor.submit(self.get_page, next_url, None, resource_url) \
+                    if (prefetch and next_url) else None
+
+                for result in response['results']:
+                    if max_results is not None and count >= max_results:
+                        return
+                    yield result
+                    count += 1
+
                 if next_url:
-                    response = self.get(next_url)
-                    results += response['results']
+                    response = future.result() if future else self.get_page(next_url, None, resource_url)
                 else:
                     break
-            return results
+
+    def get_page(self, url, params=None, resource_url=None):
+        start_time = time.perf_counter()
+        response = self.get_cached(url, params, resource_url)
+        if self.hooks and response is not None:
+            self.emit('page', url=url, params=params, results=len(response['results']), count=response.get('count'),
+                      time=time.perf_counter() - start_time)
+        return response
+
+    def get_cached(self, url, params=None, resource_url=None):
+        if self.cache is None:
+            return self.get(url, params=params)
+
+        params = params or {}
+        key = self.cache.get_key(url, params)
+        ttl = self.cache.get_ttl(resource_url)
+
+        entry = self.cache.get(key)
+        if entry and not entry['expired']:
+            logger.info('GET url=%s params=%s cached', url, params)
+            self.emit('cache', url=url, status='hit')
+            return entry['data']
+
+        # revalidate an expired entry using a conditional request
+        headers = self.headers.copy()
+        if entry and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        logger.info('GET url=%s params=%s', url, params)
+        response = self.request('GET', url, params=params, headers=headers)
+        if entry and response.status_code == 304:
+            self.cache.touch(key, ttl)
+            self.emit('cache', url=url, status='revalidated')
+            return entry['data']
+
+        self.emit('cache', url=url, status='miss')
+
+        data = self.parse_response(response)
+        if data is not None:
+            self.cache.set(key, data, ttl, etag=response.headers.get('ETag'),
+                           last_modified=response.headers.get('Last-Modified'))
+        return data
+
+    def get_pages(self, response, params, max_results):
+        page_size = len(response['results'])
+        first_page = int(params.get('page', 1))
+        count = response['count'] - (first_page - 1) * page_size
+        if max_results is not None:
+            count = min(count, max_results)
+        last_page = first_page + math.ceil(count / page_size) - 1
+        return range(first_page + 1, last_page + 1)
 
     def retrieve(self, resource_url, pk, **kwargs):
         url = self.build_url(resource_url, kwargs, pk)
-        return self.get(url)
+        return self.get_cached(url, None, resource_url)
+
+    def retrieve_many(self, resource_url, pks, **kwargs):
+        # every id is only fetched once and cached responses are used, the results are returned in
+        # the order of the ids, failed or invalid ids are returned as {'id': ..., 'error': ...}
+        pks = [str(pk) for pk in pks]
+        unique_pks = [pk for pk in dict.fromkeys(pks) if not self.get_id_error(pk)]
+
+        def retrieve(pk):
+            try:
+                return self.retrieve(resource_url, pk, **dict(kwargs))
+            except requests.exceptions.RequestException as e:
+                logger.error('GET pk=%s failed (%s)', pk, e)
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = dict(zip(unique_pks, executor.map(retrieve, unique_pks)))
+
+        return [results.get(pk) or {'id': pk, 'error': self.get_id_error(pk) or 'could not be retrieved'}
+                for pk in pks]
+
+    def get_id_error(self, pk):
+        try:
+            uuid.UUID(pk)
+        except ValueError:
+            return 'invalid id'
 
     def create(self, resource_url, data, **kwargs):
         url = self.build_url(resource_url, kwargs)
@@ -117,18 +395,75 @@ class RESTClient(HTTPClient):
 
 class DataApiMixin:
 
-    def datasets(self, **kwargs):
+    def datasets(self, local=False, **kwargs):
+        if local:
+            return self.list_local('datasets', **kwargs)
         return self.list('/datasets', **kwargs)
 
-    def dataset(self, pk, **kwargs):
+    def iter_datasets(self, **kwargs):
+        return self.iter_list('/datasets', **kwargs)
+
+    def dataset(self, pk, local=False, **kwargs):
+        if local:
+            return self.get_catalog().retrieve('datasets', pk)
         return self.retrieve('/datasets', pk, **kwargs)
 
-    def files(self, **kwargs):
+    def datasets_by_id(self, pks, local=False, **kwargs):
+        if local:
+            return self.retrieve_many_local('datasets', pks)
+        return self.retrieve_many('/datasets', pks, **kwargs)
+
+    def files(self, local=False, **kwargs):
+        if local:
+            return self.list_local('files', **kwargs)
         return self.list('/files', **kwargs)
 
-    def file(self, pk, **kwargs):
+    def iter_files(self, **kwargs):
+        return self.iter_list('/files', **kwargs)
+
+    def file(self, pk, local=False, **kwargs):
+        if local:
+            return self.get_catalog().retrieve('files', pk)
         return self.retrieve('/files', pk, **kwargs)
 
+    def files_by_id(self, pks, local=False, **kwargs):
+        if local:
+            return self.retrieve_many_local('files', pks)
+        return self.retrieve_many('/files', pks, **kwargs)
+
+    def facets(self, resource='files', keys=None, **kwargs):
+        catalog = self.get_catalog()
+        return {
+            'count': catalog.count(resource, **kwargs),
+            'facets': catalog.facets(resource, keys=keys, **kwargs)
+        }
+
+    def refresh_catalog(self, path='', workers=8):
+        return self.get_catalog().refresh(self, path, workers=workers)
+
+    def list_local(self, resource, **kwargs):
+        # the pagination arguments have no meaning for the catalog
+        for key in ['paginate', 'page', 'page_size']:
+            kwargs.pop(key, None)
+        columnar = kwargs.pop('columnar', False)
+        max_results = kwargs.pop('max_results', self.max_results)
+
+        results = self.get_catalog().list(resource, max_results=max_results, **kwargs)
+        if columnar:
+            from .resultset import ResultSet
+            return ResultSet(results)
+        return results
+
+    def retrieve_many_local(self, resource, pks):
+        catalog = self.get_catalog()
+        return [catalog.retrieve(resource, pk) or {'id': str(pk), 'error': 'not found in catalog'} for pk in pks]
+
+    def get_catalog(self):
+        if getattr(self, 'catalog', None) is None:
+            raise RuntimeError('The local search needs a catalog. Please set "catalog=True" '
+                               'and use "refresh_catalog(path)" first.')
+        return self.catalog
+
 
 class FilesApiMixin:
 
@@ -138,21 +473,31 @@ class FilesApiMixin:
                                f'Please set "files_api_version=\'{version}\'".')
 
     def post_job(self, data, uploads=None, poll=None):
-        logger.info(f'job submitted data={data} uploads={uploads}')
+        if self.results is not None and poll:
+            # the result of the job is only stored when it is polled until it is finished
+            return self.results.run(self, data, uploads, poll)
+        else:
+            return self.send_job(data, uploads=uploads, poll=poll)
+
+    def send_job(self, data, uploads=None, poll=None):
+        logger.info('job submitted data=%s uploads=%s', data, uploads)
 
         if uploads is None:
-            response = requests.post(self.files_api_url, json=data, auth=self.auth, headers=self.headers)
+            response = self.request('POST', self.files_api_url, json=data)
         else:
-            files = {'data': json.dumps(data)}
+            # the uploaded files are streamed from disk, identical files are only sent once
+            files = {}
             for upload in uploads:
                 upload_path = Path(upload).expanduser()
-                try:
-                    files[upload_path.name] = upload_path.read_bytes()
-                except FileNotFoundError as e:
-                    logger.error(e)
+                if not upload_path.is_file():
+                    logger.error('No such file: %s', upload_path)
                     return None
+                files[upload_path.name] = upload_path
 
-            response = requests.post(self.files_api_url, files=files, auth=self.auth, headers=self.headers)
+            from .upload import MultipartStream
+            body = MultipartStream({'data': json.dumps(data)}, files)
+            response = self.request('POST', self.files_api_url, data=body,
+                                    headers=dict(self.headers, **{'Content-Type': body.content_type}))
 
         job = self.parse_response(response)
         if job:
@@ -165,23 +510,88 @@ class FilesApiMixin:
                 return job
 
     def get_job(self, job_url, poll=None):
-        response = requests.get(job_url, auth=self.auth, headers=self.headers)
+        while True:
+            response = self.request('GET', job_url)
 
-        job = self.parse_response(response)
-        if job:
-            self.log_job(job)
+            job = self.parse_response(response)
+            if job:
+                self.log_job(job)
 
-            if poll and job['status'] in ['queued', 'started']:
-                time.sleep(poll)
-                return self.get_job(job['job_url'], poll=poll)
-            else:
-                return job
+                if poll and job['status'] in ['queued', 'started']:
+                    time.sleep(poll)
+                    job_url = job['job_url']
+                    continue
+
+            return job
+
+    def run_jobs(self, specs, max_jobs=8, poll=2, poll_max=60, path=None, download=False, callback=None):
+        from .jobs import JobScheduler
+        scheduler = JobScheduler(self, max_jobs=max_jobs, poll=poll, poll_max=poll_max, path=path,
+                                 download=download, callback=callback)
+        return scheduler.run(specs)
 
     def log_job(self, job):
         if job['status'] == 'finished':
-            logger.info('job {id} {status} meta={meta} file_url={file_url}'.format(**job))
+            logger.info('job %s %s meta=%s file_url=%s', job['id'], job['status'], job['meta'], job['file_url'])
         else:
-            logger.info('job {id} {status} meta={meta}'.format(**job))
+            logger.info('job %s %s meta=%s', job['id'], job['status'], job['meta'])
+
+        if self.hooks:
+            self.track_job(job)
+
+    def track_job(self, job):
+        # the time a job waited in the queue and the time it was running are measured
+        # between the transitions of its status, as far as they are seen by polling
+        now = time.perf_counter()
+        state = self.job_states.setdefault(job['id'], {'status': None, 'submitted': now, 'started': None})
+        if job['status'] == state['status']:
+            return
+
+        queue_time = run_time = None
+        if job['status'] != 'queued' and state['started'] is None:
+            state['started'] = now
+            queue_time = now - state['submitted']
+        if job['status'] not in ['queued', 'started']:
+            run_time = now - state['started']
+            self.job_states.pop(job['id'], None)
+
+        self.emit('job', id=job['id'], status=job['status'], previous=state['status'],
+                  queue_time=queue_time, run_time=run_time)
+        state['status'] = job['status']
+
+
+class FilesApiBatchMixin:
+    # the batches use threads and the sync client, so they are not part of FilesApiMixin,
+    # which is shared with the async client
+
+    def run_batch(self, specs, max_jobs=8, poll=2, poll_max=60, path=None, download=False, callback=None):
+        from .jobs import JobBatch
+        batch = JobBatch(self, callback=callback, max_jobs=max_jobs, poll=poll, poll_max=poll_max, path=path,
+                         download=download)
+        return batch.run(specs)
+
+    def run_batch_shard(self, specs, state, shard, max_jobs=8, poll=2, poll_max=60, path=None, download=False,
+                        lease=600, callback=None):
+        # runs the specs of one shard, and afterwards the leftover specs of the other shards (see ShardQueue)
+        from .shard import ShardQueue
+
+        def work(items):
+            statuses = {}
+            for status in self.run_batch([dict(spec, id=index) for index, spec in enumerate(items)],
+                                         max_jobs=max_jobs, poll=poll, poll_max=poll_max, path=path,
+                                         download=download):
+                statuses.setdefault(status['spec'], []).append(status)
+
+            # a spec is only finished, if all of its chunks are finished
+            results = []
+            for index, spec in enumerate(items):
+                jobs = [dict(status, spec=spec.get('id')) for status in statuses.get(index, [])]
+                failed = [job['status'] for job in jobs if job['status'] != 'finished']
+                results.append({'status': failed[0] if failed else 'finished', 'jobs': jobs})
+            return results
+
+        queue = ShardQueue(state, shard, lease=lease)
+        return queue.run(specs, work, batch_size=max_jobs, callback=callback)
 
 
 class FilesApiV1Mixin:
@@ -247,16 +657,78 @@ class FilesApiV1Mixin:
 
 class FilesApiV2Mixin:
 
-    def submit_job(self, paths, operations, uploads, poll=None):
+    def post_chunked_job(self, data, uploads=None, poll=None, chunk_size=None, chunk_bytes=None, backend=None):
+        if self.use_local_backend(data, uploads, backend):
+            # the local backend processes all files at once, using a process pool
+            return self.mirror.run(data, uploads)
+
+        chunks = self.chunk_paths(data['paths'], chunk_size, chunk_bytes)
+        if len(chunks) <= 1:
+            return self.post_job(data, uploads=uploads, poll=poll)
+
+        # every chunk of paths is submitted as a separate job, which run in parallel on the server
+        specs = [dict(data, paths=chunk, uploads=uploads) for chunk in chunks]
+        if poll:
+            return self.run_jobs(specs, poll=poll)
+        else:
+            return [self.post_job(dict(data, paths=chunk), uploads=uploads) for chunk in chunks]
+
+    def use_local_backend(self, data, uploads=None, backend=None):
+        # with backend='auto', the job is run locally if all files are in the mirror and
+        # all operations are supported by the local backend
+        backend = backend or self.backend
+        if backend == 'remote':
+            return False
+        elif getattr(self, 'mirror', None) is None:
+            if backend == 'local':
+                raise RuntimeError('The local backend needs a mirror of the repository. '
+                                   'Please set "mirror=<path>".')
+            return False
+        else:
+            return backend == 'local' or self.mirror.get_error(data, uploads) is None
+
+    def chunk_paths(self, paths, chunk_size=None, chunk_bytes=None, sizes=None):
+        if chunk_bytes and sizes is None:
+            sizes = self.get_file_sizes(paths)
+
+        chunks, chunk, size = [], [], 0
+        for path in paths:
+            path_size = sizes.get(path, 0) if chunk_bytes else 0
+            if chunk and ((chunk_size and len(chunk) >= chunk_size) or
+                          (chunk_bytes and size + path_size > chunk_bytes)):
+                chunks.append(chunk)
+                chunk, size = [], 0
+            chunk.append(path)
+            size += path_size
+
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def get_file_sizes(self, paths):
+        # the sizes of the input files are taken from the Data API
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            responses = executor.map(lambda path: self.files(path=path, paginate=True), paths)
+            return {
+                path: next((file['size'] for file in response['results'] if file['path'] == path), 0)
+                for path, response in zip(paths, responses) if response
+            }
+
+    def submit_job(self, paths, operations, uploads, poll=None, chunk_size=None, chunk_bytes=None, backend=None):
         self.check('v2')
-        return self.post_job({
+        return self.post_chunked_job({
             'paths': paths,
             'operations': operations
-        }, uploads=uploads, poll=poll)
+        }, uploads=uploads, poll=poll, chunk_size=chunk_size, chunk_bytes=chunk_bytes, backend=backend)
+
+    def pipeline(self, paths):
+        from .pipeline import Pipeline
+        return Pipeline(paths, client=self)
 
-    def select_bbox(self, paths, west, east, south, north, mean=False, csv=False, poll=None):
+    def select_bbox(self, paths, west, east, south, north, mean=False, csv=False, poll=None,
+                    chunk_size=None, chunk_bytes=None, backend=None):
         self.check('v2')
-        return self.post_job({
+        return self.post_chunked_job({
             'paths': paths,
             'operations': [
                 {
@@ -266,11 +738,11 @@ class FilesApiV2Mixin:
                     'output_csv': csv
                 }
             ]
-        }, poll=poll)
+        }, poll=poll, chunk_size=chunk_size, chunk_bytes=chunk_bytes, backend=backend)
 
-    def select_point(self, paths, lat, lon, csv=False, poll=None):
+    def select_point(self, paths, lat, lon, csv=False, poll=None, chunk_size=None, chunk_bytes=None, backend=None):
         self.check('v2')
-        return self.post_job({
+        return self.post_chunked_job({
             'paths': paths,
             'operations': [
                 {
@@ -279,11 +751,12 @@ class FilesApiV2Mixin:
                     'output_csv': csv
                 }
             ]
-        }, poll=poll)
+        }, poll=poll, chunk_size=chunk_size, chunk_bytes=chunk_bytes, backend=backend)
 
-    def mask_bbox(self, paths, west, east, south, north, mean=False, csv=False, poll=None):
+    def mask_bbox(self, paths, west, east, south, north, mean=False, csv=False, poll=None,
+                  chunk_size=None, chunk_bytes=None, backend=None):
         self.check('v2')
-        return self.post_job({
+        return self.post_chunked_job({
             'paths': paths,
             'operations': [
                 {
@@ -293,11 +766,12 @@ class FilesApiV2Mixin:
                     'output_csv': csv
                 }
             ]
-        }, poll=poll)
+        }, poll=poll, chunk_size=chunk_size, chunk_bytes=chunk_bytes, backend=backend)
 
-    def mask_country(self, paths, country, mean=False, csv=False, poll=None):
+    def mask_country(self, paths, country, mean=False, csv=False, poll=None, chunk_size=None, chunk_bytes=None,
+                     backend=None):
         self.check('v2')
-        return self.post_job({
+        return self.post_chunked_job({
             'paths': paths,
             'operations': [
                 {
@@ -307,23 +781,24 @@ class FilesApiV2Mixin:
                     'output_csv': csv
                 }
             ]
-        }, poll=poll)
+        }, poll=poll, chunk_size=chunk_size, chunk_bytes=chunk_bytes, backend=backend)
 
-    def mask_landonly(self, paths, poll=None):
+    def mask_landonly(self, paths, poll=None, chunk_size=None, chunk_bytes=None, backend=None):
         self.check('v2')
-        return self.post_job({
+        return self.post_chunked_job({
             'paths': paths,
             'operations': [
                 {
                     'operation': 'mask_landonly'
                 }
             ]
-        }, poll=poll)
+        }, poll=poll, chunk_size=chunk_size, chunk_bytes=chunk_bytes, backend=backend)
 
-    def mask_mask(self, paths, mask, var, mean=False, csv=False, poll=None):
+    def mask_mask(self, paths, mask, var, mean=False, csv=False, poll=None, chunk_size=None, chunk_bytes=None,
+                  backend=None):
         self.check('v2')
         mask = Path(mask)
-        return self.post_job({
+        return self.post_chunked_job({
             'paths': paths,
             'operations': [
                 {
@@ -334,14 +809,15 @@ class FilesApiV2Mixin:
                     'var': var
                 }
             ]
-        }, uploads=[mask], poll=poll)
+        }, uploads=[mask], poll=poll, chunk_size=chunk_size, chunk_bytes=chunk_bytes, backend=backend)
 
-    def mask_shape(self, paths, shape, layer, mean=False, csv=False, poll=None):
+    def mask_shape(self, paths, shape, layer, mean=False, csv=False, poll=None, chunk_size=None, chunk_bytes=None,
+                   backend=None):
         self.check('v2')
         shape = Path(shape)
         mask = shape.with_suffix('.nc')
         var = f'm_{layer}'
-        return self.post_job({
+        return self.post_chunked_job({
             'paths': paths,
             'operations': [
                 {
@@ -357,11 +833,12 @@ class FilesApiV2Mixin:
                     'var': var
                 }
             ]
-        }, uploads=[shape], poll=poll)
+        }, uploads=[shape], poll=poll, chunk_size=chunk_size, chunk_bytes=chunk_bytes, backend=backend)
 
-    def cutout_bbox(self, paths, west, east, south, north, mean=False, csv=False, poll=None):
+    def cutout_bbox(self, paths, west, east, south, north, mean=False, csv=False, poll=None,
+                    chunk_size=None, chunk_bytes=None, backend=None):
         self.check('v2')
-        return self.post_job({
+        return self.post_chunked_job({
             'paths': paths,
             'operations': [
                 {
@@ -371,11 +848,11 @@ class FilesApiV2Mixin:
                     'output_csv': csv
                 }
             ]
-        }, poll=poll)
+        }, poll=poll, chunk_size=chunk_size, chunk_bytes=chunk_bytes, backend=backend)
 
-    def cutout_point(self, paths, lat, lon, csv=False, poll=None):
+    def cutout_point(self, paths, lat, lon, csv=False, poll=None, chunk_size=None, chunk_bytes=None, backend=None):
         self.check('v2')
-        return self.post_job({
+        return self.post_chunked_job({
             'paths': paths,
             'operations': [
                 {
@@ -384,58 +861,174 @@ class FilesApiV2Mixin:
                     'output_csv': csv
                 }
             ]
-        }, poll=poll)
+        }, poll=poll, chunk_size=chunk_size, chunk_bytes=chunk_bytes, backend=backend)
 
 
 class DownloadMixin:
 
-    def download(self, url, path=None, validate=False, extract=False):
+    def download(self, url, path=None, validate=False, extract=False, checksum=None, stream=False, members=None,
+                 keep_archive=True):
         headers = self.headers.copy()
 
-        file_name = Path(urlparse(url).path.split('/')[-1])
-        file_path = (Path(path).expanduser() if path else Path.cwd()) / file_name
-        file_path.parent.mkdir(exist_ok=True, parents=True)
-        if file_path.exists():
-            # resume download
-            headers.update({'Range': f'bytes={file_path.stat().st_size}-'})
+        file_path = self.get_file_path(url, path)
+        extract = extract and file_path.suffix == '.zip'
+
+        # in streaming mode, the members of a zip file are extracted while it is downloaded,
+        # and the archive itself is only written to disk if it should be kept
+        if extract and stream:
+            from .unzip import StreamingUnzipper
+            unzipper = StreamingUnzipper(path or Path.cwd(), members)
+        else:
+            unzipper = None
+        write_archive = unzipper is None or keep_archive
+        streamed = False
 
-        logger.info(f'download url={url} to path={path}')
+        if validate and checksum is None:
+            checksum = self.get_remote_checksum(url, file_path)
 
-        response = requests.get(url, stream=True, headers=headers)
-        if response.status_code == 416:
-            # download is complete
-            pass
+        if validate and self.is_verified(file_path, checksum):
+            logger.info('download url=%s to path=%s skipped, checksum matches', url, path)
         else:
-            response.raise_for_status()
+            # the checksum is updated while the file is written, only the already downloaded
+            # part of a resumed download needs to be read from disk
+            if validate:
+                import hashlib
+                m = hashlib.sha512()
+            else:
+                m = None
 
-            with open(file_path, 'ab') as fd:
-                for chunk in response.iter_content(chunk_size=65*1024):
-                    fd.write(chunk)
+            if write_archive and file_path.exists():
+                # resume download
+                headers.update({'Range': f'bytes={file_path.stat().st_size}-'})
 
-        if validate:
-            json_url = url.rsplit('/', 1)[0] + '/' + file_name.with_suffix('.json').as_posix()
-            response = requests.get(json_url, headers=self.headers)
-            response.raise_for_status()
-            json_data = response.json()
-            remote_checksum, remote_path = json_data['checksum'], json_data['path']
-
-            # compute file checksum
-            m = hashlib.sha512()
-            with open(file_path, 'rb') as fp:
-                # read and update in blocks of 64K
-                for block in iter(lambda: fp.read(65536), b''):
+            logger.info('download url=%s to path=%s', url, path)
+
+            with self.request('GET', url, stream=True, auth=None, headers=headers) as response:
+                if response.status_code == 416:
+                    # download is complete
+                    m = None
+                else:
+                    response.raise_for_status()
+
+                    # if the server ignored the range request, it sends the whole file
+                    mode = 'ab' if response.status_code == 206 else 'wb'
+                    if mode == 'ab' and (m is not None or unzipper is not None):
+                        self.read_partial(file_path, m, unzipper)
+
+                    with open(file_path, mode) if write_archive else nullcontext() as fd:
+                        for chunk in response.iter_content(chunk_size=65*1024):
+                            if self.hooks:
+                                self.emit('download', url=url, bytes=len(chunk))
+                            if fd is not None:
+                                fd.write(chunk)
+                            if m is not None:
+                                m.update(chunk)
+                            if unzipper is not None:
+                                unzipper.feed(chunk)
+                                streamed = True
+
+            if validate:
+                self.validate_file(file_path, checksum, m.hexdigest() if m else None)
+
+        if extract:
+            if streamed:
+                unzipper.close()
+            else:
+                self.extract_file(file_path, path, members)
+
+            if not keep_archive and file_path.exists():
+                file_path.unlink()
+
+    def read_partial(self, file_path, m, unzipper):
+        # the already downloaded part of a resumed download is hashed and unzipped
+        with open(file_path, 'rb') as fp:
+            for block in iter(lambda: fp.read(65536), b''):
+                if m is not None:
                     m.update(block)
-            checksum = m.hexdigest()
+                if unzipper is not None:
+                    unzipper.feed(block)
 
-            assert remote_path.endswith(file_name.as_posix())
-            assert remote_checksum == checksum, f'Checksum {checksum} != {remote_checksum}'
+    def get_file_path(self, url, path=None):
+        file_name = Path(urlparse(url).path.split('/')[-1])
+        file_path = (Path(path).expanduser() if path else Path.cwd()) / file_name
+        file_path.parent.mkdir(exist_ok=True, parents=True)
+        return file_path
 
-        if file_path.suffix == '.zip' and extract:
-            with zipfile.ZipFile(file_path, 'r') as zip_ref:
+    def get_json_url(self, url):
+        file_name = Path(urlparse(url).path.split('/')[-1])
+        return url.rsplit('/', 1)[0] + '/' + file_name.with_suffix('.json').as_posix()
+
+    def get_remote_checksum(self, url, file_path):
+        response = self.request('GET', self.get_json_url(url), auth=None)
+        response.raise_for_status()
+        json_data = response.json()
+        assert json_data['path'].endswith(file_path.name)
+        return json_data['checksum']
+
+    def is_verified(self, file_path, checksum):
+        return self.checksums is not None and self.checksums.get(file_path) == checksum
+
+    def validate_file(self, file_path, remote_checksum, checksum=None):
+        if checksum is None:
+            from .checksums import compute_checksum
+            checksum = compute_checksum(file_path).hexdigest()
+
+        assert remote_checksum == checksum, f'Checksum {checksum} != {remote_checksum}'
+
+        if self.checksums is not None and file_path.exists():
+            self.checksums.set(file_path, checksum)
+
+    def extract_file(self, file_path, path=None, members=None):
+        import fnmatch
+        import zipfile
+
+        with zipfile.ZipFile(file_path, 'r') as zip_ref:
+            if members:
+                zip_ref.extractall(path, members=[
+                    name for name in zip_ref.namelist()
+                    if any(fnmatch.fnmatch(name, pattern) for pattern in members)
+                ])
+            else:
                 zip_ref.extractall(path)
 
 
-class ISIMIPClient(DataApiMixin, FilesApiMixin, FilesApiV1Mixin, FilesApiV2Mixin, DownloadMixin, RESTClient):
+class DownloadManagerMixin:
+    # the download manager uses threads and the sync client, so it is not part of DownloadMixin,
+    # which is shared with the async client
+
+    def download_many(self, urls, path=None, workers=4, segment_size=None, callback=None, checksums=None):
+        from .download import DownloadManager
+        manager = DownloadManager(self, path=path, workers=workers, segment_size=segment_size, callback=callback,
+                                  checksums=checksums)
+        return manager.run(urls)
+
+    def download_shard(self, files, state, shard, path=None, workers=4, segment_size=None, lease=600,
+                       callback=None):
+        # downloads the files (as returned by files()) of one shard, and afterwards the leftover files of
+        # the other shards (see ShardQueue), the files are stored below path using their path in the repository
+        from .shard import ShardQueue
+
+        root = Path(path).expanduser() if path else Path.cwd()
+
+        def work(items):
+            return self.download_many(
+                [file['file_url'] for file in items],
+                path={file['file_url']: root / Path(file['path']).parent for file in items},
+                workers=workers, segment_size=segment_size,
+                checksums={file['file_url']: file['checksum'] for file in items if file.get('checksum')}
+            )
+
+        queue = ShardQueue(state, shard, lease=lease)
+        return queue.run(files, work, batch_size=workers, callback=callback)
+
+    def sync(self, path, dest, workers=4, prune=False, dry_run=False, callback=None):
+        from .sync import SyncManager
+        manager = SyncManager(self, path, dest, workers=workers, prune=prune, dry_run=dry_run, callback=callback)
+        return manager.run()
+
+
+class ISIMIPClient(DataApiMixin, FilesApiMixin, FilesApiBatchMixin, FilesApiV1Mixin, FilesApiV2Mixin, DownloadMixin,
+                   DownloadManagerMixin, RESTClient):
 
     def __init__(
         self,
@@ -443,8 +1036,36 @@ class ISIMIPClient(DataApiMixin, FilesApiMixin, FilesApiV1Mixin, FilesApiV2Mixin
         files_api_url='https://files.isimip.org/api/v2',
         files_api_version='v2',
         auth=None,
-        headers=None
+        headers=None,
+        checksums=None,
+        results=None,
+        catalog=None,
+        mirror=None,
+        backend='remote',
+        **kwargs
     ):
-        super().__init__(data_url, auth, headers)
+        super().__init__(data_url, auth, headers, **kwargs)
         self.files_api_url = files_api_url
         self.files_api_version = files_api_version
+        if checksums is True:
+            from .checksums import ChecksumIndex
+            checksums = ChecksumIndex()
+        if results is True:
+            from .results import ResultCache
+            results = ResultCache()
+        if catalog is True:
+            from .catalog import Catalog
+            catalog = Catalog()
+
+        self.checksums = checksums or None
+        self.results = results or None
+        self.catalog = catalog or None
+
+        # a local mirror of the repository, the Files API operations are run on it with backend='local'
+        # and backend='auto' (if all files are in the mirror), otherwise on the remote Files API
+        if isinstance(mirror, (str, Path)):
+            from .local import LocalBackend
+            mirror = LocalBackend(mirror)
+        self.mirror = mirror
+        self.backend = backend
+        self.job_states = {}
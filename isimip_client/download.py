@@ -0,0 +1,225 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadTask:
+
+    def __init__(self, url, file_path):
+        self.url = url
+        self.file_path = file_path
+        self.part_path = file_path.with_name(file_path.name + '.part')
+        self.manifest_path = file_path.with_name(file_path.name + '.part.json')
+        self.size = None
+        self.ranges = False
+        self.segments = []
+        self.status = None
+        self.error = None
+        self.saved = 0
+
+    @property
+    def done(self):
+        return sum(segment['done'] for segment in self.segments)
+
+    def load_manifest(self):
+        if self.manifest_path.exists() and self.part_path.exists():
+            manifest = json.loads(self.manifest_path.read_text())
+            if manifest['url'] == self.url and manifest['size'] == self.size:
+                self.segments = manifest['segments']
+                return True
+        return False
+
+    def save_manifest(self):
+        tmp_path = self.manifest_path.with_name(self.manifest_path.name + '.tmp')
+        tmp_path.write_text(json.dumps({
+            'url': self.url,
+            'size': self.size,
+            'segments': self.segments
+        }))
+        os.replace(tmp_path, self.manifest_path)
+        self.saved = time.time()
+
+    def allocate(self, segment_size):
+        if self.ranges and self.size:
+            self.segments = [
+                {'start': start, 'end': min(start + segment_size, self.size) - 1, 'done': 0}
+                for start in range(0, self.size, segment_size)
+            ]
+        else:
+            # without range support, the file is fetched in one piece and cannot be resumed
+            self.segments = [{'start': 0, 'end': None, 'done': 0}]
+
+        # preallocate the output file, so that the segments can be written in place
+        with open(self.part_path, 'wb') as fp:
+            if self.size:
+                if hasattr(os, 'posix_fallocate'):
+                    os.posix_fallocate(fp.fileno(), 0, self.size)
+                else:
+                    fp.truncate(self.size)
+
+    def to_dict(self):
+        return {
+            'url': self.url,
+            'path': str(self.file_path),
+            'size': self.size,
+            'status': self.status,
+            'error': self.error
+        }
+
+
+class DownloadManager:
+
+    chunk_size = 1024 * 1024
+    segment_size = 64 * 1024 * 1024
+    manifest_interval = 1
+
+    def __init__(self, client, path=None, workers=4, segment_size=None, callback=None, checksums=None):
+        self.client = client
+        self.path = path
+        self.workers = workers
+        self.segment_size = segment_size or self.segment_size
+        self.callback = callback
+        self.checksums = checksums or {}
+
+        self.lock = threading.Lock()
+        self.total = 0
+        self.done = 0
+
+    def run(self, urls):
+        start_time = time.time()
+        tasks = [DownloadTask(url, self.client.get_file_path(url, self.get_path(url))) for url in urls]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for task in executor.map(self.prepare, tasks):
+                if task.status is None:
+                    self.total += task.size or 0
+                    self.done += task.done
+
+            futures = {}
+            for task in tasks:
+                if task.status is None:
+                    for segment in task.segments:
+                        futures[executor.submit(self.fetch_segment, task, segment)] = task
+
+            self.report()
+
+            pending = {task: sum(1 for t in futures.values() if t is task) for task in tasks}
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error('download url=%s failed (%s)', task.url, e)
+                    task.status, task.error = 'failed', str(e)
+
+                pending[task] -= 1
+                if pending[task] == 0:
+                    self.finish(task)
+
+        elapsed = time.time() - start_time
+        logger.info('downloaded %s files %s bytes in %.1fs (%.1f MB/s)', len(tasks), self.done, elapsed,
+                    self.done / elapsed / 1024**2 if elapsed else 0)
+
+        return [task.to_dict() for task in tasks]
+
+    def prepare(self, task):
+        checksum = self.checksums.get(task.url)
+        if checksum and self.client.is_verified(task.file_path, checksum):
+            task.status = 'skipped'
+            return task
+
+        try:
+            response = self.client.request('HEAD', task.url, auth=None, allow_redirects=True)
+            response.raise_for_status()
+            content_length = response.headers.get('Content-Length')
+            task.size = int(content_length) if content_length else None
+            task.ranges = response.headers.get('Accept-Ranges') == 'bytes'
+
+            if task.file_path.exists() and task.size == task.file_path.stat().st_size \
+                    and not task.manifest_path.exists() and self.is_valid(task):
+                task.status = 'skipped'
+            elif not (task.ranges and task.load_manifest()):
+                task.allocate(self.segment_size)
+                task.save_manifest()
+        except Exception as e:
+            logger.error('download url=%s failed (%s)', task.url, e)
+            task.status, task.error = 'failed', str(e)
+
+        return task
+
+    def fetch_segment(self, task, segment):
+        start = segment['start'] + segment['done']
+        if segment['end'] is not None and start > segment['end']:
+            return
+
+        headers = self.client.headers.copy()
+        ranged = task.ranges and segment['end'] is not None
+        if ranged:
+            headers['Range'] = 'bytes={}-{}'.format(start, segment['end'])
+
+        with self.client.request('GET', task.url, stream=True, auth=None, headers=headers) as response:
+            response.raise_for_status()
+            if ranged and response.status_code != 206:
+                raise RuntimeError(f'Range request returned status {response.status_code}')
+
+            with open(task.part_path, 'r+b') as fp:
+                fp.seek(start)
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    if self.client.hooks:
+                        self.client.emit('download', url=task.url, bytes=len(chunk))
+                    fp.write(chunk)
+
+                    with self.lock:
+                        segment['done'] += len(chunk)
+                        self.done += len(chunk)
+                        if time.time() - task.saved > self.manifest_interval:
+                            task.save_manifest()
+
+                    self.report()
+
+    def finish(self, task):
+        if task.status is None and task.size is not None and task.done != task.size:
+            task.status, task.error = 'failed', f'Incomplete download {task.done} != {task.size}'
+
+        if task.status is None:
+            os.replace(task.part_path, task.file_path)
+            task.manifest_path.unlink()
+
+            # the segments arrive out of order, so the checksum is computed once the file is complete
+            checksum = self.checksums.get(task.url)
+            if checksum:
+                try:
+                    self.client.validate_file(task.file_path, checksum)
+                except AssertionError as e:
+                    logger.error('download url=%s failed (%s)', task.url, e)
+                    task.status, task.error = 'failed', str(e)
+                    return
+
+            task.status = 'finished'
+            logger.info('download url=%s to path=%s finished', task.url, task.file_path)
+        else:
+            # keep the manifest, so that the next run can resume the missing segments
+            with self.lock:
+                task.save_manifest()
+
+    def get_path(self, url):
+        # path is either one directory for all files or a dict mapping the urls to directories
+        return self.path.get(url) if isinstance(self.path, dict) else self.path
+
+    def is_valid(self, task):
+        checksum = self.checksums.get(task.url)
+        if checksum:
+            try:
+                self.client.validate_file(task.file_path, checksum)
+            except AssertionError:
+                return False
+        return True
+
+    def report(self):
+        if self.callback:
+            self.callback(self.done, self.total)
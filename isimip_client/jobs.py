@@ -0,0 +1,196 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class JobScheduler:
+
+    active_status = ['queued', 'started']
+    backoff = 1.5
+
+    def __init__(self, client, max_jobs=8, poll=2, poll_max=60, path=None, download=False, download_workers=4,
+                 callback=None, status_callback=None):
+        self.client = client
+        self.max_jobs = max_jobs
+        self.poll, self.poll_max = poll, poll_max
+        self.path = path
+        self.download = download
+        self.download_workers = download_workers
+        self.callback = callback
+
+        # the status_callback is called with the index and the job, whenever the status of a job
+        # changes, and with the status 'downloaded' or 'download_failed' when its result was downloaded
+        self.status_callback = status_callback
+
+    def run(self, specs):
+        # specs are payloads for the Files API, e.g. {'paths': [...], 'operations': [...]},
+        # with an optional list of 'uploads'
+        pending = deque(enumerate(specs))
+        active = {}
+        results = [None] * len(pending)
+        downloads = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_jobs) as executor, \
+                ThreadPoolExecutor(max_workers=self.download_workers) as download_executor:
+            while pending or active:
+                # submit new jobs, as long as the number of active jobs is below max_jobs
+                submit = [pending.popleft() for _ in range(min(len(pending), self.max_jobs - len(active)))]
+                indexes = [index for index, _ in submit]
+                for index, job in zip(indexes, executor.map(self.submit_job, [spec for _, spec in submit])):
+                    self.update(index, job, active, results, downloads, download_executor)
+
+                # poll all jobs, which are due, in one go
+                now = time.time()
+                due = [index for index, entry in active.items() if entry['next_poll'] <= now]
+                job_urls = [active[index]['job']['job_url'] for index in due]
+                for index, job in zip(due, executor.map(self.client.get_job, job_urls)):
+                    self.update(index, job, active, results, downloads, download_executor)
+
+                if active and not (pending and len(active) < self.max_jobs):
+                    next_poll = min(entry['next_poll'] for entry in active.values())
+                    time.sleep(max(0, next_poll - time.time()))
+
+            for url, future in downloads.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error('download url=%s failed (%s)', url, e)
+
+        return results
+
+    def submit_job(self, spec):
+        data = dict(spec)
+        uploads = data.pop('uploads', None)
+        backend = data.pop('backend', None)
+        if backend and self.client.use_local_backend(data, uploads, backend):
+            # the local backend runs the job right away, the output files are already on disk
+            return self.client.mirror.run(data, uploads)
+        return self.client.post_job(data, uploads=uploads)
+
+    def update(self, index, job, active, results, downloads, download_executor):
+        if job is None:
+            # the request failed, the error was already logged by the client
+            job = active[index]['job'] if index in active else {}
+            job = dict(job, status='failed')
+
+        previous = results[index]
+        results[index] = job
+
+        if self.status_callback and (previous is None or previous['status'] != job['status']):
+            self.status_callback(index, job)
+
+        if job['status'] in self.active_status:
+            entry = active.get(index)
+            if entry is None:
+                active[index] = {'job': job, 'interval': self.poll, 'next_poll': time.time() + self.poll}
+            else:
+                # poll long running jobs less often
+                entry['job'] = job
+                entry['interval'] = min(entry['interval'] * self.backoff, self.poll_max)
+                entry['next_poll'] = time.time() + entry['interval']
+        else:
+            active.pop(index, None)
+
+            if self.callback:
+                self.callback(job)
+
+            if self.download and job['status'] == 'finished' and 'file_url' in job:
+                if job['file_url'] not in downloads:
+                    downloads[job['file_url']] = download_executor.submit(self.client.download, job['file_url'],
+                                                                          path=self.path)
+                if self.status_callback:
+                    downloads[job['file_url']].add_done_callback(
+                        lambda future, index=index, job=job: self.report_download(index, job, future)
+                    )
+
+    def report_download(self, index, job, future):
+        if future.exception() is None:
+            self.status_callback(index, dict(job, status='downloaded',
+                                             path=str(self.client.get_file_path(job['file_url'], self.path))))
+        else:
+            self.status_callback(index, dict(job, status='download_failed', error=str(future.exception())))
+
+
+class JobRecorder:
+    # stands in for the client, when one of its operation methods (e.g. mask_country) is called,
+    # and returns the payloads of the (chunked) jobs instead of submitting them
+
+    def __init__(self, client):
+        self.client = client
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def post_chunked_job(self, data, uploads=None, poll=None, chunk_size=None, chunk_bytes=None, backend=None):
+        # like post_chunked_job of the client, the jobs for the local backend are not chunked
+        # and the backend is recorded, so that the scheduler runs them locally as well
+        if self.client.use_local_backend(data, uploads, backend):
+            payloads = [dict(data, backend='local')]
+        else:
+            payloads = [dict(data, paths=chunk) for chunk in self.client.chunk_paths(data['paths'], chunk_size,
+                                                                                     chunk_bytes)]
+        return [dict(payload, uploads=uploads) if uploads else payload for payload in payloads]
+
+
+class JobBatch:
+    # runs many specs through one JobScheduler, a spec is either the name and the arguments of an
+    # operation method, e.g. {"operation": "mask_country", "paths": [...], "country": "bra"}, or a
+    # payload for the Files API, e.g. {"paths": [...], "operations": [...], "uploads": [...]};
+    # an optional "id" is used to identify the spec in the status
+
+    operations = ['select_bbox', 'select_point', 'mask_bbox', 'mask_country', 'mask_landonly', 'mask_mask',
+                  'mask_shape', 'cutout_bbox', 'cutout_point', 'submit_job']
+
+    def __init__(self, client, callback=None, **kwargs):
+        self.client = client
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.scheduler = JobScheduler(client, status_callback=self.update, **kwargs)
+        self.labels = []
+
+    def run(self, specs):
+        # invalid specs are reported (and returned) before any job is submitted
+        payloads, invalid = [], []
+        for index, spec in enumerate(specs):
+            spec = dict(spec)
+            label = spec.pop('id', index)
+            try:
+                chunks = self.get_payloads(spec)
+            except (TypeError, ValueError, RuntimeError) as e:
+                invalid.append({'spec': label, 'status': 'invalid', 'error': str(e)})
+                self.report(invalid[-1])
+                continue
+
+            for chunk, payload in enumerate(chunks):
+                self.labels.append((label, chunk))
+                payloads.append(payload)
+
+        return invalid + [dict(job, spec=label, chunk=chunk)
+                          for (label, chunk), job in zip(self.labels, self.scheduler.run(payloads))]
+
+    def get_payloads(self, spec):
+        operation = spec.pop('operation', 'submit_job' if 'operations' in spec else None)
+        if operation not in self.operations:
+            raise ValueError(f'Unknown operation: {operation}')
+        if operation == 'submit_job':
+            spec.setdefault('uploads', None)
+
+        return getattr(type(self.client), operation)(JobRecorder(self.client), **spec)
+
+    def update(self, index, job):
+        label, chunk = self.labels[index]
+        status = {'spec': label, 'chunk': chunk, 'id': job.get('id'), 'status': job['status']}
+        for key in ['file_url', 'path', 'error']:
+            if job.get(key):
+                status[key] = job[key]
+        self.report(status)
+
+    def report(self, status):
+        # the status is reported from the scheduler and from the download threads
+        if self.callback:
+            with self.lock:
+                self.callback(status)
@@ -0,0 +1,259 @@
+import csv
+import hashlib
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# the size of the blocks (in bytes), which are read from the input files at once
+block_size = 64 * 1024 * 1024
+
+
+class LocalBackend:
+    # runs the operations of the Files API on a local mirror of the ISIMIP repository, using
+    # netCDF4 and numpy (pip install isimip-client[local]), the input paths are relative to root
+
+    operations = ['select_point', 'select_bbox', 'cutout_point', 'cutout_bbox', 'mask_bbox', 'mask_landonly']
+
+    def __init__(self, root, output_path=None, landseamask=None, max_workers=None):
+        self.root = Path(root).expanduser()
+        self.output_path = Path(output_path).expanduser() if output_path else None
+        self.landseamask = Path(landseamask).expanduser() if landseamask else None
+        self.max_workers = max_workers
+
+    def get_input_path(self, path):
+        return self.root / path
+
+    def get_error(self, data, uploads=None):
+        # returns why the job cannot be run locally, or None
+        if uploads:
+            return 'uploads are not supported by the local backend'
+
+        for operation in data['operations']:
+            if operation['operation'] not in self.operations:
+                return 'operation {} is not supported by the local backend'.format(operation['operation'])
+            if operation['operation'] == 'mask_landonly' and self.landseamask is None:
+                return 'mask_landonly needs a landseamask for the local backend'
+
+        for path in data['paths']:
+            if not self.get_input_path(path).is_file():
+                return f'{path} was not found in {self.root}'
+
+    def run(self, data, uploads=None):
+        job_id = hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+        job = {'id': job_id, 'backend': 'local', 'status': 'finished', 'files': [], 'errors': []}
+
+        error = self.get_error(data, uploads)
+        if error:
+            logger.error('local job %s failed (%s)', job_id, error)
+            return dict(job, status='failed', errors=[error])
+
+        output_path = self.output_path or Path.cwd()
+        output_path.mkdir(exist_ok=True, parents=True)
+        args = [
+            (str(self.get_input_path(path)), data['operations'], str(output_path),
+             str(self.landseamask) if self.landseamask else None)
+            for path in data['paths']
+        ]
+
+        logger.info('local job %s started paths=%s', job_id, len(args))
+        if len(args) == 1 or self.max_workers == 1:
+            results = [run_operations(*arg) for arg in args]
+        else:
+            # the files are processed in parallel, every process opens its own files
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                results = list(executor.map(run_operations, *zip(*args)))
+
+        for output_file, error in results:
+            if error:
+                job['errors'].append(error)
+            else:
+                job['files'].append(output_file)
+
+        if job['errors']:
+            job['status'] = 'failed'
+        logger.info('local job %s %s files=%s', job_id, job['status'], len(job['files']))
+        return job
+
+
+def run_operations(input_file, operations, output_path, landseamask=None):
+    # runs in a separate process, returns (output_file, error)
+    try:
+        return process_file(input_file, operations, output_path, landseamask), None
+    except Exception as e:
+        return None, f'{Path(input_file).name}: {e}'
+
+
+def process_file(input_file, operations, output_path, landseamask=None):
+    import netCDF4
+    import numpy as np
+
+    with netCDF4.Dataset(input_file) as dataset:
+        variable = get_variable(dataset)
+        lat, lon = dataset['lat'][:].filled(np.nan), dataset['lon'][:].filled(np.nan)
+
+        # first, the operations are reduced to a rectangular selection of the grid, which is the
+        # only part of the file which is read, and a list of masks on this selection
+        lat_index, lon_index = np.arange(len(lat)), np.arange(len(lon))
+        bboxes, landonly, mean, output_csv, regions = [], False, False, False, []
+
+        for operation in operations:
+            name = operation['operation']
+            if name in ['select_bbox', 'cutout_bbox', 'mask_bbox']:
+                west, east, south, north = (float(value) for value in operation['bbox'])
+                regions.append(f'lat{south}to{north}lon{west}to{east}')
+                if name == 'mask_bbox':
+                    bboxes.append((west, east, south, north))
+                else:
+                    lat_index = lat_index[(lat[lat_index] >= south) & (lat[lat_index] <= north)]
+                    lon_index = lon_index[(lon[lon_index] >= west) & (lon[lon_index] <= east)]
+            elif name in ['select_point', 'cutout_point']:
+                point_lat, point_lon = (float(value) for value in operation['point'])
+                regions.append(f'lat{point_lat}lon{point_lon}')
+                lat_index = lat_index[[np.abs(lat[lat_index] - point_lat).argmin()]] if len(lat_index) else lat_index
+                lon_index = lon_index[[np.abs(lon[lon_index] - point_lon).argmin()]] if len(lon_index) else lon_index
+            elif name == 'mask_landonly':
+                regions.append('landonly')
+                landonly = True
+            else:
+                raise ValueError(f'operation {name} is not supported')
+
+            mean = mean or operation.get('compute_mean', False)
+            output_csv = output_csv or operation.get('output_csv', False)
+
+        if not len(lat_index) or not len(lon_index):
+            raise ValueError('the selection does not contain any grid cell')
+
+        # the selection is read as a contiguous slice
+        lat_slice = slice(lat_index.min(), lat_index.max() + 1)
+        lon_slice = slice(lon_index.min(), lon_index.max() + 1)
+        lat_sel, lon_sel = lat[lat_slice], lon[lon_slice]
+
+        mask = np.ones((len(lat_sel), len(lon_sel)), dtype=bool)
+        for west, east, south, north in bboxes:
+            mask &= ((lat_sel >= south) & (lat_sel <= north))[:, None] & \
+                ((lon_sel >= west) & (lon_sel <= east))[None, :]
+        if landonly:
+            mask &= read_landseamask(landseamask, lat_slice, lon_slice)
+
+        output_file = Path(output_path) / get_output_name(Path(input_file), regions, output_csv)
+        time = dataset['time']
+        dates = netCDF4.num2date(time[:], time.units, getattr(time, 'calendar', 'standard'))
+
+        # the area of the grid cells is proportional to the cosine of the latitude
+        weights = np.broadcast_to(np.cos(np.deg2rad(lat_sel))[:, None], mask.shape)
+        weights = np.where(mask, weights, 0)
+
+        blocks = iter_blocks(variable, lat_slice, lon_slice, mask)
+        if mean:
+            blocks = (weighted_mean(block, weights)[:, None, None] for block in blocks)
+            lat_out, lon_out = np.array([lat_sel.mean()]), np.array([lon_sel.mean()])
+        else:
+            lat_out, lon_out = lat_sel, lon_sel
+
+        if output_csv:
+            write_csv(output_file, variable.name, dates, lat_out, lon_out, blocks)
+        else:
+            write_netcdf(output_file, dataset, variable, lat_out, lon_out, blocks)
+
+    return str(output_file)
+
+
+def get_variable(dataset):
+    # the data variable is the variable with lat and lon dimensions, which is not a coordinate
+    for name, variable in dataset.variables.items():
+        if name not in dataset.dimensions and {'lat', 'lon'} <= set(variable.dimensions):
+            return variable
+    raise ValueError('no variable with lat and lon dimensions found')
+
+
+def get_output_name(input_file, regions, output_csv):
+    # like the Files API, the region is inserted into the file name instead of "global"
+    region = '_'.join(regions)
+    if '_global_' in input_file.name:
+        stem = input_file.stem.replace('_global_', f'_{region}_', 1)
+    else:
+        stem = f'{input_file.stem}_{region}'
+    return stem + ('.csv' if output_csv else '.nc')
+
+
+def read_landseamask(landseamask, lat_slice, lon_slice):
+    import netCDF4
+    import numpy as np
+
+    with netCDF4.Dataset(landseamask) as dataset:
+        values = get_variable(dataset)[..., lat_slice, lon_slice]
+        values = np.ma.filled(np.ma.squeeze(values).astype(float), 0)
+        return values > 0
+
+
+def iter_blocks(variable, lat_slice, lon_slice, mask):
+    # the time steps are read in blocks, so that only a part of a large file is in memory
+    import numpy as np
+
+    cells = (lat_slice.stop - lat_slice.start) * (lon_slice.stop - lon_slice.start)
+    step = max(1, block_size // (cells * variable.dtype.itemsize))
+    for start in range(0, variable.shape[0], step):
+        block = np.ma.masked_invalid(np.ma.asarray(variable[start:start + step, lat_slice, lon_slice], dtype=float))
+        yield np.ma.masked_where(np.broadcast_to(~mask, block.shape), block)
+
+
+def weighted_mean(block, weights):
+    import numpy as np
+
+    valid = ~np.ma.getmaskarray(block)
+    block_weights = np.where(valid, weights, 0)
+    total = block_weights.sum(axis=(1, 2))
+    values = (np.ma.filled(block, 0) * block_weights).sum(axis=(1, 2))
+    return np.ma.masked_where(total == 0, values / np.where(total == 0, 1, total))
+
+
+def write_netcdf(output_file, dataset, variable, lat, lon, blocks):
+    import netCDF4
+    import numpy as np
+
+    time = dataset['time']
+    with netCDF4.Dataset(output_file, 'w', format=dataset.data_model) as output:
+        output.setncatts({key: dataset.getncattr(key) for key in dataset.ncattrs()})
+        output.createDimension('time', None)
+        output.createDimension('lat', len(lat))
+        output.createDimension('lon', len(lon))
+
+        for name, values in [('time', time[:]), ('lat', lat), ('lon', lon)]:
+            source = dataset[name]
+            coordinate = output.createVariable(name, source.dtype, (name, ))
+            coordinate.setncatts({key: source.getncattr(key) for key in source.ncattrs() if key != '_FillValue'})
+            coordinate[:] = values
+
+        fill_value = getattr(variable, '_FillValue', netCDF4.default_fillvals.get(variable.dtype.str[1:]))
+        data = output.createVariable(variable.name, variable.dtype, ('time', 'lat', 'lon'), zlib=True,
+                                     fill_value=fill_value)
+        data.setncatts({key: variable.getncattr(key) for key in variable.ncattrs() if key != '_FillValue'})
+
+        start = 0
+        for block in blocks:
+            data[start:start + len(block)] = block.astype(variable.dtype) if np.ma.isMA(block) else block
+            start += len(block)
+
+
+def write_csv(output_file, name, dates, lat, lon, blocks):
+    import numpy as np
+
+    with open(output_file, 'w', newline='') as fp:
+        writer = csv.writer(fp)
+        point = len(lat) == 1 and len(lon) == 1
+        writer.writerow(['time', name] if point else ['time', 'lat', 'lon', name])
+
+        dates = iter(dates)
+        for block in blocks:
+            for values in block:
+                date = next(dates).strftime('%Y-%m-%d')
+                if point:
+                    value = values[0, 0]
+                    writer.writerow([date, '' if value is np.ma.masked else float(value)])
+                else:
+                    for (i, j), value in np.ndenumerate(np.ma.filled(values, np.nan)):
+                        if not np.isnan(value):
+                            writer.writerow([date, float(lat[i]), float(lon[j]), float(value)])
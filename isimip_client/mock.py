@@ -0,0 +1,382 @@
+import hashlib
+import io
+import json
+import logging
+import random
+import re
+import threading
+import time
+import zipfile
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import click
+
+logger = logging.getLogger(__name__)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    block_size = 64 * 1024
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def do_HEAD(self):
+        self.handle_request(head=True)
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        self.handle_request()
+
+    def handle_request(self, head=False):
+        mock = self.server.mock
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0)) if self.command == 'POST' else b''
+
+        if mock.latency:
+            time.sleep(mock.latency)
+
+        if mock.fail():
+            return self.send_data(b'', status=503)
+
+        if self.command == 'POST' and url.path.rstrip('/') == '/api/v2':
+            return self.send_json(mock.submit_job(self.get_job_data(body)), status=201)
+
+        match = re.match(r'^/api/v1/(datasets|files)/(?:([^/]+)/)?$', url.path)
+        if match:
+            resource, pk = match.groups()
+            if pk:
+                result = mock.retrieve(resource, pk)
+                return self.send_json(result) if result else self.send_json({'detail': 'Not found.'}, status=404)
+            else:
+                return self.send_json(mock.list(resource, params, self.get_base_url() + url.path))
+
+        match = re.match(r'^/api/v2/([0-9a-f]+)/$', url.path)
+        if match:
+            job = mock.get_job(match.group(1))
+            return self.send_json(job) if job else self.send_json({'detail': 'Not found.'}, status=404)
+
+        match = re.match(r'^/api/v2/output/([0-9a-f]+)\.zip$', url.path)
+        if match:
+            content = mock.get_job_content(match.group(1))
+            if content is not None:
+                return self.send_content(content, head=head)
+
+        if url.path.startswith('/files/'):
+            metadata = mock.get_file_metadata(url.path[len('/files/'):])
+            if metadata is not None:
+                return self.send_json(metadata)
+
+            content = mock.get_file_content(url.path[len('/files/'):])
+            if content is not None:
+                return self.send_content(content, head=head)
+
+        return self.send_json({'detail': 'Not found.'}, status=404)
+
+    def get_base_url(self):
+        return 'http://{}'.format(self.headers.get('Host'))
+
+    def get_job_data(self, body):
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('multipart/form-data'):
+            message = BytesParser().parsebytes(f'Content-Type: {content_type}\r\n\r\n'.encode() + body)
+            parts = {part.get_param('name', header='content-disposition'): part.get_payload(decode=True)
+                     for part in message.get_payload()}
+            data = json.loads(parts.pop('data'))
+            data['uploads'] = {name: len(value) for name, value in parts.items()}
+            return data
+        else:
+            return json.loads(body or b'{}')
+
+    def send_json(self, data, status=200):
+        self.send_data(json.dumps(data).encode(), status=status, content_type='application/json')
+
+    def send_content(self, content, head=False):
+        size = len(content)
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match and self.server.mock.ranges:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            if start >= size:
+                return self.send_data(b'', status=416, headers={'Content-Range': f'bytes */{size}'})
+            headers = {'Accept-Ranges': 'bytes', 'Content-Range': f'bytes {start}-{end}/{size}'}
+            return self.send_data(content[start:end + 1], status=206, headers=headers, head=head)
+        else:
+            headers = {'Accept-Ranges': 'bytes'} if self.server.mock.ranges else {}
+            return self.send_data(content, headers=headers, head=head)
+
+    def send_data(self, data, status=200, content_type='application/octet-stream', headers=None, head=False):
+        self.server.mock.count(self.command, 0 if head else len(data))
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+
+        if not head:
+            # the data is sent in blocks, so that the bandwidth can be limited
+            view = memoryview(data)
+            for offset in range(0, len(data), self.block_size):
+                block = view[offset:offset + self.block_size]
+                self.wfile.write(block)
+                if self.server.mock.bandwidth:
+                    time.sleep(len(block) / self.server.mock.bandwidth)
+
+
+class MockServer:
+    # a local stand-in for the Data API and the Files API (v2), which serves synthetic
+    # datasets and files and can add latency, limit the bandwidth and inject failures
+
+    specifiers = {
+        'simulation_round': ['ISIMIP3b'],
+        'product': ['InputData'],
+        'climate_forcing': ['gfdl-esm4', 'ipsl-cm6a-lr', 'mpi-esm1-2-hr', 'mri-esm2-0', 'ukesm1-0-ll'],
+        'climate_scenario': ['historical', 'ssp126', 'ssp370', 'ssp585'],
+        'climate_variable': ['tas', 'pr', 'hurs', 'rsds', 'sfcwind']
+    }
+
+    def __init__(self, host='127.0.0.1', port=0, datasets=100, files_per_dataset=10, file_size=1024 * 1024,
+                 max_page_size=1000, latency=0, bandwidth=None, failure_rate=0, job_duration=0, ranges=True,
+                 seed=0):
+        self.datasets = self.create_datasets(datasets, files_per_dataset, file_size)
+        self.files = [file for dataset in self.datasets for file in dataset['files']]
+        self.datasets_by_id = {dataset['id']: dataset for dataset in self.datasets}
+        self.files_by_id = {file['id']: file for file in self.files}
+        self.files_by_path = {file['path']: file for file in self.files}
+
+        self.max_page_size = max_page_size
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self.job_duration = job_duration
+        self.ranges = ranges
+
+        self.random = random.Random(seed)
+        self.content = self.random.getrandbits(8 * file_size).to_bytes(file_size, 'little')
+        self.checksum = hashlib.sha512(self.content).hexdigest()
+        self.jobs = {}
+        self.stats = {}
+        self.lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer((host, port), MockHandler)
+        self.server.daemon_threads = True
+        self.server.mock = self
+        self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def data_url(self):
+        return self.url + '/api/v1'
+
+    @property
+    def files_api_url(self):
+        return self.url + '/api/v2'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def create_datasets(self, count, files_per_dataset, file_size):
+        datasets = []
+        for index in range(count):
+            specifiers = {}
+            for key, values in self.specifiers.items():
+                specifiers[key] = values[index % len(values)]
+                index //= len(values)
+            specifiers['period'] = str(1850 + index * 10)
+
+            name = '_'.join([specifiers['climate_forcing'], specifiers['climate_scenario'],
+                             specifiers['climate_variable'], 'global_daily', specifiers['period']])
+            path = '/'.join([specifiers['simulation_round'], specifiers['product'], 'climate',
+                             specifiers['climate_scenario'], specifiers['climate_forcing'], name])
+            dataset = {
+                'id': self.get_uuid(path),
+                'name': name,
+                'path': path,
+                'version': '20240101',
+                'size': files_per_dataset * file_size,
+                'specifiers': specifiers,
+                'files': []
+            }
+            for year in range(files_per_dataset):
+                file_path = f'{path}_{year:04d}.nc'
+                dataset['files'].append({
+                    'id': self.get_uuid(file_path),
+                    'name': file_path.split('/')[-1],
+                    'path': file_path,
+                    'version': dataset['version'],
+                    'size': file_size,
+                    'specifiers': specifiers,
+                    'dataset': dataset['id']
+                })
+            datasets.append(dataset)
+        return datasets
+
+    def get_uuid(self, path):
+        digest = hashlib.md5(path.encode()).hexdigest()
+        return f'{digest[:8]}-{digest[8:12]}-{digest[12:16]}-{digest[16:20]}-{digest[20:]}'
+
+    def count(self, method, size):
+        with self.lock:
+            self.stats['requests'] = self.stats.get('requests', 0) + 1
+            self.stats[method] = self.stats.get(method, 0) + 1
+            self.stats['bytes'] = self.stats.get('bytes', 0) + size
+
+    def fail(self):
+        if self.failure_rate:
+            with self.lock:
+                return self.random.random() < self.failure_rate
+        return False
+
+    def serialize(self, resource, instance, base_url):
+        if resource == 'datasets':
+            data = {key: value for key, value in instance.items() if key != 'files'}
+            data['files'] = [self.serialize('files', file, base_url) for file in instance['files']]
+        else:
+            data = dict(instance, checksum=self.checksum, checksum_type='sha512',
+                        file_url=f'{base_url}/files/{instance["path"]}')
+        return data
+
+    def filter(self, instances, params):
+        for instance in instances:
+            if 'path' in params and not instance['path'].startswith(params['path']):
+                continue
+            if 'query' in params and params['query'] not in instance['path']:
+                continue
+            if any(instance['specifiers'].get(key) != value for key, value in params.items()
+                   if key in instance['specifiers']):
+                continue
+            yield instance
+
+    def list(self, resource, params, url):
+        instances = list(self.filter(self.datasets if resource == 'datasets' else self.files, params))
+        page = int(params.get('page', 1))
+        page_size = min(int(params.get('page_size', 10)), self.max_page_size)
+        base_url = url[:url.index('/api/v1/')]
+
+        def get_page_url(page):
+            return url + '?' + urlencode(dict(params, page=page, page_size=page_size))
+
+        return {
+            'count': len(instances),
+            'next': get_page_url(page + 1) if page * page_size < len(instances) else None,
+            'previous': get_page_url(page - 1) if page > 1 else None,
+            'results': [self.serialize(resource, instance, base_url)
+                        for instance in instances[(page - 1) * page_size:page * page_size]]
+        }
+
+    def retrieve(self, resource, pk):
+        instance = (self.datasets_by_id if resource == 'datasets' else self.files_by_id).get(pk)
+        if instance:
+            return self.serialize(resource, instance, self.url)
+
+    def get_file_content(self, path):
+        if path in self.files_by_path:
+            return self.content
+
+    def get_file_metadata(self, path):
+        # like the file server, the metadata of every file is served next to it, with the suffix .json
+        if path.endswith('.json'):
+            file = self.files_by_path.get(path[:-len('.json')] + '.nc')
+            if file is not None:
+                return dict(file, checksum=self.checksum, checksum_type='sha512')
+
+    def submit_job(self, data):
+        job_id = hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+        with self.lock:
+            self.jobs.setdefault(job_id, {'data': data, 'created': time.time(), 'content': None})
+        return dict(self.get_job(job_id), status='queued')
+
+    def get_job(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+
+            elapsed = time.time() - job['created']
+            if elapsed >= self.job_duration:
+                if job['content'] is None:
+                    job['content'] = self.create_job_content(job['data'])
+                status = 'finished'
+            elif elapsed >= self.job_duration / 2:
+                status = 'started'
+            else:
+                status = 'queued'
+
+        data = {
+            'id': job_id,
+            'job_url': f'{self.files_api_url}/{job_id}/',
+            'status': status,
+            'meta': {
+                'created_files': len(job['data'].get('paths', [])),
+                'total_files': len(job['data'].get('paths', []))
+            }
+        }
+        if status == 'finished':
+            data['file_url'] = f'{self.files_api_url}/output/{job_id}.zip'
+        return data
+
+    def get_job_content(self, job_id):
+        job = self.jobs.get(job_id)
+        if job:
+            return job['content']
+
+    def create_job_content(self, data):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            for path in data.get('paths', []):
+                name = path.split('/')[-1].replace('.nc', '.csv')
+                rows = ''.join(f'{1850 + day // 365}-01-01,{day % 100 / 100:.2f}\n' for day in range(3650))
+                zip_file.writestr(name, 'time,value\n' + rows)
+        return buffer.getvalue()
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1')
+@click.option('--port', default=8000)
+@click.option('--datasets', default=100)
+@click.option('--files-per-dataset', default=10)
+@click.option('--file-size', default=1024 * 1024)
+@click.option('--latency', default=0.0, help='Latency per request in seconds.')
+@click.option('--bandwidth', default=None, type=float, help='Bandwidth per connection in bytes/s.')
+@click.option('--failure-rate', default=0.0, help='Fraction of requests, which fail with 503.')
+@click.option('--job-duration', default=0.0, help='Time until a job is finished in seconds.')
+@click.option('--ranges/--no-ranges', default=True, help='Whether range requests are supported.')
+def main(**kwargs):
+    logging.basicConfig(level='INFO', format='%(message)s')
+
+    mock = MockServer(**kwargs)
+    click.echo(f'ISIMIP_DATA_URL={mock.data_url}')
+    click.echo(f'ISIMIP_FILES_API_URL={mock.files_api_url}')
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        mock.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# the operations, which support compute_mean and output_csv
+mean_operations = ['select_bbox', 'mask_bbox', 'mask_country', 'mask_mask', 'cutout_bbox']
+csv_operations = [*mean_operations, 'select_point', 'cutout_point']
+
+# operations, which give the same result when they run after a cutout_bbox, instead of before it,
+# this holds for the masks created from a shape (see commutes), but not for masks on a global grid,
+# i.e. mask_country, mask_landonly and mask_mask with an uploaded mask
+commuting_operations = ['create_mask']
+
+
+class Pipeline:
+    # builds one job with several operations for the Files API, e.g.
+    #
+    #   client.pipeline(paths).mask_shape('shapes.zip', 3).cutout_bbox(-20, 20, -10, 10).mean().csv().run(poll=4)
+    #
+    # the arguments are validated when the operations are added and the operations are rewritten
+    # before the job is submitted, so that the server needs to process less data (see get_operations)
+
+    def __init__(self, paths, client=None):
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        if not self.paths:
+            raise ValueError('A pipeline needs at least one path.')
+
+        self.client = client
+        self.operations = []
+        self.uploads = {}
+        self.compute_mean = False
+        self.output_csv = False
+
+    def __repr__(self):
+        return '<Pipeline {}>'.format(' | '.join(operation['operation'] for operation in self.get_operations()))
+
+    def select_bbox(self, west, east, south, north, mean=False, csv=False):
+        return self.add({'operation': 'select_bbox', 'bbox': self.get_bbox(west, east, south, north)}, mean, csv)
+
+    def select_point(self, lat, lon, csv=False):
+        return self.add({'operation': 'select_point', 'point': self.get_point(lat, lon)}, csv=csv)
+
+    def mask_bbox(self, west, east, south, north, mean=False, csv=False):
+        return self.add({'operation': 'mask_bbox', 'bbox': self.get_bbox(west, east, south, north)}, mean, csv)
+
+    def mask_country(self, country, mean=False, csv=False):
+        if not (isinstance(country, str) and len(country) == 3 and country.isalpha()):
+            raise ValueError(f'Invalid country "{country}", a ISO 3166-1 alpha-3 code is needed.')
+        return self.add({'operation': 'mask_country', 'country': country.lower()}, mean, csv)
+
+    def mask_landonly(self):
+        return self.add({'operation': 'mask_landonly'})
+
+    def mask_mask(self, mask, var, mean=False, csv=False):
+        if not (isinstance(var, str) and var):
+            raise ValueError(f'Invalid variable "{var}".')
+        mask = self.add_upload(mask)
+        return self.add({'operation': 'mask_mask', 'mask': mask.name, 'var': var}, mean, csv)
+
+    def mask_shape(self, shape, layer, mean=False, csv=False):
+        if isinstance(layer, bool) or not isinstance(layer, int) or layer < 0:
+            raise ValueError(f'Invalid layer "{layer}", a non-negative integer is needed.')
+        shape = self.add_upload(shape)
+        mask = shape.with_suffix('.nc')
+        self.add({'operation': 'create_mask', 'shape': shape.name, 'mask': mask.name})
+        return self.add({'operation': 'mask_mask', 'mask': mask.name, 'var': f'm_{layer}'}, mean, csv)
+
+    def cutout_bbox(self, west, east, south, north, mean=False, csv=False):
+        return self.add({'operation': 'cutout_bbox', 'bbox': self.get_bbox(west, east, south, north)}, mean, csv)
+
+    def cutout_point(self, lat, lon, csv=False):
+        return self.add({'operation': 'cutout_point', 'point': self.get_point(lat, lon)}, csv=csv)
+
+    def mean(self):
+        self.compute_mean = True
+        return self
+
+    def csv(self):
+        self.output_csv = True
+        return self
+
+    def add(self, operation, mean=False, csv=False):
+        self.operations.append(operation)
+        self.compute_mean = self.compute_mean or mean
+        self.output_csv = self.output_csv or csv
+        return self
+
+    def add_upload(self, upload):
+        upload = Path(upload).expanduser()
+        if not upload.is_file():
+            raise ValueError(f'No such file: {upload}')
+        if self.uploads.get(upload.name, upload).resolve() != upload.resolve():
+            raise ValueError(f'A different file named "{upload.name}" was already added.')
+        self.uploads[upload.name] = upload
+        return upload
+
+    def get_number(self, value, name, minimum, maximum):
+        if isinstance(value, bool):
+            raise ValueError(f'Invalid {name} "{value}".')
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid {name} "{value}".') from None
+        if not minimum <= value <= maximum:
+            raise ValueError(f'Invalid {name} "{value}", it needs to be between {minimum} and {maximum}.')
+        return value
+
+    def get_bbox(self, west, east, south, north):
+        west, east = (self.get_number(value, 'longitude', -180, 180) for value in (west, east))
+        south, north = (self.get_number(value, 'latitude', -90, 90) for value in (south, north))
+        if west >= east or south >= north:
+            raise ValueError(f'Invalid bbox {[west, east, south, north]}, west < east and south < north are needed.')
+        return [west, east, south, north]
+
+    def get_point(self, lat, lon):
+        return [self.get_number(lat, 'latitude', -90, 90), self.get_number(lon, 'longitude', -180, 180)]
+
+    def get_operations(self, optimize=True):
+        if not self.operations:
+            raise ValueError('The pipeline does not contain any operation.')
+
+        operations = [dict(operation) for operation in self.operations]
+        if optimize:
+            operations = self.optimize(operations)
+
+        # the mean and the csv output can only be computed by the last operation
+        last = operations[-1]
+        if self.compute_mean:
+            if last['operation'] not in mean_operations:
+                raise ValueError('compute_mean is not supported by {}.'.format(last['operation']))
+            last['compute_mean'] = True
+        if self.output_csv:
+            if last['operation'] not in csv_operations:
+                raise ValueError('output_csv is not supported by {}.'.format(last['operation']))
+            last['output_csv'] = True
+
+        return operations
+
+    def optimize(self, operations):
+        # 1. cutout_bbox is moved before the masks created from shapes, so that they only need to process the cutout
+        created_masks = {operation['mask'] for operation in operations if operation['operation'] == 'create_mask'}
+        for index in range(len(operations)):
+            if operations[index]['operation'] == 'cutout_bbox':
+                target = index
+                while target > 0 and self.commutes(operations[target - 1], created_masks):
+                    target -= 1
+                if target < index:
+                    logger.debug('pipeline: cutout_bbox moved before %s', operations[target]['operation'])
+                    operations.insert(target, operations.pop(index))
+
+        # 2. consecutive cutout_bbox and mask_bbox operations are merged into one using the intersection
+        # of their bboxes, and identical operations (e.g. create_mask for the same shape) are removed
+        optimized = []
+        for operation in operations:
+            previous = optimized[-1] if optimized else None
+            if operation in optimized:
+                logger.debug('pipeline: duplicate %s removed', operation['operation'])
+            elif previous and previous['operation'] == operation['operation'] and 'bbox' in operation:
+                previous['bbox'] = self.intersect(previous['bbox'], operation['bbox'])
+                logger.debug('pipeline: %s merged', operation['operation'])
+            else:
+                optimized.append(operation)
+
+        return optimized
+
+    def commutes(self, operation, created_masks):
+        return operation['operation'] in commuting_operations or \
+            (operation['operation'] == 'mask_mask' and operation['mask'] in created_masks)
+
+    def intersect(self, bbox, other):
+        west, east = max(bbox[0], other[0]), min(bbox[1], other[1])
+        south, north = max(bbox[2], other[2]), min(bbox[3], other[3])
+        if west >= east or south >= north:
+            raise ValueError(f'The bboxes {bbox} and {other} do not overlap.')
+        return [west, east, south, north]
+
+    def get_spec(self, optimize=True):
+        # the payload for the Files API, with the uploads, as used by run_jobs
+        spec = {'paths': self.paths, 'operations': self.get_operations(optimize)}
+        if self.uploads:
+            spec['uploads'] = list(self.uploads.values())
+        return spec
+
+    def run(self, poll=None, chunk_size=None, chunk_bytes=None, backend=None, optimize=True):
+        if self.client is None:
+            raise RuntimeError('The pipeline needs a client, please use "client.pipeline(paths)".')
+
+        return self.client.submit_job(self.paths, self.get_operations(optimize), list(self.uploads.values()) or None,
+                                      poll=poll, chunk_size=chunk_size, chunk_bytes=chunk_bytes, backend=backend)
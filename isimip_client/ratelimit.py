@@ -0,0 +1,229 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from urllib.parse import urlparse
+
+from .cache import get_cache_dir
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    # a token bucket and a limit of concurrent requests for every host, which are shared by all
+    # processes using the same SQLite database, e.g. the tasks of a SLURM array job, if the database
+    # is on a shared file system (which needs working file locks, e.g. not every NFS setup has them)
+    #
+    # when a server answers with 429 (or 503 with Retry-After), all processes pause for the given
+    # time and the rate of this host is halved, afterwards it recovers linearly within recovery seconds
+
+    default_rate = 10
+    default_burst = 20
+    default_max_in_flight = 16
+
+    # slots of requests, which were not released (e.g. since the process was killed), expire
+    default_lease = 600
+
+    # the minimal rate after repeated throttling, and the longest time a process sleeps before it checks again
+    min_rate = 0.1
+    max_wait = 1
+
+    def __init__(self, path=None, rate=None, burst=None, max_in_flight=None, recovery=60, lease=None):
+        self.path = Path(path).expanduser() if path else get_cache_dir() / 'ratelimit.sqlite'
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+
+        # rate (requests per second), burst and max_in_flight can be numbers or dicts mapping hosts to numbers,
+        # a rate or max_in_flight of 0 disables the token bucket or the limit of concurrent requests
+        self.rate = self.default_rate if rate is None else rate
+        self.burst = self.default_burst if burst is None else burst
+        self.max_in_flight = self.default_max_in_flight if max_in_flight is None else max_in_flight
+        self.recovery = recovery
+        self.lease = self.default_lease if lease is None else lease
+
+        # the transactions are started explicitly with BEGIN IMMEDIATE, which locks the database
+        # for the other processes until the bucket was updated
+        self.lock = threading.Lock()
+        self.held = set()
+        self.heartbeat = None
+        self.stopped = threading.Event()
+        self.connection = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS hosts (
+                host TEXT PRIMARY KEY,
+                tokens REAL,
+                rate REAL,
+                updated REAL,
+                blocked_until REAL
+            )
+        ''')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS slots (
+                slot TEXT PRIMARY KEY,
+                host TEXT,
+                pid INTEGER,
+                expires REAL
+            )
+        ''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS slots_host ON slots (host)')
+
+    def close(self):
+        self.stopped.set()
+        self.connection.close()
+
+    def get_host(self, url):
+        return urlparse(url).netloc
+
+    def get_limit(self, value, host):
+        if isinstance(value, dict):
+            return value.get(host)
+        else:
+            return value
+
+    def execute(self, callback, *args):
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                result = callback(*args)
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+            self.connection.execute('COMMIT')
+            return result
+
+    def acquire(self, url):
+        # blocks until a request to the host of the url is allowed, returns the slot of the request
+        while True:
+            slot, wait = self.try_acquire(url)
+            if slot is not None:
+                return slot
+            time.sleep(wait)
+
+    def try_acquire(self, url):
+        # returns (slot, 0) if the request is allowed, otherwise (None, the time to wait)
+        host = self.get_host(url)
+        rate = self.get_limit(self.rate, host)
+        max_in_flight = self.get_limit(self.max_in_flight, host)
+        if not rate and not max_in_flight:
+            return '', 0
+
+        slot, wait = self.execute(self.take_token, host, rate, max_in_flight)
+        if slot and max_in_flight:
+            self.hold(slot)
+        return slot, wait
+
+    def take_token(self, host, max_rate, max_in_flight):
+        now = time.time()
+        burst = self.get_limit(self.burst, host) or 1
+
+        row = self.connection.execute(
+            'SELECT tokens, rate, updated, blocked_until FROM hosts WHERE host = ?', (host, )
+        ).fetchone()
+        tokens, rate, updated, blocked_until = row or (burst, max_rate, now, 0)
+
+        if max_rate:
+            # the rate recovers after throttling and the bucket is refilled with this rate
+            elapsed = max(now - updated, 0)
+            rate = min(max_rate, (rate or max_rate) + elapsed * max_rate / self.recovery) if self.recovery \
+                else max_rate
+            tokens = min(burst, tokens + elapsed * rate)
+
+        if max_in_flight:
+            self.connection.execute('DELETE FROM slots WHERE host = ? AND expires < ?', (host, now))
+            in_flight = self.connection.execute('SELECT COUNT(*) FROM slots WHERE host = ?', (host, )).fetchone()[0]
+        else:
+            in_flight = 0
+
+        slot, wait = None, 0
+        if blocked_until > now:
+            wait = blocked_until - now
+        elif max_in_flight and in_flight >= max_in_flight:
+            # the slots are released by other threads or processes, so they are checked again soon
+            wait = 0.05
+        elif max_rate and tokens < 1:
+            wait = (1 - tokens) / rate
+        else:
+            if max_rate:
+                tokens -= 1
+            slot = uuid.uuid4().hex
+            if max_in_flight:
+                self.connection.execute('INSERT INTO slots (slot, host, pid, expires) VALUES (?, ?, ?, ?)',
+                                        (slot, host, os.getpid(), now + self.lease))
+
+        self.connection.execute('''
+            INSERT OR REPLACE INTO hosts (host, tokens, rate, updated, blocked_until) VALUES (?, ?, ?, ?, ?)
+        ''', (host, tokens, rate, now, blocked_until))
+
+        if slot is None:
+            logger.debug('rate limit host=%s wait=%.3f in_flight=%s rate=%s', host, wait, in_flight, rate)
+        return slot, min(wait, self.max_wait)
+
+    def hold(self, slot):
+        # the leases of the held slots are renewed by a background thread, so that long requests
+        # (e.g. large downloads) keep their slot, the thread is started by the first slot
+        with self.lock:
+            self.held.add(slot)
+            if self.heartbeat is None or not self.heartbeat.is_alive():
+                self.heartbeat = threading.Thread(target=self.renew_slots, daemon=True)
+                self.heartbeat.start()
+
+    def renew_slots(self):
+        while not self.stopped.wait(self.lease / 4):
+            with self.lock:
+                if self.held:
+                    self.connection.executemany('UPDATE slots SET expires = ? WHERE slot = ?',
+                                                [(time.time() + self.lease, slot) for slot in self.held])
+
+    def release(self, slot):
+        if slot:
+            with self.lock:
+                self.held.discard(slot)
+                self.connection.execute('DELETE FROM slots WHERE slot = ?', (slot, ))
+
+    def throttle(self, url, delay):
+        # called when the server answered with 429, all processes wait and continue with a lower rate
+        host = self.get_host(url)
+        max_rate = self.get_limit(self.rate, host)
+        if not max_rate and not self.get_limit(self.max_in_flight, host):
+            return
+
+        logger.warning('rate limit host=%s throttled for %.1fs', host, delay)
+        self.execute(self.reduce_rate, host, max_rate, delay)
+
+    def reduce_rate(self, host, max_rate, delay):
+        now = time.time()
+        row = self.connection.execute('SELECT rate, blocked_until FROM hosts WHERE host = ?', (host, )).fetchone()
+        rate, blocked_until = row or (max_rate, 0)
+
+        # the other processes probably got a 429 at the same time, so the rate is only halved
+        # once for the same pause, without a token bucket, the host is only paused
+        if max_rate and blocked_until < now:
+            rate = max((rate or max_rate) / 2, self.min_rate)
+
+        self.connection.execute('''
+            INSERT OR REPLACE INTO hosts (host, tokens, rate, updated, blocked_until) VALUES (?, 0, ?, ?, ?)
+        ''', (host, rate, now, max(blocked_until, now + delay)))
+
+    def stats(self):
+        now = time.time()
+        with self.lock:
+            hosts = self.connection.execute('SELECT host, tokens, rate, blocked_until FROM hosts').fetchall()
+            slots = dict(self.connection.execute(
+                'SELECT host, COUNT(*) FROM slots WHERE expires >= ? GROUP BY host', (now, )
+            ).fetchall())
+
+        return {
+            host: {
+                'tokens': tokens,
+                'rate': rate,
+                'blocked': max(blocked_until - now, 0),
+                'in_flight': slots.get(host, 0)
+            } for host, tokens, rate, blocked_until in hosts
+        }
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute('DELETE FROM hosts')
+            self.connection.execute('DELETE FROM slots')
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+
+from .cache import get_cache_dir
+from .upload import get_content_hash
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    # the extracted results of Files API jobs are stored in directories named by the hash of the
+    # job payload (including the content of uploaded files), so that identical jobs are not run again
+
+    default_max_size = 10 * 1024 * 1024 * 1024
+    meta_name = '.isimip-result.json'
+
+    def __init__(self, path=None, max_size=None):
+        self.path = Path(path).expanduser() if path else get_cache_dir() / 'results'
+        self.path.mkdir(exist_ok=True, parents=True)
+        self.max_size = self.default_max_size if max_size is None else max_size
+
+        self.lock = threading.Lock()
+        self.inflight = {}
+
+    def get_key(self, url, data, uploads=None):
+        payload = {
+            'url': url,
+            'data': data,
+            'uploads': {
+                Path(upload).expanduser().name: get_content_hash(upload)
+                for upload in (uploads or [])
+            }
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=list).encode()).hexdigest()
+
+    def get(self, key):
+        meta_path = self.path / key / self.meta_name
+        if meta_path.exists():
+            # the mtime of the meta file is used for the lru eviction
+            meta_path.touch()
+            return dict(json.loads(meta_path.read_text()), path=str(meta_path.parent), cached=True)
+
+    def run(self, client, data, uploads, poll):
+        try:
+            key = self.get_key(client.files_api_url, data, uploads)
+        except FileNotFoundError as e:
+            logger.error(e)
+            return None
+
+        while True:
+            job = self.get(key)
+            if job:
+                logger.info('job %s found in result cache path=%s', key, job['path'])
+                return job
+
+            with self.lock:
+                event = self.inflight.get(key)
+                if event is None:
+                    event = self.inflight[key] = threading.Event()
+                    break
+
+            # an identical job is already running, wait for it and check the cache again
+            event.wait()
+
+        try:
+            job = client.send_job(data, uploads=uploads, poll=poll)
+            if job and job['status'] == 'finished':
+                return self.put(client, key, job)
+            return job
+        finally:
+            with self.lock:
+                self.inflight.pop(key).set()
+
+    def put(self, client, key, job):
+        entry_path = self.path / key
+        tmp_path = self.path / (key + '.tmp')
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        tmp_path.mkdir()
+
+        client.download(job['file_url'], path=tmp_path, extract=True, stream=True, keep_archive=False)
+
+        size = sum(file_path.stat().st_size for file_path in tmp_path.rglob('*') if file_path.is_file())
+        if size > self.max_size:
+            # the result would be evicted right away, so it is not cached and returned without a path
+            logger.warning('job %s is larger than the result cache size=%s', job['id'], size)
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return dict(job, size=size, cached=False)
+
+        (tmp_path / self.meta_name).write_text(json.dumps(dict(job, size=size)))
+
+        shutil.rmtree(entry_path, ignore_errors=True)
+        os.replace(tmp_path, entry_path)
+        self.evict(keep=entry_path)
+
+        return dict(job, size=size, path=str(entry_path), cached=False)
+
+    def evict(self, keep=None):
+        # the entry, which was just written, is never evicted
+        entries = []
+        for meta_path in self.path.glob('*/' + self.meta_name):
+            if meta_path.parent == keep:
+                continue
+            entries.append((meta_path.stat().st_mtime, json.loads(meta_path.read_text()).get('size', 0),
+                            meta_path.parent))
+
+        size = sum(entry[1] for entry in entries)
+        if keep is not None:
+            size += json.loads((keep / self.meta_name).read_text()).get('size', 0)
+
+        for _, entry_size, entry_path in sorted(entries, key=lambda entry: entry[0]):
+            if size <= self.max_size:
+                break
+            logger.info('result cache evicted path=%s', entry_path)
+            shutil.rmtree(entry_path, ignore_errors=True)
+            size -= entry_size
+
+    def clear(self):
+        for entry_path in self.path.iterdir():
+            if entry_path.is_dir():
+                shutil.rmtree(entry_path, ignore_errors=True)
@@ -0,0 +1,292 @@
+from array import array
+from collections.abc import Mapping
+
+
+class ObjectColumn:
+    # a plain list, used for unique strings (ids, paths, checksums) and nested values
+
+    def __init__(self, values=None):
+        self.values = values or []
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, value):
+        self.values.append(value)
+        return True
+
+    def get(self, index):
+        return self.values[index]
+
+    def take(self, indexes):
+        return ObjectColumn([self.values[index] for index in indexes])
+
+    def to_list(self):
+        return list(self.values)
+
+
+class IntColumn:
+    # an array of 64 bit integers, e.g. for the size
+
+    def __init__(self, values=None):
+        self.values = values or array('q')
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, value):
+        if type(value) is not int:
+            return False
+        self.values.append(value)
+        return True
+
+    def get(self, index):
+        return self.values[index]
+
+    def take(self, indexes):
+        return IntColumn(array('q', (self.values[index] for index in indexes)))
+
+    def to_list(self):
+        return self.values.tolist()
+
+
+class DictColumn:
+    # a dictionary encoded column, every distinct value is stored once and the
+    # rows only store the (integer) code of their value, e.g. for the version
+
+    def __init__(self, codes=None, values=None):
+        self.codes = codes or array('i')
+        self.values = values or []
+        self.index = None
+
+    def __len__(self):
+        return len(self.codes)
+
+    def append(self, value):
+        # booleans are not encoded, since True and 1 would share the same code
+        if isinstance(value, bool) or not (value is None or isinstance(value, (str, int, float))):
+            return False
+
+        if self.index is None:
+            self.index = {value: code for code, value in enumerate(self.values)}
+
+        code = self.index.get(value)
+        if code is None:
+            code = self.index[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+        return True
+
+    def get(self, index):
+        return self.values[self.codes[index]]
+
+    def take(self, indexes):
+        return DictColumn(array('i', (self.codes[index] for index in indexes)), self.values)
+
+    def to_list(self):
+        return [self.values[code] for code in self.codes]
+
+    def get_codes(self, values):
+        return {code for code, value in enumerate(self.values) if value in values}
+
+
+class ResultSet:
+    # a container for the results of the Data API, which stores the results column-wise:
+    # repeated strings (versions and all specifiers) are dictionary encoded, the size is stored
+    # in an array and the rows are only created as (lazy) views when they are accessed
+
+    # dictionary encoded columns with more distinct values than this fraction of the rows are
+    # converted to plain lists
+    max_cardinality = 0.5
+
+    def __init__(self, results=None):
+        self.length = 0
+        self.columns = {}
+        self.specifiers = {}
+        self.order = []
+        if results:
+            self.extend(results)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for index in range(self.length):
+            yield Row(self, index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.take(range(*index.indices(self.length)))
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('ResultSet index out of range')
+        return Row(self, index)
+
+    def __repr__(self):
+        return f'<ResultSet {self.length} results>'
+
+    def extend(self, results):
+        for result in results:
+            for key, value in result.items():
+                if key not in self.order:
+                    self.order.append(key)
+
+                if key == 'specifiers' and isinstance(value, dict):
+                    for specifier_key, specifier_value in value.items():
+                        self.append_value(self.specifiers, specifier_key, specifier_value)
+                else:
+                    self.append_value(self.columns, key, value)
+
+            self.length += 1
+
+            # pad the columns, which are missing in this result
+            for columns in (self.columns, self.specifiers):
+                for key, column in columns.items():
+                    if len(column) < self.length:
+                        self.append_value(columns, key, None)
+
+        self.compact()
+
+    def append_value(self, columns, key, value):
+        column = columns.get(key)
+        if column is None:
+            column = columns[key] = self.create_column(columns, value)
+            for _ in range(self.length):
+                column.append(None)
+
+        if not column.append(value):
+            # the value does not fit into the column, e.g. a None in an IntColumn
+            column = columns[key] = ObjectColumn(column.to_list())
+            column.append(value)
+
+    def create_column(self, columns, value):
+        if type(value) is int and columns is self.columns and self.length == 0:
+            return IntColumn()
+        elif value is None or (isinstance(value, (str, int, float)) and not isinstance(value, bool)):
+            return DictColumn()
+        else:
+            return ObjectColumn()
+
+    def compact(self):
+        for columns in (self.columns, self.specifiers):
+            for key, column in columns.items():
+                if isinstance(column, DictColumn):
+                    column.index = None
+                    if len(column) >= 100 and len(column.values) > len(column) * self.max_cardinality:
+                        columns[key] = ObjectColumn(column.to_list())
+
+    def take(self, indexes):
+        indexes = list(indexes)
+        resultset = ResultSet()
+        resultset.length = len(indexes)
+        resultset.order = self.order
+        resultset.columns = {key: column.take(indexes) for key, column in self.columns.items()}
+        resultset.specifiers = {key: column.take(indexes) for key, column in self.specifiers.items()}
+        return resultset
+
+    def filter(self, **kwargs):
+        # e.g. resultset.filter(climate_variable='tas', climate_scenario=['ssp126', 'ssp585'])
+        indexes = range(self.length)
+        for key, values in kwargs.items():
+            values = set(values) if isinstance(values, (list, tuple, set)) else {values}
+            column = self.specifiers.get(key, self.columns.get(key))
+            if column is None:
+                return self.take([])
+            elif isinstance(column, DictColumn):
+                codes = column.get_codes(values)
+                indexes = [index for index in indexes if column.codes[index] in codes]
+            else:
+                indexes = [index for index in indexes if column.get(index) in values]
+        return self.take(indexes)
+
+    def column(self, key):
+        if key in self.columns:
+            return self.columns[key].to_list()
+        elif key in self.specifiers:
+            return self.specifiers[key].to_list()
+        else:
+            raise KeyError(key)
+
+    def get_value(self, index, key):
+        if key == 'specifiers' and key not in self.columns:
+            return {specifier_key: column.get(index) for specifier_key, column in self.specifiers.items()
+                    if column.get(index) is not None}
+        return self.columns[key].get(index)
+
+    def keys(self):
+        return self.order
+
+    def to_list(self):
+        return [dict(row) for row in self]
+
+    def get_flat_columns(self):
+        # the specifiers are flattened into separate columns
+        columns = dict(self.columns)
+        for key, column in self.specifiers.items():
+            columns[f'specifiers.{key}' if key in columns else key] = column
+        return columns
+
+    def to_pandas(self):
+        import numpy as np
+        import pandas as pd
+
+        data = {}
+        for key, column in self.get_flat_columns().items():
+            if isinstance(column, IntColumn):
+                data[key] = np.frombuffer(column.values, dtype=np.int64)
+            elif isinstance(column, DictColumn):
+                codes, categories = self.get_dictionary(column, np)
+                data[key] = pd.Categorical.from_codes(codes, categories=categories)
+            else:
+                data[key] = column.values
+        return pd.DataFrame(data, copy=False)
+
+    def to_arrow(self):
+        import numpy as np
+        import pyarrow as pa
+
+        data = {}
+        for key, column in self.get_flat_columns().items():
+            if isinstance(column, IntColumn):
+                data[key] = pa.array(np.frombuffer(column.values, dtype=np.int64))
+            elif isinstance(column, DictColumn):
+                codes, categories = self.get_dictionary(column, np)
+                data[key] = pa.DictionaryArray.from_arrays(pa.array(codes, mask=codes < 0), pa.array(categories))
+            else:
+                data[key] = pa.array(column.values)
+        return pa.table(data)
+
+    def get_dictionary(self, column, np):
+        # None is not a valid category, its code is replaced by -1
+        codes = np.frombuffer(column.codes, dtype=np.int32)
+        if None not in column.values:
+            return codes, column.values
+
+        none_code = column.values.index(None)
+        categories = [value for value in column.values if value is not None]
+        codes = np.where(codes == none_code, -1, np.where(codes > none_code, codes - 1, codes)).astype(np.int32)
+        return codes, categories
+
+
+class Row(Mapping):
+    # a read-only view on one result of a ResultSet
+
+    def __init__(self, resultset, index):
+        self.resultset = resultset
+        self.index = index
+
+    def __getitem__(self, key):
+        try:
+            return self.resultset.get_value(self.index, key)
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        return iter(self.resultset.keys())
+
+    def __len__(self):
+        return len(self.resultset.keys())
+
+    def __repr__(self):
+        return repr(dict(self))
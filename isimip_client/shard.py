@@ -0,0 +1,308 @@
+import hashlib
+import heapq
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def parse_shard(shard):
+    # "i/N" (or a tuple), with 0 <= i < N, e.g. --shard $SLURM_ARRAY_TASK_ID/64 for --array=0-63
+    try:
+        index, count = (int(value) for value in (shard.split('/') if isinstance(shard, str) else shard))
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid shard "{shard}", "i/N" is needed.') from None
+    if not 0 <= index < count:
+        raise ValueError(f'Invalid shard "{shard}", 0 <= i < N is needed.')
+    return index, count
+
+
+def get_key(item):
+    # files are identified by their id (or path), specs by their "id" or their content
+    for key in ['id', 'path']:
+        if isinstance(item, dict) and item.get(key) is not None:
+            return str(item[key])
+    return hashlib.sha1(json.dumps(item, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def get_size(item):
+    # the size of files is taken from the Data API, specs count the number of their paths
+    if isinstance(item, dict):
+        if item.get('size') is not None:
+            return item['size']
+        if isinstance(item.get('paths'), list):
+            return len(item['paths'])
+    return 1
+
+
+def assign_shards(items, count, key=get_key, size=get_size):
+    # the largest items are assigned first, each to the shard with the smallest total size, ties
+    # are broken by the key and the index of the shard, so that every node computes the same
+    # assignment, regardless of the order in which the items were listed
+    items = {key(item): item for item in items}
+    order = sorted(items, key=lambda item_key: (-size(items[item_key]), item_key))
+
+    shards = [[] for _ in range(count)]
+    heap = [(0, index) for index in range(count)]
+    for item_key in order:
+        total, index = heapq.heappop(heap)
+        shards[index].append(items[item_key])
+        heapq.heappush(heap, (total + size(items[item_key]), index))
+
+    return shards
+
+
+class ShardQueue:
+    # distributes items (e.g. files or job specs) over several workers, which share a state
+    # directory on a shared file system:
+    #
+    #   items.json     the assignment of the items to the shards
+    #   claims/        one file per claim, created atomically with O_EXCL
+    #   done/          one file per processed item, with the result
+    #
+    # every worker first processes the items of its own shard and then steals the remaining items
+    # of the other shards (from the end), the claims are renewed while an item is processed and
+    # the items of a crashed worker are claimed again, once the lease of its claim has expired
+
+    ok_status = ['finished', 'skipped']
+
+    def __init__(self, path, shard, lease=600, wait=True, poll=10):
+        self.path = Path(path).expanduser()
+        self.index, self.count = parse_shard(shard)
+        self.lease = lease
+        self.wait = wait
+        self.poll = poll
+
+        self.worker = f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.claims_path = self.path / 'claims'
+        self.done_path = self.path / 'done'
+        self.claims_path.mkdir(exist_ok=True, parents=True)
+        self.done_path.mkdir(exist_ok=True, parents=True)
+
+        self.held = set()
+        self.lock = threading.Lock()
+
+    def run(self, items, work, batch_size=1, callback=None):
+        # work is called with a list of claimed items and returns a list of results (dicts with a status),
+        # the callback is called with every completed entry, the results of this worker are returned
+        shards = assign_shards(items, self.count)
+        self.write_items(shards)
+
+        own = shards[self.index]
+        others = [item for offset in range(1, self.count)
+                  for item in reversed(shards[(self.index + offset) % self.count])]
+        logger.info('shard %s/%s worker=%s items=%s size=%s', self.index, self.count, self.worker, len(own),
+                    sum(get_size(item) for item in own))
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self.renew_claims, args=(stop, ), daemon=True)
+        heartbeat.start()
+
+        entries = []
+        try:
+            # the items of the other shards are only added, once no item of the own shard can be claimed
+            pending, stealing = own, others
+            while pending or stealing:
+                claimed, remaining = [], []
+                for position, item in enumerate(pending):
+                    if len(claimed) == batch_size:
+                        remaining.extend(pending[position:])
+                        break
+
+                    state = self.claim(get_key(item))
+                    if state == 'claimed':
+                        claimed.append(item)
+                    elif state == 'busy':
+                        remaining.append(item)
+
+                if claimed:
+                    for entry in self.process(claimed, work, own):
+                        entries.append(entry)
+                        if callback:
+                            callback(entry)
+                elif stealing is not None:
+                    remaining = stealing + remaining
+                    stealing = None
+                elif remaining and self.wait:
+                    # the remaining items are processed by other workers, their claims are checked
+                    # again, until they are done or their lease has expired
+                    time.sleep(self.poll)
+                elif remaining:
+                    break
+
+                pending = remaining
+        finally:
+            stop.set()
+            heartbeat.join()
+
+        return entries
+
+    def process(self, items, work, own):
+        keys = [get_key(item) for item in items]
+        with self.lock:
+            self.held.update(keys)
+
+        try:
+            results = work(items)
+        except Exception as e:
+            logger.error('shard %s/%s failed (%s)', self.index, self.count, e)
+            results = [{'status': 'failed', 'error': str(e)} for _ in items]
+
+        if len(results) != len(items):
+            # the items without a result are recorded as failed, so that they can be reset
+            logger.error('shard %s/%s got %s results for %s items', self.index, self.count, len(results), len(items))
+            results = list(results[:len(items)]) + [{'status': 'failed', 'error': 'no result'}
+                                                    for _ in items[len(results):]]
+
+        own_keys = {get_key(item) for item in own}
+        entries = []
+        for key, item, result in zip(keys, items, results):
+            entry = {
+                'key': key,
+                'shard': self.index,
+                'worker': self.worker,
+                'stolen': key not in own_keys,
+                'size': get_size(item),
+                'result': result
+            }
+            self.write_json(self.done_path / self.get_name(key), entry)
+            entries.append(entry)
+
+        with self.lock:
+            self.held.difference_update(keys)
+
+        return entries
+
+    def get_name(self, key):
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def claim(self, key):
+        # returns "claimed", "busy" (claimed by another worker) or "done",
+        # the claims of an item are numbered, a claim with an expired lease is taken over
+        # by creating the next number, which only one worker can do
+        name = self.get_name(key)
+        if (self.done_path / name).exists():
+            return 'done'
+
+        generation = 0
+        while True:
+            claim_path = self.claims_path / f'{name}.{generation}'
+            try:
+                fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                next_path = self.claims_path / f'{name}.{generation + 1}'
+                if next_path.exists() or self.is_expired(claim_path):
+                    generation += 1
+                    continue
+                return 'busy'
+
+            with os.fdopen(fd, 'w') as fp:
+                json.dump({'key': key, 'worker': self.worker, 'shard': self.index}, fp)
+            if generation:
+                logger.info('item %s claimed again by worker=%s', key, self.worker)
+
+            # the item could have been completed between the first check and the claim
+            return 'done' if (self.done_path / name).exists() else 'claimed'
+
+    def is_expired(self, claim_path):
+        try:
+            return claim_path.stat().st_mtime + self.lease < time.time()
+        except FileNotFoundError:
+            return False
+
+    def renew_claims(self, stop):
+        # the modification time of the latest claim of the held items is updated, unless the claim
+        # was taken over by another worker (e.g. since this worker was suspended longer than the lease)
+        while not stop.wait(self.lease / 4):
+            with self.lock:
+                keys = list(self.held)
+            for key in keys:
+                claim_paths = sorted(self.claims_path.glob(f'{self.get_name(key)}.*'),
+                                     key=lambda path: int(path.suffix[1:]))
+                if not claim_paths:
+                    continue
+
+                try:
+                    worker = json.loads(claim_paths[-1].read_text())['worker']
+                except (FileNotFoundError, ValueError):
+                    # the claim is just being written
+                    continue
+
+                if worker == self.worker:
+                    os.utime(claim_paths[-1])
+                else:
+                    logger.warning('item %s was claimed by worker=%s', key, worker)
+
+    def write_items(self, shards):
+        # all workers need to compute the same assignment, so the listing needs to be the same
+        items = {get_key(item): index for index, shard in enumerate(shards) for item in shard}
+        items_path = self.path / 'items.json'
+        if items_path.exists():
+            existing = json.loads(items_path.read_text())
+            if existing != items:
+                raise RuntimeError(f'The items differ from the items in {items_path}.')
+        else:
+            self.write_json(items_path, items)
+
+    def write_json(self, path, data):
+        tmp_path = path.with_name(f'{path.name}.{self.worker}.tmp')
+        tmp_path.write_text(json.dumps(data))
+        tmp_path.replace(path)
+
+    def report(self):
+        return get_report(self.path)
+
+    def reset_failed(self):
+        return reset_failed(self.path)
+
+
+def get_report(path):
+    # merges the results of all workers
+    path = Path(path).expanduser()
+    items_path = path / 'items.json'
+    items = json.loads(items_path.read_text()) if items_path.exists() else {}
+
+    entries = [json.loads(done_path.read_text()) for done_path in sorted((path / 'done').glob('*'))
+               if not done_path.name.endswith('.tmp')]
+    done = {entry['key'] for entry in entries}
+
+    status, workers = {}, {}
+    for entry in entries:
+        entry_status = entry['result'].get('status') or 'unknown'
+        status[entry_status] = status.get(entry_status, 0) + 1
+
+        worker = workers.setdefault(entry['worker'], {'shard': entry['shard'], 'items': 0, 'size': 0, 'stolen': 0})
+        worker['items'] += 1
+        worker['size'] += entry['size'] or 0
+        worker['stolen'] += entry['stolen']
+
+    return {
+        'items': len(items),
+        'done': len(done),
+        'pending': sorted(key for key in items if key not in done),
+        'status': status,
+        'failed': [entry for entry in entries if entry['result'].get('status') not in ShardQueue.ok_status],
+        'workers': workers
+    }
+
+
+def reset_failed(path):
+    # removes the results and the claims of the failed items, so that they are processed again
+    path = Path(path).expanduser()
+    count = 0
+    for done_path in (path / 'done').glob('*'):
+        if done_path.name.endswith('.tmp'):
+            continue
+        entry = json.loads(done_path.read_text())
+        if entry['result'].get('status') not in ShardQueue.ok_status:
+            for claim_path in (path / 'claims').glob(f'{done_path.name}.*'):
+                claim_path.unlink()
+            done_path.unlink()
+            count += 1
+    return count
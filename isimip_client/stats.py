@@ -0,0 +1,86 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class Stats:
+    # a hook, which collects the events emitted by the client and summarizes them, so that it can be
+    # seen if the time is spent in the Data API, waiting for the Files API or transferring files
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.perf_counter()
+        self.hosts = {}
+        self.pages = {'pages': 0, 'results': 0, 'time': 0}
+        self.cache = {'hit': 0, 'miss': 0, 'revalidated': 0}
+        self.jobs = {'submitted': 0, 'finished': 0, 'failed': 0, 'queue_time': 0, 'run_time': 0}
+        self.downloads = {'bytes': 0, 'chunks': 0, 'first': None, 'last': None}
+
+    def __call__(self, event, data):
+        handler = getattr(self, f'on_{event}', None)
+        if handler:
+            with self.lock:
+                handler(data)
+
+    def on_request(self, data):
+        host = self.hosts.setdefault(urlparse(data['url']).netloc, {
+            'requests': 0, 'errors': 0, 'retries': 0, 'time': 0, 'bytes': 0
+        })
+        host['requests'] += 1
+        host['retries'] += data['retries']
+        host['time'] += data['time']
+        host['bytes'] += data['bytes']
+        if data['error'] or data['status'] >= 400:
+            host['errors'] += 1
+
+    def on_page(self, data):
+        self.pages['pages'] += 1
+        self.pages['results'] += data['results']
+        self.pages['time'] += data['time']
+
+    def on_cache(self, data):
+        self.cache[data['status']] += 1
+
+    def on_job(self, data):
+        if data['previous'] is None:
+            self.jobs['submitted'] += 1
+        if data['status'] in ('finished', 'failed'):
+            self.jobs[data['status']] += 1
+        if data['queue_time'] is not None:
+            self.jobs['queue_time'] += data['queue_time']
+        if data['run_time'] is not None:
+            self.jobs['run_time'] += data['run_time']
+
+    def on_download(self, data):
+        now = time.perf_counter()
+        self.downloads['bytes'] += data['bytes']
+        self.downloads['chunks'] += 1
+        self.downloads['first'] = self.downloads['first'] or now
+        self.downloads['last'] = now
+
+    def summary(self):
+        with self.lock:
+            downloads = {key: self.downloads[key] for key in ['bytes', 'chunks']}
+            if self.downloads['first'] is not None:
+                downloads['time'] = self.downloads['last'] - self.downloads['first']
+                downloads['mb_per_second'] = downloads['bytes'] / 1024**2 / downloads['time'] \
+                    if downloads['time'] else None
+
+            summary = {
+                'time': time.perf_counter() - self.start_time,
+                'hosts': {host: dict(values) for host, values in self.hosts.items()},
+                'pages': dict(self.pages),
+                'cache': dict(self.cache),
+                'jobs': dict(self.jobs),
+                'downloads': downloads
+            }
+
+        return self.round(summary)
+
+    def round(self, value):
+        if isinstance(value, dict):
+            return {key: self.round(item) for key, item in value.items()}
+        elif isinstance(value, float):
+            return round(value, 3)
+        else:
+            return value
@@ -0,0 +1,152 @@
+import logging
+import sqlite3
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class SyncState:
+    # the state database stores version, size, checksum and mtime of every synced file,
+    # so that unchanged files can be detected without hashing them
+
+    def __init__(self, path):
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                version TEXT,
+                size INTEGER,
+                checksum TEXT,
+                mtime INTEGER
+            )
+        ''')
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def get_all(self, prefix=''):
+        rows = self.connection.execute(
+            'SELECT path, version, size, checksum, mtime FROM files WHERE path LIKE ? ESCAPE ?',
+            (prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%', '\\')
+        ).fetchall()
+        return {row[0]: dict(zip(['path', 'version', 'size', 'checksum', 'mtime'], row)) for row in rows}
+
+    def set(self, file, file_path):
+        self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)', (
+            file['path'], file['version'], file['size'], file['checksum'], file_path.stat().st_mtime_ns
+        ))
+
+    def remove(self, path):
+        self.connection.execute('DELETE FROM files WHERE path = ?', (path, ))
+
+    def commit(self):
+        self.connection.commit()
+
+
+class SyncManager:
+
+    state_name = '.isimip-sync.sqlite'
+
+    def __init__(self, client, path, dest, workers=4, prune=False, dry_run=False, callback=None):
+        self.client = client
+        self.path = path
+        self.dest = Path(dest).expanduser()
+        self.workers = workers
+        self.prune = prune
+        self.dry_run = dry_run
+        self.callback = callback
+
+    def run(self):
+        start_time = time.time()
+        state = SyncState(self.dest / self.state_name)
+        local = state.get_all(self.path)
+
+        summary = {
+            'remote': 0,
+            'unchanged': 0,
+            'verified': 0,
+            'downloaded': 0,
+            'failed': 0,
+            'pruned': 0,
+            'size': 0
+        }
+
+        remote, changed = {}, {}
+        for file in self.client.iter_files(path=self.path):
+            remote[file['path']] = file
+            if self.is_unchanged(file, local.get(file['path'])):
+                summary['unchanged'] += 1
+            else:
+                changed[file['file_url']] = file
+                summary['size'] += file['size']
+
+        summary['remote'] = len(remote)
+        logger.info('sync path=%s remote=%s changed=%s', self.path, len(remote), len(changed))
+
+        if not self.dry_run:
+            for file in changed.values():
+                # remove outdated files, since partial downloads would otherwise be resumed
+                file_path = self.get_file_path(file)
+                if file['path'] in local and file_path.exists():
+                    file_path.unlink()
+
+            results = self.client.download_many(
+                list(changed),
+                path={url: self.get_file_path(file).parent for url, file in changed.items()},
+                workers=self.workers,
+                callback=self.callback,
+                checksums={url: file['checksum'] for url, file in changed.items()}
+            )
+
+            for result in results:
+                file = changed[result['url']]
+                if result['status'] == 'finished':
+                    state.set(file, self.get_file_path(file))
+                    summary['downloaded'] += 1
+                elif result['status'] == 'skipped':
+                    # the local file was already complete and its checksum matched
+                    state.set(file, self.get_file_path(file))
+                    summary['verified'] += 1
+                else:
+                    summary['failed'] += 1
+            state.commit()
+
+        if self.prune:
+            for path in set(local) - set(remote):
+                logger.info('sync prune path=%s', path)
+                if not self.dry_run:
+                    file_path = self.dest / path
+                    if file_path.exists():
+                        file_path.unlink()
+                    state.remove(path)
+                summary['pruned'] += 1
+            state.commit()
+
+        state.close()
+
+        summary['time'] = round(time.time() - start_time, 3)
+        return summary
+
+    def get_file_path(self, file):
+        return self.dest / file['path']
+
+    def is_unchanged(self, file, row):
+        if row is None:
+            return False
+
+        try:
+            stat = self.get_file_path(file).stat()
+        except FileNotFoundError:
+            return False
+
+        return (
+            row['version'] == file['version'] and
+            row['checksum'] == file['checksum'] and
+            row['size'] == file['size'] == stat.st_size and
+            row['mtime'] == stat.st_mtime_ns
+        )
@@ -0,0 +1,154 @@
+import fnmatch
+import logging
+import struct
+import zlib
+from pathlib import Path, PurePosixPath
+
+logger = logging.getLogger(__name__)
+
+LOCAL_HEADER = b'PK\x03\x04'
+CENTRAL_HEADER = b'PK\x01\x02'
+END_HEADERS = (b'PK\x05\x06', b'PK\x06\x06')
+DATA_DESCRIPTOR = b'PK\x07\x08'
+
+
+class StreamingUnzipper:
+    # the unzipper parses the local file headers of a zip archive while it is downloaded,
+    # so that the members can be extracted before the central directory at the end has arrived
+
+    def __init__(self, path, members=None):
+        self.path = Path(path)
+        self.members = members
+        self.buffer = b''
+        self.member = None
+        self.done = False
+        self.extracted = []
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        while not self.done:
+            if self.member is None:
+                if not self.read_header():
+                    break
+            elif not self.read_data():
+                break
+
+    def close(self):
+        if self.member is not None or not self.done:
+            raise RuntimeError('Zip archive is incomplete')
+
+    def read_header(self):
+        if len(self.buffer) < 4:
+            return False
+
+        signature = self.buffer[:4]
+        if signature == CENTRAL_HEADER or signature in END_HEADERS:
+            # the central directory follows the last member, an empty archive only has its end record
+            self.done = True
+            self.buffer = b''
+            return False
+        elif signature != LOCAL_HEADER:
+            raise RuntimeError('Invalid zip archive')
+
+        if len(self.buffer) < 30:
+            return False
+
+        flags, method, _, _, crc, compressed_size, size, name_length, extra_length = \
+            struct.unpack('<xxxxxxHHHHIIIHH', self.buffer[:30])
+        header_length = 30 + name_length + extra_length
+        if len(self.buffer) < header_length:
+            return False
+
+        name = self.buffer[30:30 + name_length].decode('utf-8' if flags & 0x800 else 'cp437')
+        extra = self.buffer[30 + name_length:header_length]
+        self.buffer = self.buffer[header_length:]
+
+        zip64 = self.read_zip64_extra(extra)
+        if zip64 and (compressed_size == 0xFFFFFFFF or size == 0xFFFFFFFF):
+            size, compressed_size = zip64
+
+        descriptor = bool(flags & 0x08)
+        if flags & 0x01:
+            raise RuntimeError(f'Cannot extract encrypted member {name}')
+        if method not in (0, 8):
+            raise RuntimeError(f'Unsupported compression method {method} for {name}')
+        if descriptor and method == 0:
+            raise RuntimeError(f'Cannot stream stored member {name} without size')
+
+        self.member = {
+            'name': name,
+            'method': method,
+            'crc': crc,
+            'descriptor': descriptor,
+            'zip64': bool(zip64),
+            'remaining': None if descriptor else compressed_size,
+            'decompressor': zlib.decompressobj(-15) if method == 8 else None,
+            'checksum': 0,
+            'fp': self.open_member(name)
+        }
+        return True
+
+    def read_zip64_extra(self, extra):
+        while len(extra) >= 4:
+            header_id, data_length = struct.unpack('<HH', extra[:4])
+            if header_id == 0x0001:
+                return struct.unpack('<QQ', extra[4:20])
+            extra = extra[4 + data_length:]
+
+    def read_data(self):
+        member = self.member
+
+        if member['remaining'] is not None:
+            data = self.buffer[:member['remaining']]
+            self.buffer = self.buffer[len(data):]
+            member['remaining'] -= len(data)
+            self.write(member['decompressor'].decompress(data) if member['decompressor'] else data)
+            if member['remaining'] > 0:
+                return False
+            if member['decompressor']:
+                self.write(member['decompressor'].flush())
+        else:
+            # without sizes in the header, the end of the member is given by the end of the deflate stream
+            decompressor = member['decompressor']
+            if not decompressor.eof:
+                self.write(decompressor.decompress(self.buffer))
+                self.buffer = decompressor.unused_data
+                if not decompressor.eof:
+                    return False
+
+            descriptor_length = 4 + (20 if member['zip64'] else 12)
+            if len(self.buffer) < descriptor_length:
+                return False
+            offset = 4 if self.buffer[:4] == DATA_DESCRIPTOR else 0
+            member['crc'], = struct.unpack('<I', self.buffer[offset:offset + 4])
+            self.buffer = self.buffer[offset + descriptor_length - 4:]
+
+        self.close_member()
+        return True
+
+    def open_member(self, name):
+        # sanitize the name like zipfile.extract does
+        parts = [part for part in PurePosixPath(name.replace('\\', '/')).parts if part not in ('', '.', '..', '/')]
+        if not parts or name.endswith('/'):
+            return None
+        if self.members and not any(fnmatch.fnmatch(name, pattern) for pattern in self.members):
+            return None
+
+        file_path = self.path.joinpath(*parts)
+        file_path.parent.mkdir(exist_ok=True, parents=True)
+        return open(file_path, 'wb')
+
+    def write(self, data):
+        if data:
+            self.member['checksum'] = zlib.crc32(data, self.member['checksum'])
+            if self.member['fp']:
+                self.member['fp'].write(data)
+
+    def close_member(self):
+        member, self.member = self.member, None
+        if member['fp']:
+            member['fp'].close()
+            if member['checksum'] != member['crc']:
+                raise RuntimeError(f'Bad CRC-32 for {member["name"]}')
+            logger.info('extracted %s', member['name'])
+            self.extracted.append(member['fp'].name)
@@ -0,0 +1,128 @@
+import hashlib
+import io
+import os
+import threading
+import uuid
+from pathlib import Path
+
+content_hashes = {}
+content_hashes_lock = threading.Lock()
+
+
+def get_content_hash(file_path):
+    # the hashes are memoized by path, size and mtime, so that the same mask or shape file
+    # is only read once, even if it is used for many (chunked or repeated) jobs
+    file_path = Path(file_path).expanduser().resolve()
+    stat = file_path.stat()
+    key = (str(file_path), stat.st_size, stat.st_mtime_ns)
+
+    with content_hashes_lock:
+        if key in content_hashes:
+            return content_hashes[key]
+
+    m = hashlib.sha256()
+    with open(file_path, 'rb') as fp:
+        for block in iter(lambda: fp.read(1024 * 1024), b''):
+            m.update(block)
+
+    with content_hashes_lock:
+        content_hashes[key] = m.hexdigest()
+    return content_hashes[key]
+
+
+class MultipartStream(io.RawIOBase):
+    # a multipart/form-data body, which is read from the uploaded files in blocks while it is sent,
+    # instead of building the whole body in memory, the parts are encoded like requests does it
+
+    def __init__(self, fields, files):
+        self.boundary = uuid.uuid4().hex
+        self.parts = []
+        for name, value in fields.items():
+            self.parts.append((self.get_header(name), value.encode() if isinstance(value, str) else value))
+        for name, file_path in files.items():
+            self.parts.append((self.get_header(name), Path(file_path)))
+        self.parts.append((f'--{self.boundary}--\r\n'.encode(), None))
+
+        self.length = sum(len(header) + self.get_body_length(body) for header, body in self.parts)
+        self.seek(0)
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def get_header(self, name):
+        return (f'--{self.boundary}\r\n'
+                f'Content-Disposition: form-data; name="{name}"; filename="{name}"\r\n\r\n').encode()
+
+    def get_body_length(self, body):
+        if body is None:
+            return 0
+        elif isinstance(body, Path):
+            return os.path.getsize(body) + 2
+        else:
+            return len(body) + 2
+
+    def __len__(self):
+        return self.length
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        # only rewinding is supported, which is needed when a request is retried
+        if offset != 0 or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation('MultipartStream can only be rewound')
+        self.close_file()
+        self.position = 0
+        self.blocks = self.iter_blocks()
+        self.block, self.offset = b'', 0
+        return 0
+
+    def tell(self):
+        return self.position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.length
+
+        # only the returned bytes are copied, the rest of the current block is kept with an offset
+        chunks, length = [], 0
+        while length < size:
+            if self.offset >= len(self.block):
+                try:
+                    self.block, self.offset = next(self.blocks), 0
+                except StopIteration:
+                    break
+                continue
+
+            chunk = self.block[self.offset:self.offset + size - length]
+            self.offset += len(chunk)
+            chunks.append(chunk)
+            length += len(chunk)
+
+        data = b''.join(chunks)
+        self.position += len(data)
+        return data
+
+    def iter_blocks(self, block_size=1024 * 1024):
+        for header, body in self.parts:
+            yield header
+            if isinstance(body, Path):
+                with open(body, 'rb') as self.file:
+                    yield from iter(lambda: self.file.read(block_size), b'')
+                self.file = None
+                yield b'\r\n'
+            elif body is not None:
+                yield body + b'\r\n'
+
+    def close_file(self):
+        if getattr(self, 'file', None) is not None:
+            self.file.close()
+            self.file = None
+
+    def close(self):
+        self.close_file()
+        super().close()
@@ -1,8 +1,4 @@
 import click
-from rich.console import Console
-from rich.pretty import pretty_repr
-from rich.table import Table
-from rich.text import Text
 
 
 class SearchArgumentType(click.ParamType):
@@ -16,14 +12,36 @@ class SearchArgumentType(click.ParamType):
             self.fail(f'{param} needs to be of the form key=value')
 
 
+def read_ids(ids):
+    # '-' reads whitespace separated ids from stdin
+    if '-' in ids:
+        stdin = click.get_text_stream('stdin').read().split()
+        return [pk for value in ids for pk in (stdin if value == '-' else [value])]
+    return list(ids)
+
+
 def print_results_table(results):
+    # rich is only imported when something is printed, to keep the startup of the cli fast
+    from rich.console import Console
+    from rich.table import Table
+    from rich.text import Text
+
+    from .resultset import ResultSet
+
     table = Table()
     table.add_column('id', style='green')
     table.add_column('path', style='cyan')
     table.add_column('version')
 
-    for result in results:
-        row = [result[key] for key in ['id', 'path', 'version']]
+    if isinstance(results, ResultSet):
+        # read the columns directly, instead of creating a view for every row
+        rows = zip(*[results.column(key) for key in ['id', 'path', 'version']])
+    else:
+        # results, which could not be retrieved, show their error instead of the path
+        rows = ([result['id'], Text(result['error'], style='red'), ''] if 'error' in result else
+                [result[key] for key in ['id', 'path', 'version']] for result in results)
+
+    for row in rows:
         table.add_row(*row)
 
     console = Console()
@@ -31,6 +49,11 @@ def print_results_table(results):
 
 
 def print_details_table(details):
+    from rich.console import Console
+    from rich.pretty import pretty_repr
+    from rich.table import Table
+    from rich.text import Text
+
     table = Table()
     table.add_column('key')
     table.add_column('value')